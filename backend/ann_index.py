@@ -0,0 +1,221 @@
+"""Optional approximate-nearest-neighbour backend (FAISS) for local indices.
+
+Chosen per index at build time with ANN_BACKEND:
+
+- "flat": exact inner-product index (FAISS BLAS kernels, no approximation);
+- "ivf":  inverted file over k-means cells, searched with nprobe cells;
+- "hnsw": hierarchical navigable small-world graph, searched with efSearch.
+
+The index is persisted as ann.faiss next to emb.npy and loaded lazily (memory
+mapped where FAISS supports it) at query time. At build time the search-time
+knob (nprobe / efSearch) is calibrated on a sample of the index's own vectors
+so that recall@k against exact search meets ANN_RECALL_TARGET; the chosen
+value and the measured recall are recorded in meta.json["ann"].
+
+faiss-cpu is optional: without it (or for indices built without ANN) retrieval
+falls back to the exact streaming scan.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+import os
+import threading
+
+import numpy as np
+
+from .scoring import top_n_dot_many
+
+try:
+    import faiss  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    faiss = None  # type: ignore
+
+ANN_TYPES = ("flat", "ivf", "hnsw")
+ANN_FILE = "ann.faiss"
+
+_NPROBE_STEPS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+_EF_STEPS = (16, 32, 48, 64, 96, 128, 192, 256, 384, 512, 1024)
+
+
+def ann_available() -> bool:
+    return faiss is not None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+def _f32(block: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(block, dtype=np.float32)
+
+
+def _exact_top_k(mat: np.ndarray, queries: np.ndarray, k: int, block: int = 8192) -> np.ndarray:
+    """Exact top-k row ids per query, streaming over mat in blocks."""
+    return np.stack([rows for rows, _s in top_n_dot_many(mat, queries, k, block)])
+
+
+def _set_search_param(index: Any, kind: str, value: int) -> None:
+    if kind == "ivf":
+        faiss.extract_index_ivf(index).nprobe = int(value)
+    elif kind == "hnsw":
+        index.hnsw.efSearch = int(value)
+
+
+def _calibrate(index: Any, kind: str, mat: np.ndarray, target: float) -> Tuple[Optional[int], float]:
+    """Smallest nprobe/efSearch whose recall@k on sampled rows meets target; returns (value, recall)."""
+    n = int(mat.shape[0])
+    k = min(_env_int("ANN_CALIBRATION_K", 10), n)
+    if kind == "flat" or n == 0 or k == 0:
+        return None, 1.0
+    rng = np.random.default_rng(0)
+    sample = np.sort(rng.choice(n, size=min(n, _env_int("ANN_CALIBRATION_QUERIES", 64)), replace=False))
+    queries = _f32(mat[sample])
+    truth = _exact_top_k(mat, queries, k)
+    if kind == "ivf":
+        steps = [p for p in _NPROBE_STEPS if p < faiss.extract_index_ivf(index).nlist] + [faiss.extract_index_ivf(index).nlist]
+    else:
+        steps = list(_EF_STEPS)
+    recall = 0.0
+    for value in steps:
+        _set_search_param(index, kind, max(value, k) if kind == "hnsw" else value)
+        _d, found = index.search(queries, k)
+        hits = sum(len(set(f.tolist()) & set(t.tolist())) for f, t in zip(found, truth))
+        recall = hits / float(truth.size)
+        if recall >= target:
+            return (max(value, k) if kind == "hnsw" else value), recall
+    return (max(steps[-1], k) if kind == "hnsw" else steps[-1]), recall
+
+
+def _new_index(kind: str, dim: int, n_rows: int) -> Any:
+    if kind == "flat":
+        return faiss.IndexFlatIP(dim)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, _env_int("ANN_HNSW_M", 32), faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = _env_int("ANN_HNSW_EF_CONSTRUCTION", 80)
+        return index
+    nlist = _env_int("ANN_IVF_NLIST", 0) or int(4 * np.sqrt(max(1, n_rows)))
+    # k-means needs a few dozen points per cell to train sensibly
+    nlist = max(1, min(nlist, n_rows // 39 or 1))
+    return faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+
+
+def build_ann(
+    src: np.ndarray,
+    idx_dir: Union[str, Path],
+    kind: str,
+    ann_meta: Optional[Dict[str, Any]] = None,
+    append: bool = False,
+    full: Optional[np.ndarray] = None,
+    block: int = 8192,
+) -> Dict[str, Any]:
+    """Build (or extend) the index's ANN file from src rows; returns the meta.json["ann"] entry.
+
+    With append=True the new rows are added to the existing ann.faiss (IVF cells
+    are not retrained). full, when given, is the complete embedding matrix of
+    the index and is used to (re)calibrate the search knob; otherwise the
+    previously calibrated value is kept.
+    """
+    if faiss is None:
+        raise RuntimeError("faiss-cpu is not installed")
+    if kind not in ANN_TYPES:
+        raise ValueError(f"unknown ANN backend: {kind!r} (expected one of {ANN_TYPES})")
+    idx_dir = Path(idx_dir)
+    path = idx_dir / ANN_FILE
+    dim = int(src.shape[1])
+    if append:
+        # row ids must stay aligned with emb.npy / chunks, so never restart a partial index
+        index = faiss.read_index(str(path))
+    else:
+        index = _new_index(kind, dim, int(src.shape[0]))
+        if not index.is_trained:
+            rng = np.random.default_rng(0)
+            n_train = min(int(src.shape[0]), _env_int("ANN_TRAIN_MAX", 50_000))
+            train_rows = np.sort(rng.choice(int(src.shape[0]), size=n_train, replace=False))
+            index.train(_f32(src[train_rows]))
+    for i in range(0, src.shape[0], block):
+        index.add(_f32(src[i:i + block]))
+
+    out: Dict[str, Any] = {"type": kind, "file": ANN_FILE, "dim": dim, "rows": int(index.ntotal)}
+    if kind == "ivf":
+        out["nlist"] = int(faiss.extract_index_ivf(index).nlist)
+    if kind == "hnsw":
+        out["m"] = int(index.hnsw.nb_neighbors(1))
+    mat = full if full is not None and int(full.shape[0]) == int(index.ntotal) else (None if append else src)
+    if mat is not None:
+        target = _env_float("ANN_RECALL_TARGET", 0.95)
+        value, recall = _calibrate(index, kind, mat, target)
+        out["recall_target"] = target
+        out["recall"] = round(float(recall), 4)
+        if value is not None:
+            out["nprobe" if kind == "ivf" else "ef_search"] = int(value)
+    elif ann_meta:
+        for key in ("nprobe", "ef_search", "recall", "recall_target"):
+            if key in ann_meta:
+                out[key] = ann_meta[key]
+    tmp = path.with_name(path.name + ".tmp")
+    faiss.write_index(index, str(tmp))
+    os.replace(tmp, path)
+    return out
+
+
+class AnnIndex:
+    """Lazily loaded FAISS index for one persisted IOMP index."""
+
+    def __init__(self, idx_dir: Union[str, Path], ann_meta: Dict[str, Any]) -> None:
+        if faiss is None:
+            raise RuntimeError("faiss-cpu is not installed")
+        self.kind = ann_meta["type"]
+        self._param_lock = threading.Lock()
+        path = str(Path(idx_dir) / ann_meta.get("file", ANN_FILE))
+        try:
+            self.index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except Exception:
+            self.index = faiss.read_index(path)
+        # explicit env overrides win over the calibrated values
+        if self.kind == "ivf":
+            _set_search_param(self.index, "ivf", _env_int("ANN_IVF_NPROBE", 0) or ann_meta.get("nprobe", 8))
+        elif self.kind == "hnsw":
+            self.ef_search = int(_env_int("ANN_HNSW_EF_SEARCH", 0) or ann_meta.get("ef_search", 64))
+            _set_search_param(self.index, "hnsw", self.ef_search)
+
+    def __len__(self) -> int:
+        return int(self.index.ntotal)
+
+    def search(self, qv: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-n rows by inner product: (rows, scores), best first."""
+        return self.search_many(np.asarray(qv).reshape(1, -1), n)[0]
+
+    def search_many(self, queries: np.ndarray, n: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search() for a batch of query vectors in one FAISS call."""
+        n = min(int(n), len(self))
+        if n <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(len(queries))]
+        ef = getattr(self, "ef_search", 0)
+        if self.kind != "hnsw" or ef >= n:
+            scores, rows = self.index.search(_f32(queries), n)
+        elif hasattr(faiss, "SearchParametersHNSW"):
+            # per-call efSearch >= n: the index keeps its calibrated value for later queries
+            params = faiss.SearchParametersHNSW(efSearch=n)
+            scores, rows = self.index.search(_f32(queries), n, params=params)
+        else:  # older faiss: raise it for this call only, under a lock
+            with self._param_lock:
+                self.index.hnsw.efSearch = n
+                try:
+                    scores, rows = self.index.search(_f32(queries), n)
+                finally:
+                    self.index.hnsw.efSearch = ef
+        out: List[Tuple[np.ndarray, np.ndarray]] = []
+        for r, s in zip(rows, scores):
+            keep = r >= 0  # IVF may return fewer than n hits
+            out.append((r[keep].astype(np.int64), s[keep].astype(np.float32)))
+        return out
@@ -1,9 +1,11 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 import os
 import json
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -35,8 +37,19 @@ except Exception as e1:  # pragma: no cover
         except Exception as e3:
             _init_error = f"import_failed: {e1.__class__.__name__}: {e1}; abs_failed: {e2.__class__.__name__}: {e2}; ctor_failed: {e3.__class__.__name__}: {e3}"
 
+try:
+    from .jobs import JobManager, JobQueueFull  # type: ignore
+except Exception:  # pragma: no cover
+    from backend.jobs import JobManager, JobQueueFull  # type: ignore
+
 app = FastAPI(title="IOMP Core RAG Service", version="0.1.0")
 
+# Background index builds run on their own small pool so uploads cannot starve /ask
+upload_jobs = JobManager(
+    max_workers=int(os.getenv("UPLOAD_JOB_WORKERS", "1")),
+    max_pending=int(os.getenv("UPLOAD_JOB_MAX_PENDING", "16")),
+)
+
 cors_origins_env = os.getenv("CORS_ALLOW_ORIGINS", "*")
 if cors_origins_env.strip() == "*":
     allowed_origins = ["*"]
@@ -64,6 +77,14 @@ def _startup_preload():
             return
         if os.getenv("USE_EMBEDDINGS", "1") in ("0", "false", "False"):
             return
+        # Registry providers (fastembed/ONNX) load their session lazily; warm it here
+        provider = getattr(rag_service, "_embed_provider", None)
+        if provider is not None:
+            try:
+                provider.embed(["warm up"])
+            except Exception:
+                pass
+            return
         # Trigger model construction and a tiny warmup encode
         model = getattr(rag_service, "_get_model", None)
         if callable(model):
@@ -90,6 +111,17 @@ class AskRequest(BaseModel):
     mmr: Optional[bool] = None
     low_memory: Optional[bool] = None
     max_chars: Optional[int] = None
+    # None/"active": the active index; "all": every index of the user; or index name(s)
+    scope: Optional[Union[str, List[str]]] = None
+
+
+class AskBatchRequest(BaseModel):
+    questions: List[str]
+    k: int = 5
+    user_id: str = "default"
+    mmr: Optional[bool] = None
+    low_memory: Optional[bool] = None
+    max_chars: Optional[int] = None
 
 
 def _project_root() -> str:
@@ -115,49 +147,114 @@ def _log_event(event: str, data: dict) -> None:
         pass
 
 
+def _save_uploads(files: List[UploadFile], dest_dir: str) -> List[str]:
+    import shutil
+    names = []
+    for f in files:
+        dest = os.path.join(dest_dir, os.path.basename(f.filename or "upload"))
+        with open(dest, "wb") as out:
+            shutil.copyfileobj(f.file, out)
+        names.append(f.filename)
+    return names
+
+
+def _build_upload(
+    folder: str,
+    names: List[str],
+    user_id: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    index_name: Optional[str],
+    append: bool,
+    progress: Optional[dict] = None,
+) -> dict:
+    progress = progress if progress is not None else {}
+    docs, chunks, index_name = rag_service.build_index_from_folder(
+        folder, chunk_size, chunk_overlap, name_prefix="upload", user_id=user_id,
+        index_name=index_name or None, append=append, progress=progress,
+    )
+    payload = {
+        "status": "built",
+        "documents": docs,
+        "chunks": chunks,
+        "index_name": index_name,
+        "mongo_stats": progress.get("build_stats", getattr(rag_service, "last_build_stats", {})),
+    }
+    # Reflect actual persisted location for IOMP backend
+    try:
+        from pathlib import Path as _P
+        data_dir = os.getenv("DATA_DIR") or os.path.join(_project_root(), "data")
+        idx_dir = _P(data_dir) / "indices" / user_id / index_name
+        payload["index_dir"] = str(idx_dir)
+    except Exception:
+        payload["index_dir"] = None
+    _log_event("upload_build", {"files": names, **payload})
+    return payload
+
+
 @app.post("/upload")
 def upload_files(
     user_id: str = Form("default"),
     chunk_size: int = Form(1000),
     chunk_overlap: int = Form(200),
+    index_name: Optional[str] = Form(None),
+    append: bool = Form(False),
+    background: bool = Form(True),
     files: List[UploadFile] = File(...),
 ):
-    """Accept one or more files, save to a temp folder, and build an index from them."""
+    """Accept one or more files, save to a temp folder, and queue an index build from them.
+
+    Pass index_name with append=true to add the files to an existing index instead
+    of building a new one; files already present in that index are skipped.
+    The build runs as a background job and a job_id is returned immediately; poll
+    GET /jobs/{job_id} for progress and the final result. background=false builds
+    inside the request (small files, scripts); it still waits for any other build
+    of the same index.
+    """
     if rag_service is None:
         raise HTTPException(status_code=500, detail="rag_service not initialized")
     import tempfile, shutil
+    if background:
+        tmpdir = tempfile.mkdtemp(prefix="rag_upload_")
+        try:
+            names = _save_uploads(files, tmpdir)
+
+            def _job(progress: dict) -> dict:
+                try:
+                    return _build_upload(tmpdir, names, user_id, chunk_size, chunk_overlap, index_name, append, progress)
+                finally:
+                    shutil.rmtree(tmpdir, ignore_errors=True)
+
+            job_id = upload_jobs.submit(_job, kind="upload", user_id=user_id, files=names)
+        except JobQueueFull as e:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise HTTPException(status_code=429, detail=str(e))
+        except Exception as e:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise HTTPException(status_code=400, detail=str(e))
+        _log_event("upload_queued", {"files": names, "user_id": user_id, "job_id": job_id})
+        return {"status": "queued", "job_id": job_id}
     try:
         with tempfile.TemporaryDirectory(prefix="rag_upload_") as tmpdir:
-            names = []
-            for f in files:
-                dest = os.path.join(tmpdir, f.filename)
-                with open(dest, "wb") as out:
-                    shutil.copyfileobj(f.file, out)
-                names.append(f.filename)
-            docs, chunks, index_name = rag_service.build_index_from_folder(
-                tmpdir, chunk_size, chunk_overlap, name_prefix="upload", user_id=user_id
-            )
-            payload = {
-                "status": "built",
-                "documents": docs,
-                "chunks": chunks,
-                "index_name": index_name,
-                "mongo_stats": getattr(rag_service, "last_build_stats", {}),
-            }
-            # Reflect actual persisted location for IOMP backend
-            try:
-                from pathlib import Path as _P
-                data_dir = os.getenv("DATA_DIR") or os.path.join(_project_root(), "data")
-                idx_dir = _P(data_dir) / "indices" / user_id / index_name
-                payload["index_dir"] = str(idx_dir)
-            except Exception:
-                payload["index_dir"] = None
-            _log_event("upload_build", {"files": names, **payload})
-            return payload
+            names = _save_uploads(files, tmpdir)
+            return _build_upload(tmpdir, names, user_id, chunk_size, chunk_overlap, index_name, append)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"unknown job: {job_id}")
+    return job
+
+
+@app.get("/jobs")
+def list_jobs(user_id: Optional[str] = None):
+    return {"jobs": upload_jobs.list(user_id)}
+
+
 @app.post("/ask")
 def ask(req: AskRequest):
     if rag_service is None:
@@ -170,7 +267,7 @@ def ask(req: AskRequest):
             os.environ["MMR_ENABLED"] = "1" if req.mmr else "0"
         if req.max_chars is not None and req.max_chars > 0:
             os.environ["ANSWER_MAX_CHARS"] = str(req.max_chars)
-        result = rag_service.answer(req.question, req.k, user_id=req.user_id)
+        result = rag_service.answer(req.question, req.k, user_id=req.user_id, scope=req.scope)
         short = result.copy()
         ans = short.get("answer", "")
         if isinstance(ans, str) and len(ans) > 2000:
@@ -181,6 +278,61 @@ def ask(req: AskRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.post("/ask/stream")
+def ask_stream(req: AskRequest):
+    """/ask as server-sent events: `sources` after retrieval, `token` events as the answer is produced, then `done`."""
+    if rag_service is None:
+        raise HTTPException(status_code=500, detail="rag_service not initialized")
+    if req.low_memory is not None:
+        os.environ["LOW_MEMORY_MODE"] = "1" if req.low_memory else "0"
+    if req.mmr is not None:
+        os.environ["MMR_ENABLED"] = "1" if req.mmr else "0"
+    if req.max_chars is not None and req.max_chars > 0:
+        os.environ["ANSWER_MAX_CHARS"] = str(req.max_chars)
+
+    def events():
+        try:
+            for ev in rag_service.answer_stream(req.question, req.k, user_id=req.user_id, scope=req.scope):
+                yield f"event: {ev['event']}\ndata: {json.dumps(ev['data'], ensure_ascii=False)}\n\n"
+                if ev["event"] == "done":
+                    _log_event("ask_stream", {"question": req.question, "k": req.k, **ev["data"]})
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/ask/batch")
+def ask_batch(req: AskBatchRequest):
+    """Answer many questions for one user's active index in a single retrieval pass."""
+    if rag_service is None:
+        raise HTTPException(status_code=500, detail="rag_service not initialized")
+    try:
+        max_batch = int(os.getenv("ASK_BATCH_MAX", "256"))
+    except Exception:
+        max_batch = 256
+    if len(req.questions) > max_batch:
+        raise HTTPException(status_code=400, detail=f"At most {max_batch} questions per batch")
+    try:
+        if req.low_memory is not None:
+            os.environ["LOW_MEMORY_MODE"] = "1" if req.low_memory else "0"
+        if req.mmr is not None:
+            os.environ["MMR_ENABLED"] = "1" if req.mmr else "0"
+        if req.max_chars is not None and req.max_chars > 0:
+            os.environ["ANSWER_MAX_CHARS"] = str(req.max_chars)
+        t0 = time.time()
+        results = rag_service.answer_many(req.questions, req.k, user_id=req.user_id)
+        elapsed = time.time() - t0
+        _log_event("ask_batch", {"count": len(req.questions), "k": req.k, "user_id": req.user_id, "elapsed_s": round(elapsed, 3)})
+        return {"count": len(results), "elapsed_s": round(elapsed, 3), "results": results}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/config")
 def config():
     try:
@@ -194,6 +346,11 @@ def config():
             # For per-user we no longer have a global active_index_name; expose summary instead
             "active_index_name": getattr(rag_service, "active_index_name", None),
             "multi_tenant": hasattr(rag_service, "_indices_by_user"),
+            "tenant_cache": rag_service.tenant_cache_stats() if hasattr(rag_service, "tenant_cache_stats") else None,
+            "query_cache": rag_service.query_cache_stats() if hasattr(rag_service, "query_cache_stats") else None,
+            "query_batching": rag_service.query_batching_stats() if hasattr(rag_service, "query_batching_stats") else None,
+            "llm": rag_service.llm_stats() if hasattr(rag_service, "llm_stats") else None,
+            "answer_cache": rag_service.answer_cache_stats() if hasattr(rag_service, "answer_cache_stats") else None,
             "low_memory_mode": os.getenv("LOW_MEMORY_MODE", "1"),
             "mmr_enabled": os.getenv("MMR_ENABLED", "0"),
             "answer_max_chars": os.getenv("ANSWER_MAX_CHARS", "1200"),
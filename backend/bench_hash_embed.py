@@ -0,0 +1,86 @@
+"""Throughput benchmark for the hash-embedding fallback.
+
+Compares the original per-token blake2b loop with the batched HashEmbedder and
+checks that both produce the same vectors.
+
+    python -m backend.bench_hash_embed [--texts 2000] [--chars 300] [--batch 256]
+"""
+from __future__ import annotations
+from typing import List
+import argparse
+import hashlib
+import random
+import time
+
+import numpy as np
+
+try:
+    from .hash_embed import HashEmbedder
+except ImportError:  # run as a plain script from backend/
+    from hash_embed import HashEmbedder  # type: ignore
+
+
+def legacy_hash_embed(texts: List[str], dim: int = 384) -> np.ndarray:
+    """Reference copy of the original RAGService._hash_embed loop."""
+    mat = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, t in enumerate(texts):
+        s = t.lower()
+        for tok in s.split():
+            h = int(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).hexdigest(), 16)
+            mat[i, h % dim] += 1.0
+        for j in range(len(s) - 1):
+            bg = s[j:j+2]
+            h = int(hashlib.blake2b(bg.encode("utf-8"), digest_size=8).hexdigest(), 16)
+            mat[i, h % dim] += 0.2
+    norms = np.linalg.norm(mat, axis=1, keepdims=True) + 1e-8
+    return (mat / norms).astype(np.float16)
+
+
+def _corpus(n: int, chars: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    vocab = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 10))) for _ in range(5000)]
+    out = []
+    for _ in range(n):
+        words: List[str] = []
+        while sum(len(w) + 1 for w in words) < chars:
+            words.append(rng.choice(vocab).capitalize() if rng.random() < 0.1 else rng.choice(vocab))
+        out.append(" ".join(words)[:chars])
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--texts", type=int, default=2000)
+    ap.add_argument("--chars", type=int, default=300, help="characters per text (TRUNCATE_CHUNK_CHARS)")
+    ap.add_argument("--batch", type=int, default=256)
+    args = ap.parse_args()
+    texts = _corpus(args.texts, args.chars)
+
+    t0 = time.perf_counter()
+    ref = legacy_hash_embed(texts)
+    legacy_s = time.perf_counter() - t0
+
+    emb = HashEmbedder()
+    t0 = time.perf_counter()
+    cold = np.concatenate([emb.embed(texts[i:i + args.batch]) for i in range(0, len(texts), args.batch)])
+    cold_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(0, len(texts), args.batch):
+        emb.embed(texts[i:i + args.batch])
+    warm_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for q in texts[:500]:
+        emb.embed([q])
+    single_s = time.perf_counter() - t0
+
+    diff = float(np.max(np.abs(ref.astype(np.float32) - cold.astype(np.float32))))
+    print(f"texts={len(texts)} chars/text={args.chars} batch={args.batch}")
+    print(f"legacy loop        : {len(texts) / legacy_s:10.0f} texts/s")
+    print(f"HashEmbedder cold  : {len(texts) / cold_s:10.0f} texts/s")
+    print(f"HashEmbedder warm  : {len(texts) / warm_s:10.0f} texts/s")
+    print(f"single-query warm  : {min(500, len(texts)) / single_s:10.0f} texts/s")
+    print(f"max |legacy - new| : {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
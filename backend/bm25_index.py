@@ -0,0 +1,297 @@
+"""Persistent BM25 inverted index for lexical retrieval.
+
+Built at ingest time next to the other index files:
+
+- bm25.vocab.json: {"docs", "total_len", "terms": [...]}; a term's position is its id;
+- bm25.ptr.npy:    (terms + 1) int64 offsets of each term's postings;
+- bm25.rows.npy:   int32 chunk rows (global row ids), grouped by term, ascending;
+- bm25.tf.npy:     int32 term frequencies aligned with bm25.rows.npy;
+- bm25.doclen.npy: int32 token count per row.
+
+The arrays are memory-mapped at query time, so a query only reads the postings
+of its own terms. While building, (term, row, tf) triples and document lengths
+are spilled to bm25.pending*.npy. On close they are laid out in CSR order with
+a blockwise counting sort straight into memory-mapped output files (appends
+copy the existing postings in the same way), so the build's memory is bounded
+by BM25_MERGE_BLOCK triples plus the vocabulary, not by the corpus size.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+from collections import Counter
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+from .index_store import NpyAppender, read_npy_layout
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+VOCAB_FILE = "bm25.vocab.json"
+PTR_FILE = "bm25.ptr.npy"
+ROWS_FILE = "bm25.rows.npy"
+TF_FILE = "bm25.tf.npy"
+DOCLEN_FILE = "bm25.doclen.npy"
+_PENDING_FILE = "bm25.pending.npy"
+_PENDING_DOCLEN_FILE = "bm25.pending_doclen.npy"
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _save_atomic(path: Path, arr: np.ndarray) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def _load(path: Path) -> np.ndarray:
+    # numpy cannot memory-map zero-length arrays
+    return np.load(path, mmap_mode="r") if read_npy_layout(path)[0][0] else np.load(path)
+
+
+def _merge_block() -> int:
+    try:
+        return max(1024, int(os.getenv("BM25_MERGE_BLOCK", str(1 << 20))))
+    except Exception:
+        return 1 << 20
+
+
+class _NpyOut:
+    """A 1-D .npy written in place through a memory map, then moved over its final name."""
+
+    def __init__(self, path: Path, dtype: Any, n: int) -> None:
+        self.path = path
+        self.tmp = path.with_name(path.name + ".tmp")
+        self.arr = (
+            np.lib.format.open_memmap(self.tmp, mode="w+", dtype=dtype, shape=(n,)) if n else np.zeros(0, dtype=dtype)
+        )
+
+    def commit(self) -> None:
+        if isinstance(self.arr, np.memmap):
+            self.arr.flush()
+            del self.arr
+        else:
+            with open(self.tmp, "wb") as f:
+                np.save(f, self.arr)
+        os.replace(self.tmp, self.path)
+
+
+class BM25Writer:
+    """Accumulate chunk texts by row and write (or merge into) the index on close()."""
+
+    def __init__(self, idx_dir: Union[str, Path], append: bool = False) -> None:
+        self.idx_dir = Path(idx_dir)
+        self.append = append and BM25Index.exists(self.idx_dir)
+        self._terms: List[str] = []
+        self._docs = 0
+        self._total_len = 0
+        if self.append:
+            with open(self.idx_dir / VOCAB_FILE, "r", encoding="utf-8") as f:
+                info = json.load(f)
+            self._terms = list(info.get("terms", []))
+            self._docs = int(info.get("docs", 0))
+            self._total_len = int(info.get("total_len", 0))
+        self._term_ids: Dict[str, int] = {t: i for i, t in enumerate(self._terms)}
+        self._new_docs = 0
+        self._pending = NpyAppender(self.idx_dir / _PENDING_FILE, np.int32, 3)
+        self._pending_doclen = NpyAppender(self.idx_dir / _PENDING_DOCLEN_FILE, np.int32, 1)
+
+    def add(self, first_row: int, texts: Sequence[str]) -> None:
+        """Index texts as consecutive rows starting at first_row (the next unindexed row)."""
+        if first_row != self._docs:
+            raise ValueError(f"BM25 rows must be contiguous: expected row {self._docs}, got {first_row}")
+        triples: List[Tuple[int, int, int]] = []
+        doclen: List[int] = []
+        for offset, text in enumerate(texts):
+            toks = tokenize(text)
+            doclen.append(len(toks))
+            row = first_row + offset
+            for tok, tf in Counter(toks).items():
+                tid = self._term_ids.get(tok)
+                if tid is None:
+                    tid = self._term_ids[tok] = len(self._terms)
+                    self._terms.append(tok)
+                triples.append((tid, row, tf))
+            self._total_len += len(toks)
+        self._docs += len(texts)
+        self._new_docs += len(texts)
+        if doclen:
+            self._pending_doclen.append(np.asarray(doclen, dtype=np.int32).reshape(-1, 1))
+        if triples:
+            self._pending.append(np.asarray(triples, dtype=np.int32))
+
+    def close(self) -> None:
+        if self._pending is None:
+            return
+        self._pending.close()
+        self._pending_doclen.close()
+        pending_path = self.idx_dir / _PENDING_FILE
+        doclen_path = self.idx_dir / _PENDING_DOCLEN_FILE
+        new = new_doclen = None
+        try:
+            new = _load(pending_path)
+            new_doclen = _load(doclen_path).reshape(-1)
+            self._write_csr(new, new_doclen)
+            tmp = self.idx_dir / (VOCAB_FILE + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"docs": self._docs, "total_len": self._total_len, "terms": self._terms}, f, ensure_ascii=False)
+            os.replace(tmp, self.idx_dir / VOCAB_FILE)
+        finally:
+            self._pending = None
+            del new, new_doclen
+            pending_path.unlink(missing_ok=True)
+            doclen_path.unlink(missing_ok=True)
+
+    def _write_csr(self, new: np.ndarray, new_doclen: np.ndarray) -> None:
+        """Counting sort of old + new postings by term into the final files, one block at a time.
+
+        Within a term, old rows come first and new rows keep their insertion order,
+        so postings stay ascending by row.
+        """
+        block = _merge_block()
+        n_terms = len(self._terms)
+        old_ptr = np.load(self.idx_dir / PTR_FILE) if self.append else np.zeros(1, dtype=np.int64)
+        old_counts = np.zeros(n_terms, dtype=np.int64)
+        old_counts[: old_ptr.shape[0] - 1] = np.diff(old_ptr)
+        new_counts = np.zeros(n_terms, dtype=np.int64)
+        for i in range(0, new.shape[0], block):
+            new_counts += np.bincount(np.asarray(new[i:i + block, 0]), minlength=n_terms)
+        ptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(old_counts + new_counts, out=ptr[1:])
+        total = int(ptr[-1])
+        rows_out = _NpyOut(self.idx_dir / ROWS_FILE, np.int32, total)
+        tf_out = _NpyOut(self.idx_dir / TF_FILE, np.int32, total)
+        if self.append and old_ptr[-1]:
+            old_rows = _load(self.idx_dir / ROWS_FILE)
+            old_tf = _load(self.idx_dir / TF_FILE)
+            for i in range(0, int(old_ptr[-1]), block):
+                j = np.arange(i, min(i + block, int(old_ptr[-1])), dtype=np.int64)
+                term = np.searchsorted(old_ptr, j, side="right") - 1
+                dest = ptr[term] + (j - old_ptr[term])
+                rows_out.arr[dest] = old_rows[i:i + j.shape[0]]
+                tf_out.arr[dest] = old_tf[i:i + j.shape[0]]
+            del old_rows, old_tf
+        cursor = ptr[:-1] + old_counts  # next free slot of each term for new postings
+        for i in range(0, new.shape[0], block):
+            part = np.asarray(new[i:i + block])
+            order = np.argsort(part[:, 0], kind="stable")
+            term = part[order, 0].astype(np.int64)
+            starts = np.flatnonzero(np.r_[True, term[1:] != term[:-1]])
+            rank = np.arange(term.shape[0]) - np.repeat(starts, np.diff(np.r_[starts, term.shape[0]]))
+            dest = cursor[term] + rank
+            rows_out.arr[dest] = part[order, 1]
+            tf_out.arr[dest] = part[order, 2]
+            cursor += np.bincount(term, minlength=n_terms)
+        old_docs = self._docs - self._new_docs
+        doclen_out = _NpyOut(self.idx_dir / DOCLEN_FILE, np.int32, self._docs)
+        if old_docs:
+            old_doclen = _load(self.idx_dir / DOCLEN_FILE)
+            for i in range(0, old_docs, block):
+                stop = min(i + block, old_docs)
+                doclen_out.arr[i:stop] = old_doclen[i:stop]
+            del old_doclen
+        for i in range(0, self._new_docs, block):
+            doclen_out.arr[old_docs + i:old_docs + i + block] = new_doclen[i:i + block]
+        # postings before ptr: a reader that sees the new ptr also sees the matching postings
+        rows_out.commit()
+        tf_out.commit()
+        doclen_out.commit()
+        _save_atomic(self.idx_dir / PTR_FILE, ptr)
+
+    def __enter__(self) -> "BM25Writer":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+
+class BM25Index:
+    """Read-only BM25 scorer over the memory-mapped postings of one index."""
+
+    def __init__(self, idx_dir: Union[str, Path]) -> None:
+        idx_dir = Path(idx_dir)
+        with open(idx_dir / VOCAB_FILE, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.docs = int(info.get("docs", 0))
+        self.avg_len = (int(info.get("total_len", 0)) / self.docs) if self.docs else 0.0
+        self._term_ids: Dict[str, int] = {t: i for i, t in enumerate(info.get("terms", []))}
+        self._ptr = np.load(idx_dir / PTR_FILE)
+        self._rows = _load(idx_dir / ROWS_FILE)
+        self._tf = _load(idx_dir / TF_FILE)
+        self._doclen = _load(idx_dir / DOCLEN_FILE)
+        try:
+            self.k1 = float(os.getenv("BM25_K1", "1.2"))
+            self.b = float(os.getenv("BM25_B", "0.75"))
+        except Exception:
+            self.k1, self.b = 1.2, 0.75
+
+    @staticmethod
+    def exists(idx_dir: Union[str, Path]) -> bool:
+        idx_dir = Path(idx_dir)
+        return all((idx_dir / f).exists() for f in (VOCAB_FILE, PTR_FILE, ROWS_FILE, TF_FILE, DOCLEN_FILE))
+
+    @classmethod
+    def build_from_texts(cls, idx_dir: Union[str, Path], texts: Iterable[str]) -> "BM25Index":
+        """One-off build for indices persisted before BM25 existed (i-th text -> row i).
+
+        Written into a scratch directory and moved into place (vocab last, which is
+        what exists() keys on). Callers serialise builds per index.
+        """
+        idx_dir = Path(idx_dir)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=".bm25-", dir=idx_dir))
+        try:
+            with BM25Writer(tmp_dir) as w:
+                batch: List[str] = []
+                row = 0
+                for t in texts:
+                    batch.append(t)
+                    if len(batch) >= 1024:
+                        w.add(row, batch)
+                        row += len(batch)
+                        batch = []
+                w.add(row, batch)
+            for name in (PTR_FILE, ROWS_FILE, TF_FILE, DOCLEN_FILE, VOCAB_FILE):
+                os.replace(tmp_dir / name, idx_dir / name)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return cls(idx_dir)
+
+    def __len__(self) -> int:
+        return self.docs
+
+    def search(self, query: str, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-n rows by BM25 score (only rows containing a query term): (rows, scores), best first."""
+        tids = {self._term_ids[t] for t in tokenize(query) if t in self._term_ids}
+        if not tids or n <= 0 or not self.docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows_parts: List[np.ndarray] = []
+        score_parts: List[np.ndarray] = []
+        k1, b, avg = self.k1, self.b, max(self.avg_len, 1e-9)
+        for tid in tids:
+            lo, hi = int(self._ptr[tid]), int(self._ptr[tid + 1])
+            rows = np.asarray(self._rows[lo:hi], dtype=np.int64)
+            tf = np.asarray(self._tf[lo:hi], dtype=np.float32)
+            df = hi - lo
+            idf = math.log(1.0 + (self.docs - df + 0.5) / (df + 0.5))
+            dl = np.asarray(self._doclen[rows], dtype=np.float32)
+            rows_parts.append(rows)
+            score_parts.append(idf * tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * dl / avg)))
+        all_rows = np.concatenate(rows_parts)
+        uniq, inv = np.unique(all_rows, return_inverse=True)
+        scores = np.bincount(inv.ravel(), weights=np.concatenate(score_parts), minlength=uniq.shape[0]).astype(np.float32)
+        if scores.shape[0] > n:
+            keep = np.argpartition(-scores, n - 1)[:n]
+            uniq, scores = uniq[keep], scores[keep]
+        order = np.lexsort((uniq, -scores))
+        return uniq[order], scores[order]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"docs": self.docs, "terms": len(self._term_ids), "postings": int(self._ptr[-1]) if self._ptr.size else 0}
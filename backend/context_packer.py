@@ -0,0 +1,196 @@
+"""Context assembly for cited LLM answers.
+
+split_into_chunks windows overlap (200 characters by default), so when
+neighbouring chunks of one document are both retrieved the prompt would carry
+the shared text twice. pack_context():
+
+- groups the chosen chunks by (index, source) and joins runs of consecutive
+  chunk_ids into one block, dropping the text a chunk shares with the end of
+  its predecessor (found by matching the texts, so it works for any overlap
+  and for indices appended with different chunk settings);
+- keeps every chunk's own [Cn] label inline in front of its part of the
+  block, so citations still point at the chunk that holds the text;
+- packs blocks in rank order (best member first) into a token budget; a
+  merged block that does not fit is split back into its chunks, so the
+  best-ranked chunks still make it in.
+
+Tokens are counted with tiktoken when it is installed, with a local
+tokenizer.json when CONTEXT_TOKENIZER_FILE is set, and otherwise estimated
+from word lengths (close enough for budgeting, no downloads).
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import heapq
+import math
+import os
+import re
+import threading
+
+Chunk = Dict[str, Any]
+
+_MIN_OVERLAP = 16
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+_counter: Optional[Tuple[str, str, Callable[[str], int]]] = None  # (requested kind, name, count)
+_counter_lock = threading.Lock()
+
+
+def _estimate_tokens(text: str) -> int:
+    # BPE vocabularies keep common words whole and split long ones roughly every 4 characters
+    return sum(1 if len(w) <= 4 else math.ceil(len(w) / 4) for w in _WORD_RE.findall(text))
+
+
+def _load_counter(kind: str) -> Tuple[str, Callable[[str], int]]:
+    if kind in ("auto", "tiktoken"):
+        try:
+            import tiktoken  # type: ignore
+
+            enc = tiktoken.get_encoding(os.getenv("TIKTOKEN_ENCODING", "cl100k_base"))
+            return "tiktoken", lambda text: len(enc.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    path = os.getenv("CONTEXT_TOKENIZER_FILE")
+    if path and kind in ("auto", "tokenizer"):
+        try:
+            from tokenizers import Tokenizer  # type: ignore
+
+            tok = Tokenizer.from_file(path)
+            return "tokenizer", lambda text: len(tok.encode(text, add_special_tokens=False).ids)
+        except Exception:
+            pass
+    return "heuristic", _estimate_tokens
+
+
+def token_counter() -> Tuple[str, Callable[[str], int]]:
+    """(name, count) for the configured tokenizer (CONTEXT_TOKENIZER=auto|tiktoken|tokenizer|heuristic)."""
+    global _counter
+    kind = os.getenv("CONTEXT_TOKENIZER", "auto").lower()
+    counter = _counter
+    if counter is None or counter[0] != kind:
+        with _counter_lock:
+            counter = _counter
+            if counter is None or counter[0] != kind:
+                counter = _counter = (kind, *_load_counter(kind))
+    return counter[1], counter[2]
+
+
+def count_tokens(text: str) -> int:
+    return token_counter()[1](text)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int, count: Callable[[str], int]) -> str:
+    """Longest prefix (cut at a word boundary when possible) that fits max_tokens."""
+    if count(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text.rfind(" ", 0, lo)
+    return text[: cut if cut > lo // 2 else lo]
+
+
+def text_overlap(a: str, b: str, min_len: int = _MIN_OVERLAP) -> int:
+    """Length of the longest suffix of a that is also a prefix of b (0 below min_len)."""
+    n = min(len(a), len(b))
+    if n < min_len:
+        return 0
+    probe = b[:min_len]
+    pos = a.find(probe, len(a) - n)
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def _blocks(texts: List[str], chunks: List[Chunk], max_chunk_chars: int, merge: bool) -> List[List[Tuple[int, str]]]:
+    """Group chunk positions into blocks of (position, text to show), in rank order of their best member."""
+    if not merge:
+        return [[(i, t)] for i, t in enumerate(texts)]
+    by_source: Dict[Tuple[Any, Any], List[int]] = {}
+    for i, ch in enumerate(chunks):
+        if isinstance(ch.get("chunk_id"), int) and ch.get("source") is not None:
+            by_source.setdefault((ch.get("index"), ch.get("source")), []).append(i)
+    block_of: Dict[int, List[Tuple[int, str]]] = {}
+    dropped = set()
+    for positions in by_source.values():
+        positions.sort(key=lambda i: chunks[i]["chunk_id"])  # stable: ties keep rank order
+        prev: Optional[int] = None
+        for i in positions:
+            cid = chunks[i]["chunk_id"]
+            if prev is not None and cid == chunks[prev]["chunk_id"]:
+                dropped.add(i)  # the same chunk twice: the better-ranked copy stays
+                continue
+            if prev is not None and cid == chunks[prev]["chunk_id"] + 1:
+                block = block_of[prev]
+                full_prev = str(chunks[prev].get("text", "") or "")
+                # only drop the shared text when the predecessor is shown in full
+                shared = text_overlap(full_prev, texts[i]) if len(full_prev) <= max_chunk_chars else 0
+                block.append((i, texts[i][shared:]))
+            else:
+                block = [(i, texts[i])]
+            block_of[i] = block
+            prev = i
+    out: List[List[Tuple[int, str]]] = []
+    seen = set()
+    for i, t in enumerate(texts):
+        if i in dropped:
+            continue
+        block = block_of.get(i, [(i, t)])
+        if id(block) not in seen:
+            seen.add(id(block))
+            out.append(block)
+    return out
+
+
+def pack_context(
+    chunks: List[Chunk],
+    max_tokens: int,
+    max_chunk_chars: int = 1500,
+    merge: bool = True,
+) -> Tuple[str, List[int], Dict[str, Any]]:
+    """Build the labelled context for chunks (in rank order; chunk i is [C{i+1}]).
+
+    Returns (context, positions of the chunks whose text made it in, stats).
+    """
+    name, count = token_counter()
+    texts = [str(ch.get("text", "") or "")[:max_chunk_chars] for ch in chunks]
+    blocks = _blocks(texts, chunks, max_chunk_chars, merge)
+    parts: List[str] = []
+    included: List[int] = []
+    used = 0
+    queue = [(min(i for i, _t in b), n, b) for n, b in enumerate(blocks)]
+    heapq.heapify(queue)
+    while queue:
+        rank, _n, block = heapq.heappop(queue)
+        pieces = [(i, t.strip()) for i, t in block]
+        pieces = [(i, t) for i, t in pieces if t]
+        if not pieces:
+            continue
+        text = " ".join(f"[C{i + 1}] {t}" for i, t in pieces)
+        cost = count(text)
+        if used + cost > max_tokens:
+            if len(block) > 1:
+                # too big as a whole: its chunks compete one by one at their own rank
+                for i, _t in block:
+                    heapq.heappush(queue, (i, len(blocks) + i, [(i, texts[i])]))
+                continue
+            if parts:
+                continue  # a smaller chunk further down may still fit
+            text = _truncate_to_tokens(text, max_tokens, count)
+            cost = count(text)
+        parts.append(text)
+        included.extend(i for i, _t in pieces)
+        used += cost
+    stats = {
+        "tokenizer": name,
+        "tokens": used,
+        "budget": int(max_tokens),
+        "chunks": len(included),
+        "merged_blocks": sum(1 for b in blocks if len(b) > 1),
+    }
+    return "\n\n".join(parts), sorted(included), stats
@@ -0,0 +1,223 @@
+"""Small persistent key/value caches for IOMP, backed by SQLite (stdlib only).
+
+DiskCache stores opaque byte values with bulk get/put, least-recently-used
+eviction once a byte budget is exceeded, and an optional TTL. Higher-level caches
+(EmbeddingCache, AnswerCache, CompletionCache) encode their own keys and values
+on top of it.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .memory_cache import LRUCache
+
+_SQL_BATCH = 500  # stay well below SQLite's bound-parameter limit
+
+
+class DiskCache:
+    def __init__(self, path: Union[str, Path], max_bytes: int = 0, ttl_s: float = 0) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.ttl_s = float(ttl_s)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._total = int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0])
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """Return the cached values for whichever keys are present (and not expired)."""
+        return {k: value for k, (_created, value) in self.get_entries(keys).items()}
+
+    def get_entries(self, keys: Sequence[str]) -> Dict[str, Tuple[float, bytes]]:
+        """get_many() with each value's creation time: {key: (created, value)}."""
+        out: Dict[str, Tuple[float, bytes]] = {}
+        uniq = list(dict.fromkeys(keys))
+        now = time.time()
+        oldest = now - self.ttl_s if self.ttl_s > 0 else None
+        with self._lock:
+            for i in range(0, len(uniq), _SQL_BATCH):
+                part = uniq[i:i + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                sql = f"SELECT key, created, value FROM entries WHERE key IN ({marks})"
+                args: List[object] = list(part)
+                if oldest is not None:
+                    sql += " AND created >= ?"
+                    args.append(oldest)
+                for key, created, value in self._conn.execute(sql, args):
+                    out[key] = (float(created), bytes(value))
+            if out:
+                self._conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?", [(now, k) for k in out])
+            self.hits += len(out)
+            self.misses += len(uniq) - len(out)
+        return out
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [(k, sqlite3.Binary(v), len(v), now, now) for k, v in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._total += sum(r[2] for r in rows)
+            if self.max_bytes > 0 and self._total > self.max_bytes:
+                self._evict()
+
+    def put(self, key: str, value: bytes) -> None:
+        self.put_many({key: value})
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i + _SQL_BATCH]
+                self._conn.execute(f"DELETE FROM entries WHERE key IN ({','.join('?' * len(part))})", part)
+            self._total = int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0])
+
+    def _evict(self) -> None:
+        """Drop least-recently-used (and expired) entries until ~90% of max_bytes. Caller holds the lock."""
+        if self.ttl_s > 0:
+            self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl_s,))
+        self._total = int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0])
+        target = int(self.max_bytes * 0.9)
+        while self._total > target:
+            victims = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT ?", (_SQL_BATCH,)
+            ).fetchall()
+            if not victims:
+                break
+            drop: List[str] = []
+            for key, size in victims:
+                drop.append(key)
+                self._total -= int(size)
+                if self._total <= target:
+                    break
+            self._conn.execute(f"DELETE FROM entries WHERE key IN ({','.join('?' * len(drop))})", drop)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = int(self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0])
+        return {"entries": entries, "bytes": self._total, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+class EmbeddingCache:
+    """Content-addressed embedding vectors keyed by (model name, sha256 of chunk text).
+
+    Shared across indices and users: identical text embedded by the same model is
+    computed once. Vectors are stored as float16, matching emb.npy.
+    """
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = 0) -> None:
+        self._db = DiskCache(path, max_bytes=max_bytes)
+
+    @staticmethod
+    def _key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+    def lookup(self, model: str, texts: Sequence[str]) -> Dict[int, np.ndarray]:
+        """Return {position: vector} for the texts that are already cached."""
+        keys = [self._key(model, t) for t in texts]
+        found = self._db.get_many(keys)
+        return {i: np.frombuffer(found[k], dtype=np.float16) for i, k in enumerate(keys) if k in found}
+
+    def store(self, model: str, texts: Sequence[str], vecs: np.ndarray) -> None:
+        arr = np.asarray(vecs, dtype=np.float16)
+        self._db.put_many({self._key(model, t): arr[i].tobytes() for i, t in enumerate(texts)})
+
+    def stats(self) -> Dict[str, int]:
+        return self._db.stats()
+
+
+class AnswerCache:
+    """Memory-bounded cache of /ask responses with optional SQLite persistence.
+
+    Keys are arbitrary JSON-serialisable values (hashed); callers include an index
+    generation so entries from older builds are simply never looked up again and
+    age out of the LRU.
+    """
+
+    def __init__(self, max_bytes: int, disk_path: Optional[Union[str, Path]] = None, disk_max_bytes: int = 0, ttl_s: float = 0) -> None:
+        self.ttl_s = float(ttl_s)
+        self._mem = LRUCache(max_items=0, max_bytes=max_bytes, sizeof=lambda v: len(v[1]))
+        self._db = DiskCache(disk_path, max_bytes=disk_max_bytes, ttl_s=ttl_s) if disk_path is not None else None
+
+    @staticmethod
+    def key(parts: object) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, object]]:
+        hit = self._mem.get(key)
+        if hit is not None:
+            created, raw = hit
+            if self.ttl_s <= 0 or time.time() - created <= self.ttl_s:
+                return json.loads(raw)
+            self._mem.pop(key)
+        if self._db is not None:
+            entry = self._db.get_entries([key]).get(key)
+            if entry is not None:
+                self._mem.put(key, entry)  # keeps the original creation time, so the TTL still counts from the write
+                return json.loads(entry[1])
+        return None
+
+    def put(self, key: str, value: Dict[str, object]) -> None:
+        raw = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        self._mem.put(key, (time.time(), raw))
+        if self._db is not None:
+            self._db.put(key, raw)
+
+    def stats(self) -> Dict[str, object]:
+        out: Dict[str, object] = {"memory": self._mem.stats()}
+        if self._db is not None:
+            out["disk"] = self._db.stats()
+        return out
+
+
+class CompletionCache:
+    """LLM chat completions keyed by (endpoint, model, temperature, max_tokens, messages).
+
+    Only meant for deterministic (temperature 0) calls: the same rerank or synthesis
+    prompt then costs one request until the entry expires or is evicted.
+    """
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = 0, ttl_s: float = 0) -> None:
+        self._db = DiskCache(path, max_bytes=max_bytes, ttl_s=ttl_s)
+
+    @staticmethod
+    def key(endpoint: str, model: str, temperature: float, max_tokens: int, messages: Sequence[Dict[str, Any]]) -> str:
+        blob = json.dumps([endpoint, model, float(temperature), int(max_tokens), list(messages)], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        raw = self._db.get(key)
+        return raw.decode("utf-8") if raw is not None else None
+
+    def put(self, key: str, completion: str) -> None:
+        self._db.put(key, completion.encode("utf-8", "surrogatepass"))
+
+    def stats(self) -> Dict[str, int]:
+        return self._db.stats()
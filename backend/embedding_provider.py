@@ -0,0 +1,246 @@
+"""Pluggable embedding providers selected with EMBED_PROVIDER.
+
+RAGService uses the torch SentenceTransformer path for EMBED_PROVIDER=local
+and hash embeddings for "hash"; any other name is looked up in the registry
+below:
+
+- "fast" / "fastembed": fastembed ONNX models (FASTEMBED_MODEL, default
+  BAAI/bge-small-en-v1.5, whose published export is already int8-quantized).
+- "onnx": any sentence-embedding ONNX export in a local directory
+  (EMBED_MODEL_DIR with tokenizer.json and model.onnx / model_quantized.onnx),
+  run directly on onnxruntime with mean or CLS pooling.
+- "groq" / "openai": OpenAI-compatible /embeddings endpoint over HTTP.
+
+The local backends never touch torch, load their session lazily on first use
+and share the thread/batch knobs EMBED_THREADS and EMBED_BATCH_SIZE. Setting
+EMBED_MODEL_DIR (or HF_HUB_OFFLINE=1) keeps them fully offline. Vectors are
+returned as L2-normalised float32 rows.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import os
+import threading
+
+import numpy as np
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+def _truthy(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default) in ("1", "true", "True")
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    vecs = np.asarray(vecs, dtype=np.float32)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+class FastEmbedBackend:
+    """fastembed TextEmbedding (onnxruntime, no torch)."""
+
+    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+        self.model = os.getenv("FASTEMBED_MODEL", "BAAI/bge-small-en-v1.5")
+        self.model_dir = os.getenv("EMBED_MODEL_DIR") or None
+        self.cache_dir = str(cache_dir) if cache_dir is not None else None
+        self.threads = _env_int("EMBED_THREADS", 0) or None
+        self.batch_size = max(1, _env_int("EMBED_BATCH_SIZE", 64))
+        self.model_name = f"fastembed:{self.model}"
+        self._impl: Any = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Any:
+        if self._impl is None:
+            with self._lock:
+                if self._impl is None:
+                    from fastembed import TextEmbedding  # type: ignore
+
+                    kwargs: Dict[str, Any] = {}
+                    if self.model_dir:
+                        # offline: use the exported model files as they are, never download
+                        kwargs["specific_model_path"] = self.model_dir
+                    if self.model_dir or _truthy("HF_HUB_OFFLINE"):
+                        kwargs["local_files_only"] = True
+                    self._impl = TextEmbedding(self.model, cache_dir=self.cache_dir, threads=self.threads, **kwargs)
+        return self._impl
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vecs = list(self._load().embed(list(texts), batch_size=self.batch_size))
+        return _normalize(np.stack(vecs)) if vecs else np.empty((0, 0), dtype=np.float32)
+
+
+class OnnxBackend:
+    """Sentence-embedding ONNX export run directly on onnxruntime from a local directory.
+
+    EMBED_QUANTIZED=1 prefers model_quantized.onnx; when the directory has none,
+    an int8 dynamically quantized copy is written once to the cache directory
+    (needs the onnx package, otherwise the float model is used).
+    """
+
+    _QUANTIZED_FILES = ("model_quantized.onnx", "model_qint8_avx512_vnni.onnx", "model_int8.onnx")
+
+    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+        model_dir = os.getenv("EMBED_MODEL_DIR")
+        if not model_dir:
+            raise ValueError("EMBED_PROVIDER=onnx needs EMBED_MODEL_DIR (tokenizer.json + *.onnx)")
+        self.model_dir = Path(model_dir)
+        self.cache_dir = cache_dir
+        self.quantized = _truthy("EMBED_QUANTIZED")
+        self.threads = _env_int("EMBED_THREADS", 0)
+        self.batch_size = max(1, _env_int("EMBED_BATCH_SIZE", 64))
+        self.max_length = max(8, _env_int("EMBED_MAX_LENGTH", 256))
+        self.pooling = os.getenv("EMBED_POOLING", "mean").lower()
+        self.model_name = f"onnx:{self.model_dir.name}" + (":int8" if self.quantized else "")
+        self._session: Any = None
+        self._tokenizer: Any = None
+        self._inputs: List[str] = []
+        self._lock = threading.Lock()
+
+    def _find(self, names: Sequence[str]) -> Optional[Path]:
+        for base in (self.model_dir, self.model_dir / "onnx"):
+            for name in names:
+                if (base / name).is_file():
+                    return base / name
+        return None
+
+    def _model_path(self) -> Path:
+        explicit = os.getenv("EMBED_ONNX_FILE")
+        if explicit:
+            return Path(explicit) if Path(explicit).is_absolute() else self.model_dir / explicit
+        full = self._find(("model.onnx",))
+        if self.quantized:
+            found = self._find(self._QUANTIZED_FILES)
+            if found is not None:
+                return found
+            if full is not None and self.cache_dir is not None:
+                out = Path(self.cache_dir) / f"{self.model_dir.name}.int8.onnx"
+                if not out.exists():
+                    try:
+                        from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+
+                        out.parent.mkdir(parents=True, exist_ok=True)
+                        tmp = out.with_name(out.name + ".tmp")
+                        quantize_dynamic(str(full), str(tmp), weight_type=QuantType.QInt8)
+                        os.replace(tmp, out)
+                    except Exception:
+                        return full
+                return out
+        if full is None:
+            raise FileNotFoundError(f"no .onnx model in {self.model_dir}")
+        return full
+
+    def _load(self) -> Any:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import onnxruntime as ort  # type: ignore
+                    from tokenizers import Tokenizer  # type: ignore
+
+                    tok_path = self._find(("tokenizer.json",))
+                    if tok_path is None:
+                        raise FileNotFoundError(f"no tokenizer.json in {self.model_dir}")
+                    tokenizer = Tokenizer.from_file(str(tok_path))
+                    tokenizer.enable_truncation(max_length=self.max_length)
+                    tokenizer.enable_padding(pad_id=tokenizer.token_to_id("[PAD]") or 0)
+                    opts = ort.SessionOptions()
+                    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    if self.threads > 0:
+                        opts.intra_op_num_threads = self.threads
+                    opts.inter_op_num_threads = 1
+                    session = ort.InferenceSession(
+                        str(self._model_path()), sess_options=opts, providers=["CPUExecutionProvider"]
+                    )
+                    self._inputs = [i.name for i in session.get_inputs()]
+                    self._tokenizer = tokenizer
+                    self._session = session
+        return self._session
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        session = self._load()
+        out: List[np.ndarray] = []
+        texts = list(texts)
+        for i in range(0, len(texts), self.batch_size):
+            enc = self._tokenizer.encode_batch(texts[i:i + self.batch_size])
+            ids = np.asarray([e.ids for e in enc], dtype=np.int64)
+            mask = np.asarray([e.attention_mask for e in enc], dtype=np.int64)
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self._inputs:
+                feeds["token_type_ids"] = np.zeros_like(ids)
+            hidden = session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]
+            if hidden.ndim == 3:
+                if self.pooling == "cls":
+                    hidden = hidden[:, 0]
+                else:
+                    m = mask[:, :, None].astype(np.float32)
+                    hidden = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+            out.append(_normalize(hidden))
+        return np.concatenate(out) if out else np.empty((0, 0), dtype=np.float32)
+
+
+class RemoteBackend:
+    """OpenAI-compatible /embeddings endpoint (Groq, OpenAI, self-hosted gateways)."""
+
+    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+        self.endpoint = os.getenv("EMBED_ENDPOINT", "https://api.groq.com/openai/v1/embeddings")
+        self.api_key = os.getenv("EMBED_API_KEY") or os.getenv("GROQ_API_KEY")
+        if not self.api_key:
+            raise ValueError("remote embeddings need EMBED_API_KEY or GROQ_API_KEY")
+        self.model = os.getenv("GROQ_EMBED_MODEL", "text-embedding-3-small")
+        self.batch_size = max(1, _env_int("EMBED_BATCH_SIZE", 64))
+        self.model_name = self.model
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        import requests
+
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        out: List[List[float]] = []
+        texts = list(texts)
+        for i in range(0, len(texts), self.batch_size):
+            r = requests.post(
+                self.endpoint, headers=headers, json={"model": self.model, "input": texts[i:i + self.batch_size]}, timeout=60
+            )
+            r.raise_for_status()
+            data = sorted(r.json().get("data", []), key=lambda d: d.get("index", 0))
+            out.extend(d["embedding"] for d in data)
+        return _normalize(np.asarray(out, dtype=np.float32)) if out else np.empty((0, 0), dtype=np.float32)
+
+
+_BACKENDS: Dict[str, Callable[[Optional[Path]], Any]] = {}
+
+
+def register_backend(factory: Callable[[Optional[Path]], Any], *names: str) -> None:
+    """Register an embedding backend factory (called with the model cache dir) under one or more names."""
+    for name in names:
+        _BACKENDS[name.lower()] = factory
+
+
+def available_backends() -> List[str]:
+    return sorted(_BACKENDS)
+
+
+register_backend(FastEmbedBackend, "fast", "fastembed")
+register_backend(OnnxBackend, "onnx")
+register_backend(RemoteBackend, "groq", "openai", "remote")
+
+
+class EmbeddingProvider:
+    """Facade RAGService talks to: .embed(texts) plus the model name recorded in index meta."""
+
+    def __init__(self, name: Optional[str] = None, cache_dir: Optional[Path] = None) -> None:
+        self.name = (name or os.getenv("EMBED_PROVIDER", "fast")).lower()
+        factory = _BACKENDS.get(self.name)
+        if factory is None:
+            raise ValueError(f"unknown EMBED_PROVIDER: {self.name!r} (expected one of {available_backends()})")
+        self.backend = factory(cache_dir)
+        self.remote_model_name: Optional[str] = self.backend.model_name if isinstance(self.backend, RemoteBackend) else None
+        self.local_model_name: Optional[str] = None if self.remote_model_name else self.backend.model_name
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), dim) L2-normalised float32 embeddings."""
+        return self.backend.embed(texts)
@@ -0,0 +1,110 @@
+"""Batched hashing-trick embedder used when no embedding model is available.
+
+Produces the same vectors as the original per-token loop in RAGService (word
+unigrams weighted 1.0 plus character bigrams weighted 0.2, bucketed with
+blake2b modulo dim, L2-normalised, float16), so indices persisted with the old
+implementation stay comparable. The speed-up comes from:
+
+- hashing each distinct token / bigram once per batch, with a bounded cache of
+  token -> bucket across calls;
+- extracting character bigrams as integer code-point pairs with NumPy instead of
+  slicing strings one character at a time;
+- accumulating counts for the whole batch with np.bincount (bigram weights are
+  then added per hit in float32, the old loop's rounding order).
+"""
+from __future__ import annotations
+from typing import Dict, List, Sequence
+import hashlib
+
+import numpy as np
+
+# Bump when the token/bucket scheme changes; recorded in meta.json of hash-embedded indices.
+HASH_EMBED_VERSION = 1
+
+_WORD_WEIGHT = 1.0
+_BIGRAM_WEIGHT = 0.2
+_CP_BITS = 21  # unicode code points fit in 21 bits
+
+
+def _bucket(token: str, dim: int) -> int:
+    digest = hashlib.blake2b(token.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % dim
+
+
+class HashEmbedder:
+    def __init__(self, dim: int = 384, cache_size: int = 200_000) -> None:
+        self.dim = int(dim)
+        self.cache_size = int(cache_size)
+        self._words: Dict[str, int] = {}
+        self._bigrams: Dict[int, int] = {}
+
+    def _word_buckets(self, tokens: List[str]) -> np.ndarray:
+        cache = self._words
+        if len(cache) > self.cache_size:
+            cache.clear()
+        out = np.empty(len(tokens), dtype=np.int64)
+        for i, tok in enumerate(tokens):
+            b = cache.get(tok)
+            if b is None:
+                b = cache[tok] = _bucket(tok, self.dim)
+            out[i] = b
+        return out
+
+    def _bigram_buckets(self, pair_ids: np.ndarray) -> np.ndarray:
+        cache = self._bigrams
+        if len(cache) > self.cache_size:
+            cache.clear()
+        mask = (1 << _CP_BITS) - 1
+        out = np.empty(len(pair_ids), dtype=np.int64)
+        for i, pid in enumerate(pair_ids.tolist()):
+            b = cache.get(pid)
+            if b is None:
+                b = cache[pid] = _bucket(chr(pid >> _CP_BITS) + chr(pid & mask), self.dim)
+            out[i] = b
+        return out
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        n, dim = len(texts), self.dim
+        if n == 0:
+            return np.zeros((0, dim), dtype=np.float16)
+        lowered = [t.lower() for t in texts]
+
+        # word unigrams: one bucket lookup per token occurrence (dict hit after first sight)
+        tokens: List[str] = []
+        word_rows: List[int] = []
+        for i, s in enumerate(lowered):
+            toks = s.split()
+            tokens.extend(toks)
+            word_rows.extend([i] * len(toks))
+        mat = np.zeros(n * dim, dtype=np.float32)
+        if tokens:
+            flat = np.asarray(word_rows, dtype=np.int64) * dim + self._word_buckets(tokens)
+            mat += np.bincount(flat, minlength=n * dim).astype(np.float32) * np.float32(_WORD_WEIGHT)
+
+        # character bigrams as (code point << 21 | next code point), never across texts
+        cps = [np.frombuffer(s.encode("utf-32-le", "surrogatepass"), dtype=np.uint32) for s in lowered]
+        lens = np.fromiter((len(c) for c in cps), dtype=np.int64, count=n)
+        if int(lens.sum()) > 1:
+            allcp = np.concatenate(cps).astype(np.int64)
+            rows = np.repeat(np.arange(n, dtype=np.int64), lens)
+            same = rows[:-1] == rows[1:]
+            pair_rows = rows[:-1][same]
+            pair_ids = ((allcp[:-1] << _CP_BITS) | allcp[1:])[same]
+            if pair_ids.size:
+                uniq, inv = np.unique(pair_ids, return_inverse=True)
+                buckets = self._bigram_buckets(uniq)[inv.ravel()]
+                hits = np.bincount(pair_rows * dim + buckets, minlength=n * dim)
+                # add the bigram weight one hit at a time in float32, after the word counts,
+                # exactly like the original loop (a single count * 0.2 rounds differently)
+                cells = np.flatnonzero(hits)
+                left = hits[cells]
+                step = np.float32(_BIGRAM_WEIGHT)
+                while cells.size:
+                    mat[cells] += step
+                    left -= 1
+                    keep = left > 0
+                    cells, left = cells[keep], left[keep]
+
+        mat = mat.reshape(n, dim)
+        norms = np.linalg.norm(mat, axis=1, keepdims=True) + 1e-8
+        return (mat / norms).astype(np.float16)
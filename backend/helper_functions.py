@@ -4,8 +4,15 @@ Focused on minimal text ingestion + chunking.
 Later commits may add embedding calls, improved cleaning, and format-specific parsing.
 """
 from __future__ import annotations
-from typing import List
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+import hashlib
 import os
+import queue
+import threading
+import time
+
+T = TypeVar("T")
 
 def _read_pdf(path: str) -> str:
     try:
@@ -27,6 +34,41 @@ def _read_pdf(path: str) -> str:
     except Exception:
         return ""
 
+def _pdf_page_count(path: str) -> int:
+    try:
+        from PyPDF2 import PdfReader
+        return len(PdfReader(path).pages)
+    except Exception:
+        return 0
+
+
+def _read_pdf_pages(path: str, start: int, stop: int) -> List[str]:
+    """Extract non-empty page texts for pages [start, stop) of a PDF."""
+    try:
+        from PyPDF2 import PdfReader
+        reader = PdfReader(path)
+    except Exception:
+        return []
+    parts: List[str] = []
+    for i in range(start, min(stop, len(reader.pages))):
+        try:
+            txt = reader.pages[i].extract_text() or ""
+        except Exception:
+            txt = ""
+        if txt:
+            parts.append(txt)
+    return parts
+
+
+def file_sha256(path: str) -> str:
+    """Content hash of a file, read in 1 MiB blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
 def read_text_from_file(path: str) -> str:
     ext = os.path.splitext(path.lower())[1]
     if ext == ".pdf":
@@ -36,6 +78,96 @@ def read_text_from_file(path: str) -> str:
         return f.read()
 
 
+def iter_extracted_texts(
+    paths: List[str],
+    workers: int = 1,
+    timeout: float = 120.0,
+    pages_per_task: int = 8,
+    stats: Optional[Dict[str, int]] = None,
+) -> Iterator[Tuple[str, str]]:
+    """Extract text from files, yielding (path, text) in the order of `paths`.
+
+    With workers > 1 and at least one PDF present, files are parsed in a process
+    pool and each PDF is split into page ranges of `pages_per_task` pages, so one
+    large document also spreads across cores. Only a bounded window of files is
+    in flight at a time. A file whose parse exceeds `timeout` seconds (counted from
+    when the consumer starts waiting on it) is skipped; the pool is terminated at
+    the end so hung workers do not outlive the build. Text-only uploads are read
+    inline since plain file reads are I/O bound.
+    Unreadable files are skipped; counts land in stats['parse_failed'/'parse_timeouts'].
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("parse_failed", 0)
+    stats.setdefault("parse_timeouts", 0)
+    is_pdf = [os.path.splitext(p.lower())[1] == ".pdf" for p in paths]
+    if workers <= 1 or not any(is_pdf):
+        for p in paths:
+            try:
+                yield p, read_text_from_file(p)
+            except Exception:
+                stats["parse_failed"] += 1
+        return
+
+    import multiprocessing as mp
+    ctx = mp.get_context(os.getenv("PARSE_START_METHOD", "spawn"))
+    pool = ctx.Pool(processes=workers)
+    window = max(2, workers * 2)
+    pages_per_task = max(1, pages_per_task)
+    # entry: [path, is_pdf, count_result | None, page_results | None, text_result | None]
+    pending: "deque[List[Any]]" = deque()
+
+    def _submit(i: int) -> None:
+        p = paths[i]
+        if is_pdf[i]:
+            pending.append([p, True, pool.apply_async(_pdf_page_count, (p,)), None, None])
+        else:
+            pending.append([p, False, None, None, pool.apply_async(read_text_from_file, (p,))])
+
+    def _expand(entry: List[Any], wait: Optional[float]) -> None:
+        n_pages = entry[2].get(wait)
+        entry[3] = [
+            pool.apply_async(_read_pdf_pages, (entry[0], s, s + pages_per_task))
+            for s in range(0, n_pages, pages_per_task)
+        ]
+
+    try:
+        nxt = 0
+        while nxt < len(paths) or pending:
+            while nxt < len(paths) and len(pending) < window:
+                _submit(nxt)
+                nxt += 1
+            # fan out page ranges for any PDF whose page count is already known
+            for entry in pending:
+                if entry[1] and entry[3] is None and entry[2].ready():
+                    try:
+                        _expand(entry, 0)
+                    except Exception:
+                        entry[3] = []
+            entry = pending.popleft()
+            path = entry[0]
+            deadline = time.monotonic() + timeout
+            try:
+                if entry[1]:
+                    if entry[3] is None:
+                        _expand(entry, max(0.0, deadline - time.monotonic()))
+                    parts: List[str] = []
+                    for r in entry[3]:
+                        parts.extend(r.get(max(0.0, deadline - time.monotonic())))
+                    text = "\n".join(parts)
+                else:
+                    text = entry[4].get(max(0.0, deadline - time.monotonic()))
+            except mp.TimeoutError:
+                stats["parse_timeouts"] += 1
+                continue
+            except Exception:
+                stats["parse_failed"] += 1
+                continue
+            yield path, text
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 def split_into_chunks(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
     """Simple overlapping window chunker.
     Does not perform semantic splitting (added in later stages).
@@ -56,3 +188,62 @@ def split_into_chunks(text: str, chunk_size: int = 1000, chunk_overlap: int = 20
         if start < 0:
             start = 0
     return chunks
+
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Group an iterable into lists of at most `size` items."""
+    size = max(1, size)
+    buf: List[T] = []
+    for it in items:
+        buf.append(it)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def bounded_prefetch(items: Iterable[T], maxsize: int = 2) -> Iterator[T]:
+    """Run `items` in a background thread, handing results over a bounded queue.
+
+    Lets the producer (file reading/chunking) overlap with the consumer
+    (embedding/persisting) while never holding more than `maxsize` items in
+    flight. Producer exceptions are re-raised in the consumer; closing the
+    generator early stops the producer.
+    """
+    q: "queue.Queue[tuple]" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def _put(item: tuple) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce() -> None:
+        try:
+            for it in items:
+                if not _put(("item", it)):
+                    return
+            _put(("done", None))
+        except BaseException as e:  # surfaced to the consumer
+            _put(("error", e))
+
+    worker = threading.Thread(target=_produce, name="bounded-prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            kind, val = q.get()
+            if kind == "item":
+                yield val
+            elif kind == "error":
+                raise val
+            else:
+                return
+    finally:
+        stop.set()
+        worker.join(timeout=5)
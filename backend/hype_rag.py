@@ -9,20 +9,36 @@ Notes for readers:
 """
 
 from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, Any, Tuple, Optional
+from typing import Callable, List, Dict, Any, Tuple, Optional, Iterable, Iterator, Union
 import os
 import time
-import os
+import threading
 import numpy as np
 import json
+import re
+import unicodedata
 from pathlib import Path
 from typing import cast
 
-from .helper_functions import read_text_from_file, split_into_chunks
+from .helper_functions import split_into_chunks, batched, bounded_prefetch, iter_extracted_texts, file_sha256
+from .index_store import NpyAppender, ChunkStore, ChunkStoreWriter
+from .disk_cache import AnswerCache, CompletionCache, EmbeddingCache
+from .hash_embed import HashEmbedder, HASH_EMBED_VERSION
+from .quantization import QUANT_TYPES, QuantizedMatrix, quantize_rows
+from .scoring import fuse_rankings, gather_rows, mmr_select, score_rows, top_n_dot, top_n_dot_many
+from .ann_index import ANN_TYPES, AnnIndex, ann_available, build_ann
+from .bm25_index import BM25Index, BM25Writer
+from .memory_cache import LRUCache
+from .micro_batch import MicroBatcher
+from .llm_client import LLMClient
+from .rerankers import make_reranker
+from .context_packer import pack_context
 
-# Optional unified embedding provider (remote/local/hash). If EMBED_PROVIDER != 'local',
-# we use embedding_provider. Kept optional to avoid import errors when file is absent.
+# Optional embedding provider registry (fastembed/ONNX/remote). Used when EMBED_PROVIDER is
+# neither 'local' nor 'hash'; kept optional so a missing runtime never breaks startup.
 try:
     from .embedding_provider import EmbeddingProvider  # type: ignore
 except Exception:
@@ -33,6 +49,20 @@ except Exception:
         EmbeddingProvider = None  # type: ignore
 
 
+_INDEX_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,127}$")
+# Env knobs that change what /ask returns; part of the answer-cache key
+_ANSWER_OPTION_ENV = (
+    "LOW_MEMORY_MODE", "MMR_ENABLED", "MMR_LAMBDA", "ANSWER_MAX_CHARS", "RETRIEVAL_MODE",
+    "HYBRID_FUSION", "HYBRID_DENSE_WEIGHT", "HYBRID_LEXICAL_CANDIDATES", "HYBRID_DENSE_CANDIDATES",
+    "TOP_N_CANDIDATES", "KEYWORD_CANDIDATES", "RERANK_MAX", "QUANT_CANDIDATES",
+    "RESTORE_FULL_ON_ANSWER", "DROP_FULL_CHUNKS", "USE_LLM_RERANK", "USE_LLM_ANSWER",
+    "RERANKER", "RERANK_MODEL", "RERANK_MODEL_DIR", "RERANK_MAX_CANDIDATES", "RERANK_QUANTIZED",
+    "USE_EMBEDDINGS", "GROQ_CHAT_MODEL", "GROQ_MODEL_ANSWER", "LLM_PIPELINE", "STREAM_LLM_RERANK",
+    "ANSWER_MAX_TOKENS", "ANSWER_MAX_CONTEXT_TOKENS", "ANSWER_MAX_CONTEXT_CHARS", "CONTEXT_MERGE",
+    "CONTEXT_TOKENIZER", "CONTEXT_TOKENIZER_FILE", "TIKTOKEN_ENCODING",
+)
+
+
 @dataclass
 class EmbeddingsInfo:
     model_name: str = "stub-local"
@@ -44,9 +74,9 @@ class RAGService:
         self.embeddings = EmbeddingsInfo()
         self.embed_provider_name = os.getenv("EMBED_PROVIDER", "local").lower() #sentence-transformers/all-MiniLM-L6-v2
         self._embed_provider = None
-        if self.embed_provider_name != "local" and EmbeddingProvider is not None:
+        if self.embed_provider_name not in ("local", "hash") and EmbeddingProvider is not None:
             try:
-                self._embed_provider = EmbeddingProvider()
+                self._embed_provider = EmbeddingProvider(self.embed_provider_name, cache_dir=self._hf_cache_dir())
                 # reflect reported model
                 try:
                     # prefer remote/local model name if available
@@ -62,22 +92,35 @@ class RAGService:
                 # fallback: will use hash path in _encode_texts
                 self._embed_provider = None
         self.use_mongo_vector = False
-        # Per-user multi-tenant storage
-        # _indices_by_user[user_id] = { 'active': str|None, 'indices': { index_name: { 'chunks': List[dict], 'emb': np.ndarray } } }
-        self._indices_by_user: Dict[str, Dict[str, Any]] = {}
+        # Per-user multi-tenant storage, loaded lazily from disk and kept in an LRU
+        # _indices_by_user[user_id] = { 'active': str|None, 'indices': { index_name: { 'chunks': List[dict]|None, 'emb_path': str|None, 'meta': dict } } }
+        # 'chunks' stays None until the index is first queried.
+        self._indices_by_user: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._slots_lock = threading.RLock()
         self.last_build_stats: Dict[str, Any] = {}
         self._model = None
+        self._emb_cache: Optional[EmbeddingCache] = None
+        self._hash_embedder: Optional[HashEmbedder] = None
+        self._retrieval_pool: Optional[ThreadPoolExecutor] = None
+        self._fanout_pool: Optional[ThreadPoolExecutor] = None
+        self._query_cache: Optional[LRUCache] = None
+        self._answer_cache: Optional[AnswerCache] = None
+        self._query_cache_model: Optional[str] = None
+        self._query_batcher: Optional[MicroBatcher] = None
+        self._llm: Optional[LLMClient] = None
+        self._completion_cache: Optional[CompletionCache] = None
+        self._reranker_inst: Optional[Tuple[str, Any]] = None
+        self._build_locks: Dict[Tuple[str, str], "threading.RLock"] = {}
         # Mongo state
         self._mongo_client = None
         self._mongo_db = None
         self._mongo_col = None
-        # on boot, try load any persisted indices
+        # Tenants are loaded on first access (see _ensure_user_slot), so boot cost does
+        # not grow with the number of users on disk.
         try:
             self._init_mongo_if_configured()
-            if not self.use_mongo_vector:
-                self._load_from_disk()
         except Exception:
-            # non-fatal; continue with empty in-memory state
+            # non-fatal; continue with local storage
             pass
 
     # ---- HF cache prep to avoid permission errors (e.g., '/app' not writable) ----
@@ -120,74 +163,85 @@ class RAGService:
         p.mkdir(parents=True, exist_ok=True)
         return p
 
-    def _persist_index(self, user_id: str, index_name: str, chunks: List[Dict[str, Any]], emb: Optional[np.ndarray]) -> Optional[Path]:
+    def _read_index_meta(self, user_id: str, index_name: str) -> Dict[str, Any]:
+        meta_path = self._user_dir(user_id) / index_name / "meta.json"
+        if not meta_path.exists():
+            return {}
+        try:
+            with meta_path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _write_index_meta(self, user_id: str, index_name: str, meta: Dict[str, Any]) -> None:
+        """Write meta.json for an index whose chunks/embeddings were already streamed to disk."""
         idx_dir = self._index_dir(user_id, index_name)
-        # chunks.jsonl
-        with (idx_dir / "chunks.jsonl").open("w", encoding="utf-8") as f:
-            for ch in chunks:
-                f.write(json.dumps(ch, ensure_ascii=False) + "\n")
-        # embedding matrix
-        emb_path: Optional[Path] = None
-        if emb is not None:
-            emb_path = idx_dir / "emb.npy"
-            np.save(emb_path, emb)
-        # metadata
-        meta = {
-            "model": self.embeddings.model_name,
-            "created_ts": int(time.time()),
-            "chunks": len(chunks),
-            "has_emb": emb is not None,
-        }
-        with (idx_dir / "meta.json").open("w", encoding="utf-8") as f:
+        tmp = idx_dir / "meta.json.tmp"
+        with tmp.open("w", encoding="utf-8") as f:
             json.dump(meta, f)
+        os.replace(tmp, idx_dir / "meta.json")
 
-        # mark active
+    def _set_active(self, user_id: str, index_name: Optional[str]) -> None:
+        self._ensure_user_slot(user_id)["active"] = index_name
         with (self._user_dir(user_id) / "active.txt").open("w", encoding="utf-8") as f:
-            f.write(index_name)
-        return emb_path
+            f.write(index_name or "")
 
-    def _load_from_disk(self) -> None:
-        base = self._data_dir() / "indices"
-        if not base.exists():
-            return
-        for user_dir in base.iterdir():
-            if not user_dir.is_dir():
-                continue
-            user_id = user_dir.name
-            slot = self._ensure_user_slot(user_id)
-            # read active
-            active = None
-            atxt = user_dir / "active.txt"
-            if atxt.exists():
+    def _read_chunks_file(self, chunks_path: Path) -> List[Dict[str, Any]]:
+        chunks: List[Dict[str, Any]] = []
+        with chunks_path.open("r", encoding="utf-8") as f:
+            for i, line in enumerate(f):
                 try:
-                    active = atxt.read_text(encoding="utf-8").strip() or None
+                    obj = json.loads(line)
                 except Exception:
-                    active = None
-            # load indices
-            for idx_dir in user_dir.iterdir():
-                if not idx_dir.is_dir():
-                    continue
-                name = idx_dir.name
-                chunks_path = idx_dir / "chunks.jsonl"
-                if not chunks_path.exists():
-                    continue
-                chunks: List[Dict[str, Any]] = []
-                try:
-                    with chunks_path.open("r", encoding="utf-8") as f:
-                        for line in f:
-                            try:
-                                chunks.append(json.loads(line))
-                            except Exception:
-                                continue
-                except Exception:
-                    continue
-                emb_path = idx_dir / "emb.npy"
-                # Do NOT load embeddings into RAM on boot; store path only
-                if emb_path.exists():
-                    slot["indices"][name] = {"chunks": chunks, "emb_path": str(emb_path)}
-                else:
-                    slot["indices"][name] = {"chunks": chunks, "emb_path": None}
-            slot["active"] = active
+                    # empty placeholder keeps positions aligned with rows and emb.npy (as ChunkStore.build_from_jsonl does)
+                    obj = {"text": "", "source": None, "chunk_id": None}
+                # indices persisted before global row ids: row == line number
+                obj.setdefault("row", i)
+                chunks.append(obj)
+        return chunks
+
+    def _chunk_store(self, user_id: str, index_name: str, idx: Dict[str, Any]) -> Optional[ChunkStore]:
+        """Memory-mapped chunk store for an index, opened once and cached on its slot entry.
+
+        Older indices without chunks.bin are converted from chunks.jsonl on first use.
+        """
+        store = idx.get("store")
+        if store is None:
+            idx_dir = self._user_dir(user_id) / index_name
+            if ChunkStore.exists(idx_dir):
+                store = ChunkStore(idx_dir)
+            elif (idx_dir / "chunks.jsonl").exists():
+                # concurrent first queries convert once; the others open the result
+                with self._index_build_lock(user_id, index_name):
+                    store = ChunkStore(idx_dir) if ChunkStore.exists(idx_dir) else ChunkStore.build_from_jsonl(idx_dir)
+            else:
+                return None
+            idx["store"] = store
+        return store
+
+    def _bm25_index(self, user_id: str, index_name: str, idx: Dict[str, Any]) -> Optional[BM25Index]:
+        """BM25 postings for an index, opened once and cached on its slot entry.
+
+        Local indices built before BM25 existed are indexed from their chunk store on first use.
+        """
+        bm25 = idx.get("bm25")
+        if bm25 is None:
+            idx_dir = self._user_dir(user_id) / index_name
+            if BM25Index.exists(idx_dir):
+                bm25 = BM25Index(idx_dir)
+            elif not idx.get("mongo") and os.getenv("BM25_INDEX", "1") in ("1", "true", "True"):
+                store = self._chunk_store(user_id, index_name, idx)
+                if store is None:
+                    return None
+                with self._index_build_lock(user_id, index_name):
+                    if BM25Index.exists(idx_dir):
+                        bm25 = BM25Index(idx_dir)
+                    else:
+                        bm25 = BM25Index.build_from_texts(idx_dir, (store.get(i) for i in range(len(store))))
+            else:
+                return None
+            idx["bm25"] = bm25
+        return bm25
 
     def _get_model(self):
         # If using non-local provider, don't initialize sentence-transformers
@@ -236,25 +290,27 @@ class RAGService:
 
     # ---- Lightweight hash embeddings fallback when ST model unavailable ----
     def _hash_embed(self, texts: List[str], dim: int = 384) -> np.ndarray:
-        import hashlib
-        mat = np.zeros((len(texts), dim), dtype=np.float32)
-        for i, t in enumerate(texts):
-            s = t.lower()
-            # word tokens
-            for tok in s.split():
-                h = int(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).hexdigest(), 16)
-                mat[i, h % dim] += 1.0
-            # char bigrams
-            for j in range(len(s) - 1):
-                bg = s[j:j+2]
-                h = int(hashlib.blake2b(bg.encode("utf-8"), digest_size=8).hexdigest(), 16)
-                mat[i, h % dim] += 0.2
-        # L2 normalize
-        norms = np.linalg.norm(mat, axis=1, keepdims=True) + 1e-8
-        mat = mat / norms
-        return mat.astype(np.float16)
+        embedder = self._hash_embedder
+        if embedder is None or embedder.dim != dim:
+            embedder = self._hash_embedder = HashEmbedder(dim)
+        return embedder.embed(texts)
 
-    def _encode_texts(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+    def _embedding_cache(self) -> Optional[EmbeddingCache]:
+        """Shared on-disk embedding cache under DATA_DIR/cache (EMB_CACHE=0 disables)."""
+        if os.getenv("EMB_CACHE", "1") in ("0", "false", "False"):
+            return None
+        if self._emb_cache is None:
+            try:
+                max_mb = float(os.getenv("EMB_CACHE_MAX_MB", "512"))
+            except Exception:
+                max_mb = 512.0
+            try:
+                self._emb_cache = EmbeddingCache(self._data_dir() / "cache" / "embeddings.sqlite", int(max_mb * 1024 * 1024))
+            except Exception:
+                return None
+        return self._emb_cache
+
+    def _encode_uncached(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
         # Non-local provider path (remote/fast/hash via adapter)
         if self._embed_provider is not None:
             try:
@@ -277,10 +333,154 @@ class RAGService:
             self.embeddings.model_name = "hash-embeddings"
             return self._hash_embed(texts)
 
+    def _encode_texts(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Embed texts, serving repeats from the shared embedding cache.
+
+        Only cache misses reach the model/provider. Hash embeddings are cheap and
+        are never cached.
+        """
+        if self._embed_provider is None and self._get_model() is None:
+            self.embeddings.model_name = "hash-embeddings"
+            return self._hash_embed(texts)
+        cache = self._embedding_cache()
+        if cache is None or not texts:
+            return self._encode_uncached(texts, batch_size)
+        model_name = self.embeddings.model_name
+        try:
+            hits = cache.lookup(model_name, texts)
+        except Exception:
+            hits = {}
+        miss = [i for i in range(len(texts)) if i not in hits]
+        fresh = self._encode_uncached([texts[i] for i in miss], batch_size) if miss else None
+        if self.embeddings.model_name != model_name:
+            # encoder fell back to hashing mid-way; never mix vector spaces
+            return self._hash_embed(texts)
+        dim = fresh.shape[1] if fresh is not None else next(iter(hits.values())).shape[0]
+        out = np.empty((len(texts), dim), dtype=np.float16)
+        for i, v in hits.items():
+            out[i] = v
+        if fresh is not None:
+            out[miss] = fresh
+            try:
+                cache.store(model_name, [texts[i] for i in miss], fresh)
+            except Exception:
+                pass
+        return out
+
+    def _current_embedding_model(self) -> str:
+        """Name of the embedding model _encode_texts would use right now."""
+        if self._embed_provider is not None or self._get_model() is not None:
+            return self.embeddings.model_name
+        return "hash-embeddings"
+
+    # ---- Tenant slots (lazy load + LRU eviction) ----
     def _ensure_user_slot(self, user_id: str) -> Dict[str, Any]:
-        if user_id not in self._indices_by_user:
-            self._indices_by_user[user_id] = {"active": None, "indices": {}}
-        return self._indices_by_user[user_id]
+        with self._slots_lock:
+            slot = self._indices_by_user.get(user_id)
+            if slot is not None:
+                self._indices_by_user.move_to_end(user_id)
+                return slot
+            try:
+                slot = self._load_user_slot(user_id)
+            except Exception:
+                slot = {"active": None, "indices": {}}
+            self._indices_by_user[user_id] = slot
+            self._evict_cold_tenants(keep=user_id)
+            return slot
+
+    def _load_user_slot(self, user_id: str) -> Dict[str, Any]:
+        """Read a user's active.txt and each index's meta.json; chunk lists load on first query."""
+        slot: Dict[str, Any] = {"active": None, "indices": {}}
+        user_dir = self._data_dir() / "indices" / user_id
+        if not user_dir.is_dir():
+            return slot
+        atxt = user_dir / "active.txt"
+        if atxt.exists():
+            try:
+                slot["active"] = atxt.read_text(encoding="utf-8").strip() or None
+            except Exception:
+                slot["active"] = None
+        for idx_dir in sorted(user_dir.iterdir()):
+            if not idx_dir.is_dir():
+                continue
+            if not (idx_dir / "chunks.jsonl").exists() and not self.use_mongo_vector:
+                continue
+            emb_path = idx_dir / "emb.npy"
+            entry: Dict[str, Any] = {
+                "chunks": None,
+                # Do NOT load embeddings into RAM; store path only
+                "emb_path": str(emb_path) if emb_path.exists() else None,
+                "meta": self._read_index_meta(user_id, idx_dir.name),
+            }
+            if self.use_mongo_vector:
+                entry["mongo"] = True
+            slot["indices"][idx_dir.name] = entry
+        return slot
+
+    def _index_chunks(self, user_id: str, index_name: str, idx: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """In-memory chunk previews of an index, read from chunks.jsonl on first use."""
+        chunks = idx.get("chunks")
+        if chunks is None:
+            chunks_path = self._user_dir(user_id) / index_name / "chunks.jsonl"
+            chunks = self._read_chunk_previews(chunks_path) if chunks_path.exists() else []
+            idx["chunks"] = chunks
+            with self._slots_lock:
+                self._evict_cold_tenants(keep=user_id)
+        return chunks
+
+    def _read_chunk_previews(self, chunks_path: Path) -> List[Dict[str, Any]]:
+        """Chunks as kept in memory after a build: truncated text, or a short preview with DROP_FULL_CHUNKS."""
+        try:
+            trunc_chars = int(os.getenv("TRUNCATE_CHUNK_CHARS", "300"))
+        except Exception:
+            trunc_chars = 300
+        drop_full = os.getenv("DROP_FULL_CHUNKS", "1") in ("1", "true", "True")
+        keep = 120 if drop_full else trunc_chars
+        chunks = self._read_chunks_file(chunks_path)
+        if keep > 0:
+            for c in chunks:
+                t = c.get("text", "")
+                if isinstance(t, str) and len(t) > keep:
+                    c["text"] = t[:keep]
+        return chunks
+
+    @staticmethod
+    def _resident_chunks(slot: Dict[str, Any]) -> int:
+        return sum(len(e.get("chunks") or ()) for e in slot.get("indices", {}).values())
+
+    def _evict_cold_tenants(self, keep: Optional[str] = None) -> None:
+        """Drop least recently used tenants beyond TENANT_CACHE_MAX_USERS / TENANT_CACHE_MAX_CHUNKS.
+
+        Evicted slots are simply forgotten; everything they hold is on disk and is
+        reloaded on the tenant's next request. Caller holds _slots_lock.
+        """
+        try:
+            max_users = int(os.getenv("TENANT_CACHE_MAX_USERS", "64"))
+        except Exception:
+            max_users = 64
+        try:
+            max_chunks = int(os.getenv("TENANT_CACHE_MAX_CHUNKS", "200000"))
+        except Exception:
+            max_chunks = 200000
+        resident = {uid: self._resident_chunks(sl) for uid, sl in self._indices_by_user.items()}
+        total = sum(resident.values())
+        for uid in list(self._indices_by_user):
+            over_users = max_users > 0 and len(self._indices_by_user) > max_users
+            over_chunks = max_chunks > 0 and total > max_chunks
+            if not (over_users or over_chunks):
+                break
+            if uid == keep:
+                continue
+            self._indices_by_user.pop(uid, None)
+            total -= resident.get(uid, 0)
+
+    def tenant_cache_stats(self) -> Dict[str, Any]:
+        with self._slots_lock:
+            slots = list(self._indices_by_user.values())
+        return {
+            "resident_tenants": len(slots),
+            "resident_chunks": sum(self._resident_chunks(sl) for sl in slots),
+        }
 
     # --- Index management helpers ---
     def list_indices(self, user_id: str) -> Dict[str, Any]:
@@ -299,16 +499,23 @@ class RAGService:
         else:
             slot = self._ensure_user_slot(user_id)
             out = {"active": slot.get("active"), "indices": []}
-            for name, meta in slot.get("indices", {}).items():
-                chunks = meta.get("chunks", [])
+            for name, entry in slot.get("indices", {}).items():
+                chunks = entry.get("chunks")
                 out["indices"].append({
                     "name": name,
-                    "chunks": len(chunks),
-                    "has_emb": bool(meta.get("emb_path")),
+                    "chunks": len(chunks) if chunks is not None else int(entry.get("meta", {}).get("chunks", 0) or 0),
+                    "has_emb": bool(entry.get("emb_path") or (entry.get("meta") or {}).get("quant")),
+                    "quant": ((entry.get("meta") or {}).get("quant") or {}).get("type"),
+                    "ann": ((entry.get("meta") or {}).get("ann") or {}).get("type"),
                 })
             return out
 
     def delete_index(self, user_id: str, index_name: str) -> Dict[str, Any]:
+        with self._index_build_lock(user_id, index_name):
+            return self._delete_index(user_id, index_name)
+
+    def _delete_index(self, user_id: str, index_name: str) -> Dict[str, Any]:
+        self._bump_generation(user_id, index_name)
         if self.use_mongo_vector:
             removed_disk = False
             try:
@@ -324,14 +531,20 @@ class RAGService:
                     remaining = self._col().distinct("index_name", {"user_id": user_id})
                 except Exception:
                     remaining = []
-                slot["active"] = remaining[0] if remaining else None
+                try:
+                    self._set_active(user_id, remaining[0] if remaining else None)
+                except Exception:
+                    slot["active"] = remaining[0] if remaining else None
+            slot["indices"].pop(index_name, None)
             return {"removed_memory": True, "removed_disk": removed_disk, "active": slot.get("active")}
         else:
             slot = self._ensure_user_slot(user_id)
             existed = index_name in slot["indices"]
-            # Remove from memory
+            # Remove from memory (release the chunk store mmap before deleting files)
             if existed:
-                slot["indices"].pop(index_name, None)
+                entry = slot["indices"].pop(index_name, None) or {}
+                if entry.get("store") is not None:
+                    entry["store"].close()
             # Remove from disk
             idx_dir = self._index_dir(user_id, index_name)
             removed_disk = False
@@ -366,6 +579,73 @@ class RAGService:
             return {"removed_memory": existed, "removed_disk": removed_disk, "active": slot.get("active")}
 
     # --- Build (upload-only) ---
+    def _iter_documents(
+        self,
+        folder_path: str,
+        stats: Optional[Dict[str, Any]] = None,
+        skip_hashes: Optional[set] = None,
+    ) -> Iterator[Tuple[str, str, str]]:
+        """Yield (path, text, sha256) for supported files under folder_path in a stable order.
+
+        Files whose content hash is in skip_hashes (or repeats within this upload) are
+        skipped before parsing. Parsing is fanned out over a process pool
+        (PARSE_WORKERS) when PDFs are present.
+        """
+        stats = stats if stats is not None else {}
+        seen = set(skip_hashes or ())
+        paths: List[str] = []
+        digests: Dict[str, str] = {}
+        for root, dirs, files in os.walk(folder_path):
+            dirs.sort()
+            for fn in sorted(files):
+                ext = os.path.splitext(fn.lower())[1]
+                if ext not in (".txt", ".md", ".csv", ".pdf"):
+                    continue
+                p = os.path.join(root, fn)
+                try:
+                    digest = file_sha256(p)
+                except Exception:
+                    continue
+                if digest in seen:
+                    stats["skipped_duplicates"] = stats.get("skipped_duplicates", 0) + 1
+                    continue
+                seen.add(digest)
+                digests[p] = digest
+                paths.append(p)
+        stats["files_total"] = len(paths)
+        try:
+            workers = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+        except Exception:
+            workers = 1
+        try:
+            timeout = float(os.getenv("PARSE_TIMEOUT_S", "120"))
+        except Exception:
+            timeout = 120.0
+        try:
+            pages_per_task = int(os.getenv("PARSE_PDF_PAGES_PER_TASK", "8"))
+        except Exception:
+            pages_per_task = 8
+        for p, txt in iter_extracted_texts(paths, workers, timeout, pages_per_task, stats):
+            if txt.strip():
+                yield p, txt, digests[p]
+
+    def _iter_chunks(
+        self,
+        docs: Iterable[Tuple[str, str, str]],
+        chunk_size: int,
+        chunk_overlap: int,
+        stats: Dict[str, Any],
+        doc_log: Dict[str, Dict[str, Any]],
+    ) -> Iterator[Dict[str, Any]]:
+        """Chunk documents lazily; records each document's hash/source/chunk count in doc_log."""
+        for p, txt, digest in docs:
+            stats["documents"] = stats.get("documents", 0) + 1
+            source = p.replace("\\", "/")
+            entry = doc_log.setdefault(digest, {"source": os.path.basename(source), "chunks": 0})
+            for i, ch in enumerate(split_into_chunks(txt, chunk_size, chunk_overlap)):
+                entry["chunks"] += 1
+                yield {"text": ch, "source": source, "chunk_id": i}
+
     def build_index_from_folder(
         self,
         folder_path: str,
@@ -373,159 +653,598 @@ class RAGService:
         chunk_overlap: int = 200,
         name_prefix: str = "upload",
         user_id: str = "default",
+        index_name: Optional[str] = None,
+        append: bool = False,
+        progress: Optional[Dict[str, Any]] = None,
     ) -> Tuple[int, int, str]:
-        """Naive folder ingestion: reads .txt/.md/.csv as text and chunks them.
-        Returns (documents_count, chunks_count, index_name).
+        """Streaming folder ingestion: read -> chunk -> embed -> persist.
+
+        Documents are read and chunked in a background producer feeding a bounded
+        queue; each batch is embedded and appended to chunks.jsonl / emb.npy as it
+        arrives, so peak memory is bounded by the batch size, not the upload size.
+
+        With append=True and an existing index_name, new documents are added to that
+        index in place (emb.npy and chunks.jsonl are extended, meta.json updated) and
+        files whose content hash is already indexed are skipped, so the embedding cost
+        scales with the delta. Without append, index_name (if given) is rebuilt.
+
+        If a progress dict is passed it is updated in place while the build runs
+        (stage, files_total, documents parsed, chunks_embedded, bytes_persisted) and
+        receives the final build stats under "build_stats".
+        Returns (documents_count, chunks_count, index_name) for the documents added.
+
+        Builds of the same (user, index) are serialised: each holds the index's build
+        lock, so concurrent uploads and jobs never write the same files at once.
         """
-        docs: List[Tuple[str, str]] = []  # (path, text)
-        for root, _dirs, files in os.walk(folder_path):
-            for fn in files:
-                ext = os.path.splitext(fn.lower())[1]
-                if ext in (".txt", ".md", ".csv", ".pdf"):
-                    p = os.path.join(root, fn)
-                    try:
-                        txt = read_text_from_file(p)
-                        if txt.strip():
-                            docs.append((p, txt))
-                    except Exception:
-                        # skip unreadable files
-                        continue
+        if index_name is not None and not _INDEX_NAME_RE.match(index_name):
+            raise ValueError(f"Invalid index name: {index_name!r}")
+        if not index_name:
+            index_name, append = self._reserve_index_name(user_id, name_prefix), False
+        with self._index_build_lock(user_id, index_name):
+            return self._build_index_from_folder(folder_path, chunk_size, chunk_overlap, user_id, index_name, append, progress)
 
-        # chunk (build full-text chunks first)
-        doc_count = len(docs)
-        all_chunks: List[Dict[str, Any]] = []
-        for p, txt in docs:
-            for i, ch in enumerate(split_into_chunks(txt, chunk_size, chunk_overlap)):
-                all_chunks.append({
-                    "text": ch,
-                    "source": p.replace("\\", "/"),
-                    "chunk_id": i,
-                })
-        # Keep a deep copy of full chunks (for disk persistence and optional later restoration)
-        original_full_chunks: List[Dict[str, Any]] = [dict(c) for c in all_chunks]
-        # Release original docs list early to free memory
-        docs = []  # type: ignore
+    def _index_build_lock(self, user_id: str, index_name: str) -> "threading.RLock":
+        """Per-(user, index) lock held by builds, deletes and the lazy migration of legacy files."""
+        with self._slots_lock:
+            lock = self._build_locks.get((user_id, index_name))
+            if lock is None:
+                lock = self._build_locks[(user_id, index_name)] = threading.RLock()
+            return lock
+
+    def _reserve_index_name(self, user_id: str, name_prefix: str) -> str:
+        """Fresh index name; uploads finishing within the same second must not share a directory."""
+        slot = self._ensure_user_slot(user_id)
+        with self._slots_lock:
+            index_name = base = f"{name_prefix}-{int(time.time())}"
+            n = 1
+            while (
+                index_name in slot["indices"]
+                or (user_id, index_name) in self._build_locks
+                or (self._user_dir(user_id) / index_name).exists()
+            ):
+                index_name = f"{base}-{n}"
+                n += 1
+            self._build_locks[(user_id, index_name)] = threading.RLock()
+        return index_name
 
-        # Aggressive memory trimming / truncation controls
+    def _build_index_from_folder(
+        self,
+        folder_path: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        user_id: str,
+        index_name: str,
+        append: bool,
+        progress: Optional[Dict[str, Any]],
+    ) -> Tuple[int, int, str]:
+        try:
+            batch_chunks = int(os.getenv("INGEST_BATCH", "256"))
+        except Exception:
+            batch_chunks = 256
+        try:
+            depth = int(os.getenv("INGEST_QUEUE_DEPTH", "4"))
+        except Exception:
+            depth = 4
+        try:
+            bsz = int(os.getenv("EMB_BATCH", os.getenv("EMB_RETRIEVAL_BATCH", "32")))
+        except Exception:
+            bsz = 32
+        # Texts are embedded (and previews kept) from a truncated view of each chunk
         try:
             trunc_chars = int(os.getenv("TRUNCATE_CHUNK_CHARS", "300"))
         except Exception:
             trunc_chars = 300
-        if trunc_chars > 0:
-            for c in all_chunks:
-                txt = c.get("text", "")
-                if len(txt) > trunc_chars:
-                    c["text"] = txt[:trunc_chars]
-
-        # Total text bytes cap (approx) to avoid huge RAM usage
+        # Optional hard caps; disabled by default now that ingestion is streamed
         try:
-            max_total_bytes = int(os.getenv("MAX_TOTAL_TEXT_BYTES", "4000000"))  # ~4MB default
+            max_total_bytes = int(os.getenv("MAX_TOTAL_TEXT_BYTES", "0"))
         except Exception:
-            max_total_bytes = 4000000
-        running = 0
-        if max_total_bytes > 0:
-            trimmed: List[Dict[str, Any]] = []
-            for c in all_chunks:
-                t = c.get("text", "")
-                running += len(t)
-                if running > max_total_bytes:
-                    break
-                trimmed.append(c)
-            if len(trimmed) < len(all_chunks):
-                all_chunks = trimmed
-
-        # Optional: drop full texts after embeddings to keep only previews
+            max_total_bytes = 0
+        try:
+            max_chunks = int(os.getenv("MAX_CHUNKS_PER_INDEX", "0"))
+        except Exception:
+            max_chunks = 0
+        # Optional: drop full texts after embeddings to keep only previews in memory
         drop_full = os.getenv("DROP_FULL_CHUNKS", "1") in ("1", "true", "True")
+        low_mem = os.getenv("LOW_MEMORY_MODE", "1") in ("1", "true", "True")
+        mongo_mode = self.use_mongo_vector
+
+        slot = self._ensure_user_slot(user_id)
+        meta: Dict[str, Any] = {}
+        if append:
+            meta = self._read_index_meta(user_id, index_name)
+        elif index_name in slot["indices"] or (self._user_dir(user_id) / index_name).exists():
+            self.delete_index(user_id, index_name)
+        existing_chunks = int(meta.get("chunks", 0) or 0)
+        # An index keeps one embedding mode/model for all of its rows
+        use_emb = bool(meta.get("has_emb")) if existing_chunks else not low_mem
+        if existing_chunks and use_emb:
+            current = self._current_embedding_model()
+            if meta.get("model") and meta["model"] != current:
+                raise ValueError(
+                    f"Index '{index_name}' was built with '{meta['model']}' but the active embedder is '{current}'; "
+                    "rebuild the index instead of appending"
+                )
+        # Optional quantized copy of the embeddings (fixed per index at creation)
+        quant_meta: Optional[Dict[str, Any]] = meta.get("quant") if existing_chunks else None
+        quant_kind = quant_meta["type"] if quant_meta else os.getenv("EMB_QUANT", "none").lower()
+        if quant_kind not in QUANT_TYPES or (existing_chunks and not quant_meta):
+            quant_kind = None
+        # Optional ANN index (flat|ivf|hnsw), also fixed per index at creation
+        ann_meta: Optional[Dict[str, Any]] = meta.get("ann") if existing_chunks else None
+        ann_kind = ann_meta["type"] if ann_meta else os.getenv("ANN_BACKEND", "none").lower()
+        if ann_kind not in ANN_TYPES or (existing_chunks and not ann_meta) or not ann_available():
+            ann_kind = None
+        if quant_meta:
+            keep_full = bool(quant_meta.get("has_full", True))
+        else:
+            keep_full = os.getenv("EMB_QUANT_KEEP_FULL", "1") in ("1", "true", "True")
+        # without a kept emb.npy, new rows are written to a fresh file and quantized from there
+        emb_append = bool(existing_chunks) and (quant_meta is None or keep_full)
+        doc_log: Dict[str, Dict[str, Any]] = dict(meta.get("documents", {}))
+        known_hashes = set(doc_log)
+
+        stats: Dict[str, Any] = progress if progress is not None else {}
+        stats.update({"stage": "parsing", "documents": 0, "chunks_embedded": 0, "bytes_persisted": 0})
+        cache = self._embedding_cache() if use_emb else None
+        cache_before = cache.stats() if cache is not None else {}
+        mem_chunks: List[Dict[str, Any]] = []
+        total_chars = 0
+        truncated = False
+        inserted = 0
+        mongo_error = False
+        emb_writer: Optional[NpyAppender] = None
+        chunks_file = None
+        idx_dir = self._index_dir(user_id, index_name)
+        emb_file = idx_dir / "emb.npy"
+        store_writer: Optional[ChunkStoreWriter] = None
+        if not mongo_mode:
+            old_entry = slot["indices"].get(index_name)
+            if old_entry is not None and old_entry.get("store") is not None:
+                old_entry.pop("store").close()
+            if old_entry is not None:
+                old_entry.pop("ann", None)
+                old_entry.pop("bm25", None)
+            if existing_chunks and not ChunkStore.exists(idx_dir):
+                ChunkStore.build_from_jsonl(idx_dir).close()
+            chunks_file = (idx_dir / "chunks.jsonl").open("a" if existing_chunks else "w", encoding="utf-8")
+            store_writer = ChunkStoreWriter(idx_dir, append=bool(existing_chunks))
+        # Lexical postings over the full chunk texts (fed to keyword retrieval at query time)
+        bm25_writer: Optional[BM25Writer] = None
+        if os.getenv("BM25_INDEX", "1") in ("1", "true", "True"):
+            if existing_chunks and not BM25Index.exists(idx_dir) and ChunkStore.exists(idx_dir):
+                store = ChunkStore(idx_dir)
+                BM25Index.build_from_texts(idx_dir, (store.get(i) for i in range(len(store))))
+                store.close()
+            if not existing_chunks or BM25Index.exists(idx_dir):
+                bm25_writer = BM25Writer(idx_dir, append=bool(existing_chunks))
+        chunk_stream = self._iter_chunks(
+            self._iter_documents(folder_path, stats, known_hashes), chunk_size, chunk_overlap, stats, doc_log
+        )
+        batches = bounded_prefetch(batched(chunk_stream, batch_chunks), depth)
+        try:
+            for batch in batches:
+                # Apply optional caps before any work is spent on the batch
+                if max_chunks > 0 and existing_chunks + inserted + len(batch) > max_chunks:
+                    batch = batch[: max(0, max_chunks - existing_chunks - inserted)]
+                    truncated = True
+                if max_total_bytes > 0:
+                    kept = 0
+                    for c in batch:
+                        n = min(len(c["text"]), trunc_chars) if trunc_chars > 0 else len(c["text"])
+                        if total_chars + n > max_total_bytes:
+                            truncated = True
+                            break
+                        total_chars += n
+                        kept += 1
+                    batch = batch[:kept]
+                if not batch:
+                    break
+                # global row ids stay unique across documents and appends
+                for i, c in enumerate(batch):
+                    c["row"] = existing_chunks + inserted + i
+                texts = [c["text"][:trunc_chars] if trunc_chars > 0 else c["text"] for c in batch]
+                emb = None
+                stats["stage"] = "embedding"
+                if use_emb:
+                    emb = self._encode_texts(texts, batch_size=bsz).astype(np.float16)
+                stats["chunks_embedded"] += len(batch)
+                stats["stage"] = "persisting"
+                if mongo_mode:
+                    docs_to_insert = []
+                    for i, c in enumerate(batch):
+                        doc = {"user_id": user_id, "index_name": index_name, **c}
+                        if emb is not None:
+                            doc["embedding"] = emb[i].astype(np.float32).tolist()
+                        docs_to_insert.append(doc)
+                    try:
+                        self._col().insert_many(docs_to_insert)
+                    except Exception:
+                        mongo_error = True
+                        break
+                    stats["bytes_persisted"] += sum(len(c["text"].encode("utf-8")) for c in batch)
+                else:
+                    # persist original full text; embeddings appended in place
+                    for c in batch:
+                        line = json.dumps(c, ensure_ascii=False) + "\n"
+                        chunks_file.write(line)
+                        stats["bytes_persisted"] += len(line.encode("utf-8"))
+                    store_writer.add([c["text"] for c in batch])
+                    if emb is not None:
+                        if emb_writer is None:
+                            emb_writer = NpyAppender(emb_file, np.float16, emb.shape[1], append=emb_append)
+                        emb_writer.append(emb)
+                        stats["bytes_persisted"] += emb.nbytes
+                    for c, t in zip(batch, texts):
+                        mem_chunks.append({**c, "text": t[:120] if drop_full else t})
+                if bm25_writer is not None:
+                    bm25_writer.add(batch[0]["row"], [c["text"] for c in batch])
+                inserted += len(batch)
+                if truncated:
+                    break
+        finally:
+            batches.close()  # stops the reader thread if we exit early
+            if chunks_file is not None:
+                chunks_file.close()
+            if store_writer is not None:
+                store_writer.close()
+            if emb_writer is not None:
+                emb_writer.close()
+            if bm25_writer is not None:
+                stats["stage"] = "indexing"
+                bm25_writer.close()
 
-        # Optional cap to keep memory within limits
+        total = existing_chunks + inserted
+        if (ann_kind or quant_kind) and emb_writer is not None and inserted:
+            stats["stage"] = "indexing"
+            full = np.load(emb_file, mmap_mode="r")
+            src = full[existing_chunks:] if emb_append else full
+            if ann_kind:
+                try:
+                    meta["ann"] = build_ann(
+                        src, idx_dir, ann_kind, ann_meta, append=bool(ann_meta),
+                        full=full if emb_append or not existing_chunks else None,
+                    )
+                except Exception:
+                    # exact scan still works; the index just loses its ANN structure
+                    meta.pop("ann", None)
+            if quant_kind:
+                try:
+                    quant_meta = quantize_rows(src, idx_dir, quant_kind, quant_meta, append=bool(quant_meta))
+                    quant_meta["has_full"] = keep_full
+                    meta["quant"] = quant_meta
+                except Exception:
+                    # index stays usable through emb.npy; just without the quantized prefilter
+                    meta.pop("quant", None)
+            del full, src
+            if meta.get("quant") and not keep_full:
+                emb_file.unlink()
+        if mongo_mode:
+            # store minimal meta in memory
+            slot["indices"][index_name] = {"chunks": [], "emb_path": None, "mongo": True}
+            if mongo_error:
+                slot["indices"][index_name]["error"] = "mongo_insert_failed"
+        else:
+            # Store previews in memory; embeddings stay on disk and are memmapped by answer()
+            entry = slot["indices"].get(index_name) if existing_chunks else None
+            if entry is None:
+                # appending to an index that was never loaded: leave it for lazy loading
+                entry = {"chunks": None if existing_chunks else mem_chunks, "emb_path": None}
+                slot["indices"][index_name] = entry
+            elif entry.get("chunks") is not None:
+                entry["chunks"].extend(mem_chunks)
+            entry["emb_path"] = str(emb_file) if use_emb and emb_file.exists() else None
+            entry["meta"] = meta
         try:
-            max_chunks = int(os.getenv("MAX_CHUNKS_PER_INDEX", "3000"))
+            now = int(time.time())
+            meta.update({
+                "model": meta.get("model") or self.embeddings.model_name,
+                "created_ts": meta.get("created_ts", now),
+                "updated_ts": now,
+                "chunks": total,
+                "has_emb": bool(use_emb and total),
+                "documents": doc_log,
+            })
+            if meta["has_emb"] and meta["model"] == "hash-embeddings":
+                meta["hash_embed_version"] = HASH_EMBED_VERSION
+            self._write_index_meta(user_id, index_name, meta)
+            if total:
+                self._set_active(user_id, index_name)
+            elif slot.get("active") == index_name:
+                slot["active"] = None
         except Exception:
-            max_chunks = 3000
-        if len(all_chunks) > max_chunks:
-            all_chunks = all_chunks[:max_chunks]
+            # non-fatal persistence error
+            pass
+        self._bump_generation(user_id, index_name)
+        self.last_build_stats = {
+            "backend": "mongo-vector" if mongo_mode else (
+                f"faiss-{meta['ann']['type']}" if meta.get("ann") else "exact-scan"
+            ),
+            "ann_recall": (meta.get("ann") or {}).get("recall"),
+            "attempted": inserted,
+            "inserted": inserted,
+            "total_chunks": total,
+            "appended": bool(existing_chunks),
+            "empty_index": total == 0,
+            "truncated": truncated,
+            "skipped_duplicates": stats.get("skipped_duplicates", 0),
+            "parse_failed": stats.get("parse_failed", 0),
+            "parse_timeouts": stats.get("parse_timeouts", 0),
+        }
+        if cache is not None:
+            cache_after = cache.stats()
+            self.last_build_stats["emb_cache_hits"] = cache_after["hits"] - cache_before.get("hits", 0)
+            self.last_build_stats["emb_cache_misses"] = cache_after["misses"] - cache_before.get("misses", 0)
+        stats["stage"] = "done"
+        stats["build_stats"] = dict(self.last_build_stats)
+        return (stats["documents"], inserted, index_name)
 
-        # Compute embeddings unless LOW_MEMORY_MODE enabled OR mongo without embeddings
-        emb = None
-        low_mem = os.getenv("LOW_MEMORY_MODE", "1") in ("1", "true", "True")
-        mongo_mode = self.use_mongo_vector
-        if all_chunks and not low_mem:
-            texts = [c["text"] for c in all_chunks]
+    # --- Ask (very naive) ---
+    def _dense_candidates(
+        self,
+        emb: Optional[np.ndarray],
+        qmat: Optional[QuantizedMatrix],
+        qv: np.ndarray,
+        n: int,
+        ann: Optional[AnnIndex] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-n rows by dot-product score, best first: (rows, scores).
+
+        Shared by the sentence-transformers and hash-embedding paths. An ANN
+        index, when the index has one, answers directly (its vectors are stored
+        unquantized, so scores are exact for the rows it returns).
+
+        With a quantized matrix, a compact int8/Hamming scan first picks
+        QUANT_CANDIDATES rows, which are then re-scored exactly against emb.npy.
+        When the full matrix was not kept (EMB_QUANT_KEEP_FULL=0) the re-score uses
+        dequantized rows, so scores and ranking are approximate (see _dense_rescore).
+        """
+        if ann is not None:
             try:
-                bsz = int(os.getenv("EMB_BATCH", os.getenv("EMB_RETRIEVAL_BATCH", "32")))
+                return ann.search(qv, n)
             except Exception:
-                bsz = 32
-            emb = self._encode_texts(texts, batch_size=bsz)
-        # Optionally drop full text (keep only preview) after embeddings to reduce memory footprint
-        if drop_full:
-            for c in all_chunks:
-                t = c.get("text", "")
-                c["text"] = t[:120]  # retain short preview only
-        import gc as _gc
-        _gc.collect()
-        if emb is not None:
-            emb = emb.astype(np.float16)
-        index_name = f"{name_prefix}-{int(time.time())}"
+                pass
+        try:
+            block = int(os.getenv("RETRIEVAL_BLOCK", "2048"))
+        except Exception:
+            block = 2048
+        if qmat is not None:
+            try:
+                pre_n = int(os.getenv("QUANT_CANDIDATES", str(max(200, 4 * n))))
+            except Exception:
+                pre_n = max(200, 4 * n)
+            q32 = np.asarray(qv, dtype=np.float32)
+            rows, _approx = qmat.search(q32, max(n, pre_n), block)
+            # exact against emb.npy; approximate against dequantized rows when it was dropped
+            rescored = score_rows(emb, rows, q32) if emb is not None else qmat.dequantize(rows) @ q32
+            best = np.argsort(-rescored, kind="stable")[:n]
+            return rows[best], rescored[best]
+        # Streamed float32 BLAS scan keeping only a running top-n: O(block + n) memory
+        return top_n_dot(emb, qv, n, block)
+
+    @staticmethod
+    def _dense_rescore(emb: Optional[np.ndarray], qmat: Optional[QuantizedMatrix], ann: Optional[AnnIndex]) -> Optional[Dict[str, Any]]:
+        """Retrieval info for a quantized dense scan: whether its candidates were re-scored exactly."""
+        if qmat is None or ann is not None:
+            return None
+        return {"quant": qmat.kind, "dense_rescore": "exact" if emb is not None else "approximate"}
+
+    def _retrieval_executor(self) -> ThreadPoolExecutor:
+        """Shared pool for concurrent retrieval stages (NumPy/FAISS release the GIL)."""
+        if self._retrieval_pool is None:
+            with self._slots_lock:
+                if self._retrieval_pool is None:
+                    try:
+                        workers = max(2, int(os.getenv("RETRIEVAL_THREADS", "4")))
+                    except Exception:
+                        workers = 4
+                    self._retrieval_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="iomp-retrieve")
+        return self._retrieval_pool
+
+    def _fanout_executor(self) -> ThreadPoolExecutor:
+        """Pool for per-index retrieval in cross-index queries.
+
+        Kept separate from the retrieval pool: a fanned-out hybrid query submits
+        its lexical/dense stages to that pool and must not wait on its own workers.
+        """
+        if self._fanout_pool is None:
+            with self._slots_lock:
+                if self._fanout_pool is None:
+                    try:
+                        workers = max(1, int(os.getenv("FANOUT_THREADS", "4")))
+                    except Exception:
+                        workers = 4
+                    self._fanout_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="iomp-fanout")
+        return self._fanout_pool
+
+    def _resolve_scope(
+        self, user_id: str, scope: Optional[Union[str, List[str]]]
+    ) -> Tuple[Optional[List[str]], Optional[Dict[str, Any]]]:
+        """Index names an /ask request targets: (names, None) or (None, error response).
+
+        None/"active" is the active index, "all" every index of the user, otherwise
+        a name or list of names (order kept, duplicates dropped).
+        """
         slot = self._ensure_user_slot(user_id)
-        slot["active"] = index_name if all_chunks else None
+        if scope is None or scope == "active":
+            active = slot.get("active")
+            return ([active] if active else None), None
+        if scope == "all":
+            names = list(slot["indices"].keys())
+        else:
+            names = list(dict.fromkeys([scope] if isinstance(scope, str) else list(scope)))
+        missing = [n for n in names if n not in slot["indices"]]
+        if missing:
+            return None, {"answer": "", "sources": [], "error": f"Unknown index: {', '.join(missing)}"}
+        if not names:
+            return None, {"answer": "", "sources": [], "error": "No indices in scope. Upload a supported file: .txt .md .csv .pdf"}
+        return names, None
 
-        if mongo_mode:
-            # Bulk insert into Mongo
-            try:
-                col = self._col()
-                docs_to_insert = []
-                emb_list = emb.tolist() if emb is not None else None
-                for i, c in enumerate(original_full_chunks):
-                    doc = {
-                        "user_id": user_id,
-                        "index_name": index_name,
-                        "chunk_id": c.get("chunk_id"),
-                        "source": c.get("source"),
-                        "text": c.get("text"),
-                    }
-                    if emb_list is not None and i < len(emb_list):
-                        doc["embedding"] = emb_list[i]
-                    docs_to_insert.append(doc)
-                if docs_to_insert:
-                    col.insert_many(docs_to_insert)
-                # store minimal meta in memory
-                slot["indices"][index_name] = {"chunks": [], "emb_path": None, "mongo": True}
-            except Exception:
-                # fallback: treat as empty
-                slot["indices"][index_name] = {"chunks": [], "emb_path": None, "mongo": True, "error": "mongo_insert_failed"}
+    def _retrieve_fanout(
+        self, question: str, k: int, user_id: str, names: List[str]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Retrieve top-k from each named index concurrently and merge into one global top-k.
+
+        Each returned chunk is a copy tagged with its "index". Scores are merged
+        raw when every index reports cosine similarity in the same embedding
+        space; otherwise each index's scores are min-max normalised to [0, 1]
+        (rank-based when an index reports none) so no index dominates by scale.
+        """
+        t0 = time.perf_counter()
+
+        def one(name: str) -> Tuple[str, List[Dict[str, Any]], Optional[Tuple[str, List[float]]], Dict[str, Any]]:
+            t = time.perf_counter()
+            ctx, error = self._open_index(user_id, name)
+            if ctx is None:
+                return name, [], None, {"error": (error or {}).get("error"), "ms": 0.0}
+            top, info, scored = self._retrieve(question, k, ctx)
+            stats: Dict[str, Any] = {"hits": len(top), "ms": round((time.perf_counter() - t) * 1000.0, 2)}
+            if scored is not None:
+                stats["score"] = scored[0]
+            if info is not None:
+                stats["retrieval"] = info
+            return name, top, scored, stats
+
+        if len(names) > 1:
+            results = list(self._fanout_executor().map(one, names))
         else:
-            # Store chunks in memory; embeddings go to disk to avoid RAM usage
-            slot["indices"][index_name] = {"chunks": all_chunks, "emb_path": None}
-            # persist to disk for durability (store original full text, not truncated preview)
+            results = [one(n) for n in names]
+        kinds = {scored[0] for _n, top, scored, _st in results if top and scored is not None}
+        raw = all(scored is not None for _n, top, scored, _st in results if top) and len(kinds) == 1 and next(iter(kinds), "").startswith("cosine:")
+        merged: List[Tuple[float, int, int, Dict[str, Any]]] = []
+        for pos, (name, top, scored, _st) in enumerate(results):
+            if not top:
+                continue
+            if scored is not None and len(scored[1]) == len(top):
+                vals = np.asarray(scored[1], dtype=np.float32)
+                if not raw:
+                    span = float(vals.max() - vals.min())
+                    vals = (vals - vals.min()) / span if span > 0 else np.ones_like(vals)
+            else:
+                vals = 1.0 - np.arange(len(top), dtype=np.float32) / len(top)
+            for rank, (ch, v) in enumerate(zip(top, vals.tolist())):
+                merged.append((float(v), pos, rank, {**ch, "index": name}))
+        # ties: earlier index in scope order, then per-index rank
+        merged.sort(key=lambda x: (-x[0], x[1], x[2]))
+        top = [ch for _v, _p, _r, ch in merged[: max(1, k)]]
+        info = {
+            "mode": "fanout",
+            "indices": names,
+            "normalization": "raw-cosine" if raw else "min-max",
+            "per_index": {name: st for name, _top, _sc, st in results},
+            "timings_ms": {"total": round((time.perf_counter() - t0) * 1000.0, 2)},
+        }
+        return top, info
+
+    def _hybrid_retrieve(
+        self,
+        question: str,
+        k: int,
+        user_id: str,
+        active: str,
+        idx: Dict[str, Any],
+        chunks: List[Dict[str, Any]],
+        emb: Optional[np.ndarray],
+        qmat: Optional[QuantizedMatrix],
+        ann: Optional[AnnIndex],
+        query_vec: Optional[np.ndarray] = None,
+        dense_hits: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any], List[float]]:
+        """Lexical (BM25) and dense candidates generated concurrently and merged by rank fusion.
+
+        Returns (top chunks, retrieval info with per-stage candidate counts and timings,
+        fused scores of the top chunks).
+        """
+        def _env_int(name: str, default: int) -> int:
             try:
-                emb_path = self._persist_index(user_id, index_name, original_full_chunks, emb)
-                # save path reference so answer() can memmap lazily
-                slot["indices"][index_name]["emb_path"] = str(emb_path) if emb_path else None
+                return max(1, int(os.getenv(name, str(default))))
             except Exception:
-                # non-fatal persistence error
-                pass
-        self.last_build_stats = {
-            "backend": "faiss-stub",
-            "attempted": len(all_chunks),
-            "inserted": len(all_chunks),
-            "empty_index": len(all_chunks) == 0,
+                return default
+
+        lex_n = _env_int("HYBRID_LEXICAL_CANDIDATES", max(20, k * 5))
+        dense_n = _env_int("HYBRID_DENSE_CANDIDATES", max(20, k * 5))
+        method = os.getenv("HYBRID_FUSION", "rrf").lower()
+        try:
+            dense_w = min(1.0, max(0.0, float(os.getenv("HYBRID_DENSE_WEIGHT", "0.5"))))
+        except Exception:
+            dense_w = 0.5
+        timings: Dict[str, float] = {}
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+        def lexical() -> Tuple[np.ndarray, np.ndarray]:
+            t0 = time.perf_counter()
+            try:
+                bm25 = self._bm25_index(user_id, active, idx)
+                if bm25 is None or len(bm25) != len(chunks):
+                    return empty
+                return bm25.search(question, lex_n)
+            finally:
+                timings["lexical_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+
+        def dense() -> Tuple[np.ndarray, np.ndarray]:
+            t0 = time.perf_counter()
+            try:
+                if dense_hits is not None:
+                    return dense_hits
+                qv = query_vec if query_vec is not None else self._query_vectors([question])[0]
+                return self._dense_candidates(emb, qmat, qv, dense_n, ann)
+            finally:
+                timings["dense_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+
+        t_start = time.perf_counter()
+        pool = self._retrieval_executor()
+        lex_future = pool.submit(lexical)
+        dense_future = pool.submit(dense)
+        try:
+            lex = lex_future.result()
+        except Exception:
+            lex = empty
+        try:
+            den = dense_future.result()
+        except Exception:
+            den = empty
+
+        t0 = time.perf_counter()
+        rows, fused = fuse_rankings([lex, den], [1.0 - dense_w, dense_w], method=method)
+        if os.getenv("MMR_ENABLED", "0") in ("1", "true", "True") and rows.size:
+            try:
+                lam = float(os.getenv("MMR_LAMBDA", "0.5"))
+            except Exception:
+                lam = 0.5
+            cand_vecs = gather_rows(emb, rows) if emb is not None else qmat.dequantize(rows)
+            picks = mmr_select(cand_vecs, fused / max(float(fused[0]), 1e-9), k, lam)
+        else:
+            picks = np.arange(min(k, rows.size))
+        top_rows = rows[picks]
+        timings["fusion_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        timings["retrieval_ms"] = round((time.perf_counter() - t_start) * 1000, 2)
+        info = {
+            "mode": "hybrid",
+            "fusion": method if method == "weighted" else "rrf",
+            "candidates": {
+                "lexical": int(lex[0].size),
+                "dense": int(den[0].size),
+                "overlap": int(np.intersect1d(lex[0], den[0]).size),
+                "fused": int(rows.size),
+            },
+            "timings_ms": timings,
         }
-        return (doc_count, len(all_chunks), index_name)
+        return [chunks[int(r)] for r in top_rows], info, [float(x) for x in fused[picks]]
 
-    # --- Ask (very naive) ---
-    def answer(self, question: str, k: int = 5, user_id: str = "default") -> Dict[str, Any]:
-        """Answer using embedding similarity with memory-safe scanning, MMR, and extractive synthesis.
-        Falls back to keyword matching when embeddings are unavailable.
+    def _open_index(
+        self, user_id: str, index_name: Optional[str] = None
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Resolve one of the user's indices (default: the active one) and its on-disk structures.
+
+        Returns (ctx, None) or (None, error response).
         """
-        low_mem = os.getenv("LOW_MEMORY_MODE", "1") in ("1", "true", "True")
         slot = self._ensure_user_slot(user_id)
-        active = slot.get("active")
+        active = index_name or slot.get("active")
         if not active:
-            return {"answer": "", "sources": [], "error": "No active index (empty or not built). Upload a supported file: .txt .md .csv .pdf"}
+            return None, {"answer": "", "sources": [], "error": "No active index (empty or not built). Upload a supported file: .txt .md .csv .pdf"}
         idx = slot["indices"].get(active)
         if not idx:
-            return {"answer": "", "sources": [], "error": "Index is empty."}
-        chunks = idx["chunks"]
+            return None, {"answer": "", "sources": [], "error": "Index is empty."}
+        chunks = self._index_chunks(user_id, active, idx)
         emb = None
         emb_path = idx.get("emb_path")
         if emb_path:
@@ -533,9 +1252,239 @@ class RAGService:
                 emb = np.load(emb_path, mmap_mode="r")  # memory-map; minimal RAM
             except Exception:
                 emb = None
+        # Optional quantized matrix (EMB_QUANT at build time) used as a scan prefilter
+        qmat: Optional[QuantizedMatrix] = None
+        quant = (idx.get("meta") or {}).get("quant")
+        if quant:
+            try:
+                qmat = QuantizedMatrix(self._user_dir(user_id) / active, quant)
+            except Exception:
+                qmat = None
+        # Optional ANN structure (ANN_BACKEND at build time), loaded once per resident index
+        ann: Optional[AnnIndex] = idx.get("ann")
+        ann_meta = (idx.get("meta") or {}).get("ann")
+        if ann is None and ann_meta and ann_available():
+            try:
+                ann = idx["ann"] = AnnIndex(self._user_dir(user_id) / active, ann_meta)
+            except Exception:
+                ann = None
+        dense_rows = emb.shape[0] if emb is not None else (len(qmat) if qmat is not None else None)
+        if ann is not None and len(ann) != dense_rows:
+            ann = None  # stale or partial structure: exact scan
 
-        # Try embedding flow first
+        ctx = {
+            "user_id": user_id, "active": active, "idx": idx, "chunks": chunks,
+            "emb": emb, "qmat": qmat, "ann": ann, "dense_rows": dense_rows,
+        }
+        return ctx, None
+
+    def _query_vector_cache(self) -> Optional[LRUCache]:
+        """In-process LRU of query vectors (QUERY_CACHE_SIZE entries, 0 disables)."""
+        if self._query_cache is None:
+            try:
+                size = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+            except Exception:
+                size = 1024
+            if size <= 0:
+                return None
+            self._query_cache = LRUCache(max_items=size)
+        return self._query_cache
+
+    def query_cache_stats(self) -> Dict[str, Any]:
+        cache = self._query_vector_cache()
+        if cache is None:
+            return {"enabled": False}
+        return {"enabled": True, "model": self._query_cache_model, **cache.stats()}
+
+    # ---- Answer cache: keyed on the request plus a per-index generation ----
+    def _generations(self, user_id: str) -> Dict[str, int]:
+        slot = self._ensure_user_slot(user_id)
+        gens = slot.get("generations")
+        if gens is None:
+            gens = {}
+            try:
+                with (self._user_dir(user_id) / "generations.json").open("r", encoding="utf-8") as f:
+                    gens = {str(k): int(v) for k, v in json.load(f).items()}
+            except Exception:
+                pass
+            slot["generations"] = gens
+        return gens
+
+    def _bump_generation(self, user_id: str, index_name: str) -> int:
+        """Invalidate cached answers for an index (called on every build and delete).
+
+        The counter outlives the index directory, so a deleted and rebuilt index
+        with the same name never matches answers cached for its predecessor.
+        """
+        with self._slots_lock:
+            gens = self._generations(user_id)
+            gens[index_name] = gens.get(index_name, 0) + 1
+            try:
+                path = self._user_dir(user_id) / "generations.json"
+                tmp = path.with_name(path.name + ".tmp")
+                with tmp.open("w", encoding="utf-8") as f:
+                    json.dump(gens, f)
+                os.replace(tmp, path)
+            except Exception:
+                pass
+            return gens[index_name]
+
+    def _answer_cache_store(self) -> Optional[AnswerCache]:
+        """Process-wide answer cache (ANSWER_CACHE=0 disables; ANSWER_CACHE_PERSIST=1 adds SQLite)."""
+        if os.getenv("ANSWER_CACHE", "1") in ("0", "false", "False"):
+            return None
+        if self._answer_cache is None:
+            with self._slots_lock:
+                if self._answer_cache is None:
+                    try:
+                        max_mb = float(os.getenv("ANSWER_CACHE_MAX_MB", "32"))
+                        disk_mb = float(os.getenv("ANSWER_CACHE_DISK_MAX_MB", "256"))
+                        ttl_s = float(os.getenv("ANSWER_CACHE_TTL_S", "0"))
+                    except Exception:
+                        max_mb, disk_mb, ttl_s = 32.0, 256.0, 0.0
+                    disk_path = None
+                    if os.getenv("ANSWER_CACHE_PERSIST", "0") in ("1", "true", "True"):
+                        disk_path = self._data_dir() / "cache" / "answers.sqlite"
+                    self._answer_cache = AnswerCache(
+                        int(max_mb * 1024 * 1024), disk_path, int(disk_mb * 1024 * 1024), ttl_s
+                    )
+        return self._answer_cache
+
+    def answer_cache_stats(self) -> Dict[str, Any]:
+        cache = self._answer_cache_store()
+        return {"enabled": False} if cache is None else {"enabled": True, **cache.stats()}
+
+    def _answer_cache_key(
+        self, user_id: str, question: str, k: int, scope: Optional[List[str]] = None, variant: Optional[str] = None
+    ) -> Optional[str]:
+        """Cache key for an /ask request against the active index (or the scope's indices), or None when caching is off.
+
+        variant names a pipeline that can answer differently from /ask (e.g. a
+        stream that skips the LLM rerank), so the two never share entries.
+        """
+        if self._answer_cache_store() is None:
+            return None
+        try:
+            names = scope or [self._ensure_user_slot(user_id).get("active")]
+            if not all(names):
+                return None
+            generations = self._generations(user_id)
+            return AnswerCache.key([
+                user_id,
+                names[0] if len(names) == 1 else names,
+                generations.get(names[0], 0) if len(names) == 1 else [generations.get(n, 0) for n in names],
+                " ".join(unicodedata.normalize("NFKC", question).split()),
+                int(k),
+                self.embeddings.model_name,
+                bool(os.getenv("GROQ_API_KEY")),
+                {name: os.getenv(name) for name in _ANSWER_OPTION_ENV},
+            ] + ([variant] if variant else []))
+        except Exception:
+            return None
+
+    def _query_encoder(self) -> Optional[Callable[[List[str]], np.ndarray]]:
+        """Dense query encoder in the index embedding space (provider or local model), or None for hashing.
+
+        Unless QUERY_BATCHING=0, calls go through the shared micro-batcher so
+        concurrent requests are encoded together.
+        """
+        direct = self._direct_query_encoder()
+        if direct is None:
+            return None
+        batcher = self._query_micro_batcher()
+        return batcher.encode if batcher is not None else direct
+
+    def _query_micro_batcher(self) -> Optional[MicroBatcher]:
+        if os.getenv("QUERY_BATCHING", "1") in ("0", "false", "False"):
+            return None
+        if self._query_batcher is None:
+            with self._slots_lock:
+                if self._query_batcher is None:
+                    try:
+                        max_batch = int(os.getenv("QUERY_BATCH_MAX", "32"))
+                        max_wait_ms = float(os.getenv("QUERY_BATCH_WAIT_MS", "2"))
+                    except Exception:
+                        max_batch, max_wait_ms = 32, 2.0
+                    self._query_batcher = MicroBatcher(self._encode_query_batch, max_batch, max_wait_ms)
+        return self._query_batcher
+
+    def _encode_query_batch(self, texts: List[str]) -> np.ndarray:
+        """One encoder call for a micro-batch of queries from concurrent requests."""
+        direct = self._direct_query_encoder()
+        return direct(texts) if direct is not None else self._hash_embed(texts)
+
+    def query_batching_stats(self) -> Dict[str, Any]:
+        batcher = self._query_batcher
+        if batcher is None:
+            return {"enabled": os.getenv("QUERY_BATCHING", "1") not in ("0", "false", "False")}
+        return {"enabled": True, **batcher.stats()}
+
+    def _direct_query_encoder(self) -> Optional[Callable[[List[str]], np.ndarray]]:
+        provider = self._embed_provider
+        if provider is not None:
+            return lambda batch: provider.embed(batch).astype(np.float16)
+        model = self._get_model()
+        if model is None:
+            return None
+        return lambda batch: model.encode(batch, convert_to_numpy=True, normalize_embeddings=True).astype(np.float16)
+
+    def _query_vectors(self, questions: List[str], use_model: bool = True) -> np.ndarray:
+        """Query embeddings: the provider / local model when available (and use_model), else hash embeddings.
+
+        Questions are whitespace/NFKC-normalised and served from the query-vector
+        LRU keyed by (embedding space, question); misses are encoded in one call.
+        The cache is dropped whenever embeddings.model_name changes, including
+        the silent fallback to hash embeddings.
+        """
+        encoder = self._query_encoder() if use_model else None
+        space = self.embeddings.model_name if encoder is not None else f"hash-embeddings:v{HASH_EMBED_VERSION}"
+        texts = [" ".join(unicodedata.normalize("NFKC", q).split()) for q in questions]
+
+        def encode(batch: List[str]) -> np.ndarray:
+            if encoder is not None:
+                return encoder(batch)
+            return self._hash_embed(batch)
+
+        cache = self._query_vector_cache()
+        if cache is None:
+            return encode(texts)
+        if self._query_cache_model != self.embeddings.model_name:
+            cache.clear()
+            self._query_cache_model = self.embeddings.model_name
+        found = [cache.get((space, t)) for t in texts]
+        miss = sorted({t for t, v in zip(texts, found) if v is None})
+        if miss:
+            fresh = dict(zip(miss, encode(miss)))
+            for t, vec in fresh.items():
+                vec = np.array(vec)
+                vec.setflags(write=False)
+                cache.put((space, t), vec)
+            found = [v if v is not None else fresh[t] for t, v in zip(texts, found)]
+        return np.stack(found)
+
+    def _retrieve(
+        self,
+        question: str,
+        k: int,
+        ctx: Dict[str, Any],
+        query_vec: Optional[np.ndarray] = None,
+        dense_hits: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], Optional[Tuple[str, List[float]]]]:
+        """Candidate chunks for one question: (top chunks, retrieval info or None, scored).
+
+        scored is (score kind, scores aligned with top) or None; cosine kinds name
+        their embedding space so callers can tell when scores are comparable.
+        query_vec / dense_hits let batch callers pass a precomputed query embedding
+        and dense top-n instead of encoding and scanning per question.
+        """
+        low_mem = os.getenv("LOW_MEMORY_MODE", "1") in ("1", "true", "True")
+        user_id, active, idx, chunks = ctx["user_id"], ctx["active"], ctx["idx"], ctx["chunks"]
+        emb, qmat, ann, dense_rows = ctx["emb"], ctx["qmat"], ctx["ann"], ctx["dense_rows"]
+        # Try embedding flow first (RETRIEVAL_MODE=hybrid fuses it with BM25)
         mongo_mode = self.use_mongo_vector
+        retrieval_mode = os.getenv("RETRIEVAL_MODE", "auto").lower()
+        retrieval_info: Optional[Dict[str, Any]] = None
+        scored_top: Optional[Tuple[str, List[float]]] = None
         if mongo_mode:
             # Mongo-based retrieval
             try:
@@ -543,12 +1492,14 @@ class RAGService:
                 # Accept both MONGO_VECTOR_INDEX and MONGO_SEARCH_INDEX
                 vector_index = os.getenv("MONGO_VECTOR_INDEX") or os.getenv("MONGO_SEARCH_INDEX") or "embedding_index"
                 k_req = max(1, k)
-                model = self._get_model()
+                model = self._query_encoder()
                 # build query vector (hash fallback if model unavailable)
-                if model is not None and os.getenv("USE_EMBEDDINGS", "1") not in ("0", "false", "False"):
-                    qv = model.encode([question], convert_to_numpy=True, normalize_embeddings=True)[0].astype(np.float32).tolist()
+                if query_vec is not None:
+                    qv = np.asarray(query_vec, dtype=np.float32).tolist()
+                elif model is not None and os.getenv("USE_EMBEDDINGS", "1") not in ("0", "false", "False"):
+                    qv = self._query_vectors([question])[0].astype(np.float32).tolist()
                 else:
-                    qv = self._hash_embed([question])[0].astype(np.float32).tolist()
+                    qv = self._query_vectors([question], use_model=False)[0].astype(np.float32).tolist()
                 try:
                     top_n = int(os.getenv("TOP_N_CANDIDATES", str(max(10, k_req*5))))
                 except Exception:
@@ -562,60 +1513,73 @@ class RAGService:
                         "limit": k_req,
                         "filter": {"user_id": user_id, "index_name": active},
                     }},
-                    {"$project": {"text": 1, "source": 1, "chunk_id": 1, "score": {"$meta": "vectorSearchScore"}}},
+                    {"$project": {"text": 1, "source": 1, "chunk_id": 1, "row": 1, "score": {"$meta": "vectorSearchScore"}}},
                 ]
                 results = list(col.aggregate(pipeline))
                 if not results:
                     # fallback regex/keyword prune
-                    results = list(col.find({"user_id": user_id, "index_name": active}, {"text": 1, "source": 1, "chunk_id": 1}).limit(k_req))
+                    results = list(col.find({"user_id": user_id, "index_name": active}, {"text": 1, "source": 1, "chunk_id": 1, "row": 1}).limit(k_req))
                 # Convert to expected chunk format
                 top = [
-                    {"text": r.get("text", ""), "source": r.get("source"), "chunk_id": r.get("chunk_id", i)}
+                    {"text": r.get("text", ""), "source": r.get("source"), "chunk_id": r.get("chunk_id", i), "row": r.get("row")}
                     for i, r in enumerate(results)
                 ]
+                if all("score" in r for r in results):
+                    scored_top = ("mongo-vector", [float(r["score"]) for r in results])
             except Exception:
                 # Hard fallback to keyword matching over streaming small batches from Mongo
                 try:
                     col = self._col()
-                    cursor = col.find({"user_id": user_id, "index_name": active}, {"text": 1, "source": 1, "chunk_id": 1})
-                    q_terms = {t.lower() for t in question.split() if t.strip()}
-                    scored = []
-                    for r in cursor:
-                        txt = r.get("text", "").lower()
-                        score = sum(1 for t in q_terms if t in txt)
-                        if score > 0:
-                            scored.append((score, r))
-                    scored.sort(key=lambda x: x[0], reverse=True)
-                    take = scored[: max(1, k)]
+                    proj = {"text": 1, "source": 1, "chunk_id": 1, "row": 1}
+                    bm25 = self._bm25_index(user_id, active, idx)
+                    if bm25 is not None:
+                        # postings give the rows; fetch only those documents
+                        rows, bm25_scores = bm25.search(question, max(1, k))
+                        found = {
+                            r.get("row"): r
+                            for r in col.find({"user_id": user_id, "index_name": active, "row": {"$in": rows.tolist()}}, proj)
+                        }
+                        take = [(float(sc), found[r]) for r, sc in zip(rows.tolist(), bm25_scores.tolist()) if r in found]
+                    else:
+                        cursor = col.find({"user_id": user_id, "index_name": active}, proj)
+                        q_terms = {t.lower() for t in question.split() if t.strip()}
+                        scored = []
+                        for r in cursor:
+                            txt = r.get("text", "").lower()
+                            score = sum(1 for t in q_terms if t in txt)
+                            if score > 0:
+                                scored.append((score, r))
+                        scored.sort(key=lambda x: x[0], reverse=True)
+                        take = scored[: max(1, k)]
                     top = [
-                        {"text": r.get("text", ""), "source": r.get("source"), "chunk_id": r.get("chunk_id", i)}
+                        {"text": r.get("text", ""), "source": r.get("source"), "chunk_id": r.get("chunk_id", i), "row": r.get("row")}
                         for i, (_s, r) in enumerate(take)
                     ]
+                    scored_top = ("bm25" if bm25 is not None else "keyword", [float(sc) for sc, _r in take])
                 except Exception:
                     top = []
-        elif emb is not None and len(chunks) == emb.shape[0]:
-            model = self._get_model()
-            if model is not None:
+        elif retrieval_mode == "hybrid" and dense_rows is not None and len(chunks) == dense_rows:
+            top, retrieval_info, fused_scores = self._hybrid_retrieve(
+                question, k, user_id, active, idx, chunks, emb, qmat, ann, query_vec, dense_hits
+            )
+            scored_top = ("fused", fused_scores)
+            rescore = self._dense_rescore(emb, qmat, ann)
+            if rescore:
+                retrieval_info = {**(retrieval_info or {}), **rescore}
+        elif dense_rows is not None and len(chunks) == dense_rows:
+            retrieval_info = self._dense_rescore(emb, qmat, ann)
+            if self._query_encoder() is not None:
                 try:
-                    qv = model.encode([question], convert_to_numpy=True, normalize_embeddings=True)[0].astype(np.float16)
-                    # Streamed dot-product to constrain RAM
-                    try:
-                        block = int(os.getenv("RETRIEVAL_BLOCK", "2048"))
-                    except Exception:
-                        block = 2048
-                    scores_list: List[np.ndarray] = []
-                    n = emb.shape[0]
-                    for i in range(0, n, block):
-                        blk = emb[i:i+block]
-                        scores_list.append(np.dot(blk, qv))
-                    scores = np.concatenate(scores_list) if scores_list else np.empty((0,), dtype=np.float32)
-
+                    qv = query_vec if query_vec is not None else self._query_vectors([question])[0]
                     # Candidate pruning
                     try:
                         top_n = int(os.getenv("TOP_N_CANDIDATES", str(max(10, k*5))))
                     except Exception:
                         top_n = max(10, k*5)
-                    cand_idx = np.argsort(-scores)[: max(k, top_n)]
+                    if dense_hits is not None:
+                        cand_idx, cand_scores = dense_hits
+                    else:
+                        cand_idx, cand_scores = self._dense_candidates(emb, qmat, qv, max(k, top_n), ann)
 
                     # Optional MMR diversification
                     mmr_enabled = os.getenv("MMR_ENABLED", "0") in ("1", "true", "True")
@@ -624,68 +1588,56 @@ class RAGService:
                             lam = float(os.getenv("MMR_LAMBDA", "0.5"))
                         except Exception:
                             lam = 0.5
-                        selected: List[int] = []
-                        cand = cand_idx.tolist()
-                        # Precompute normalized reps for similarity among candidates if needed
-                        # emb already normalized; use dot for cosine
-                        for _ in range(min(k, len(cand))):
-                            best_j = None
-                            best_score = -1e9
-                            for j in cand:
-                                rel = scores[j]
-                                div = 0.0
-                                if selected:
-                                    # max similarity to already selected
-                                    sims = [float(np.dot(emb[j], emb[s])) for s in selected]
-                                    div = max(sims) if sims else 0.0
-                                mmr = lam * float(rel) - (1.0 - lam) * div
-                                if mmr > best_score:
-                                    best_score = mmr
-                                    best_j = j
-                            if best_j is None:
-                                break
-                            selected.append(best_j)
-                            cand.remove(best_j)
-                        top_idx = np.array(selected, dtype=int)
+                        # emb already normalized; use dot for cosine (dequantized rows if emb.npy was dropped)
+                        cand_vecs = gather_rows(emb, cand_idx) if emb is not None else qmat.dequantize(cand_idx)
+                        top_idx = cand_idx[mmr_select(cand_vecs, cand_scores, k, lam)]
                     else:
                         top_idx = cand_idx[:k]
 
                     top = [chunks[int(i)] for i in top_idx]
+                    rel_of = dict(zip(cand_idx.tolist(), cand_scores.tolist()))
+                    scored_top = (f"cosine:{self.embeddings.model_name}", [float(rel_of[int(i)]) for i in top_idx])
                 except Exception:
                     top = chunks[: max(1, k)]
             else:
                 # fallback: use hash embedding for query and do dot-product
-                qv = self._hash_embed([question])[0]
-                try:
-                    block = int(os.getenv("RETRIEVAL_BLOCK", "2048"))
-                except Exception:
-                    block = 2048
-                scores_list: List[np.ndarray] = []
-                n = emb.shape[0]
-                for i in range(0, n, block):
-                    blk = emb[i:i+block]
-                    scores_list.append(np.dot(blk, qv))
-                scores = np.concatenate(scores_list) if scores_list else np.empty((0,), dtype=np.float32)
+                qv = query_vec if query_vec is not None else self._query_vectors([question], use_model=False)[0]
                 try:
                     top_n = int(os.getenv("TOP_N_CANDIDATES", str(max(10, k*5))))
                 except Exception:
                     top_n = max(10, k*5)
-                top_idx = np.argsort(-scores)[: max(k, top_n)][:k]
+                if dense_hits is not None:
+                    top_idx, top_scores = dense_hits
+                else:
+                    top_idx, top_scores = self._dense_candidates(emb, qmat, qv, max(k, top_n), ann)
+                top_idx = top_idx[:k]
                 top = [chunks[int(i)] for i in top_idx]
+                scored_top = ("cosine:hash-embeddings", [float(x) for x in top_scores[:k]])
         else:
             # Low-memory two-stage retrieval: keyword prune then hash rerank
-            q_terms = {t.lower() for t in question.split() if t.strip()}
-            scored: List[Tuple[int, Dict[str, Any]]] = []
-            for ch in chunks:
-                text = ch.get("text", "").lower()
-                score = sum(1 for t in q_terms if t in text)
-                scored.append((score, ch))
-            scored.sort(key=lambda x: x[0], reverse=True)
             try:
                 cand_n = int(os.getenv("KEYWORD_CANDIDATES", "120"))
             except Exception:
                 cand_n = 120
-            cands = [c for _s, c in scored[: max(1, max(cand_n, k))]]
+            try:
+                bm25 = self._bm25_index(user_id, active, idx)
+            except Exception:
+                bm25 = None
+            if bm25 is not None and len(bm25) == len(chunks):
+                # BM25 over the postings of the query terms only
+                rows, cand_scores = bm25.search(question, max(1, max(cand_n, k)))
+                cands = [chunks[int(r)] for r in rows] or chunks[: max(1, max(cand_n, k))]
+                lex_scored = ("bm25", cand_scores.tolist())
+            else:
+                q_terms = {t.lower() for t in question.split() if t.strip()}
+                scored: List[Tuple[int, Dict[str, Any]]] = []
+                for ch in chunks:
+                    text = ch.get("text", "").lower()
+                    score = sum(1 for t in q_terms if t in text)
+                    scored.append((score, ch))
+                scored.sort(key=lambda x: x[0], reverse=True)
+                cands = [c for _s, c in scored[: max(1, max(cand_n, k))]]
+                lex_scored = ("keyword", [float(sc) for sc, _c in scored[: max(1, max(cand_n, k))]])
             if low_mem:
                 texts = [c.get("text", "") for c in cands]
                 C = len(texts)
@@ -693,15 +1645,26 @@ class RAGService:
                     C = min(C, int(os.getenv("RERANK_MAX", "160")))
                     texts = texts[:C]
                     mat = self._hash_embed(texts)
-                    qv = self._hash_embed([question])[0]
+                    qv = self._query_vectors([question], use_model=False)[0]
                     scores = np.dot(mat, qv)
                     order = np.argsort(-scores)[:k]
                     top = [cands[int(i)] for i in order]
+                    scored_top = ("cosine:hash-embeddings", [float(scores[int(i)]) for i in order])
                 else:
                     top = cands[:k]
             else:
                 top = cands[:k]
+                if len(lex_scored[1]) >= len(top):
+                    scored_top = (lex_scored[0], lex_scored[1][: len(top)])
 
+        return top, retrieval_info, scored_top
+
+    def _restore_texts(
+        self, ctx: Dict[str, Any], top: List[Dict[str, Any]], texts_by_row: Optional[Dict[int, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Swap preview texts for the full chunk texts kept on disk (RESTORE_FULL_ON_ANSWER)."""
+        user_id, active, idx = ctx["user_id"], ctx["active"], ctx["idx"]
+        indices = self._ensure_user_slot(user_id)["indices"]
         # Optional restore of full texts for answer synthesis if only previews kept
         restore_full = os.getenv("RESTORE_FULL_ON_ANSWER", "1") in ("1", "true", "True")
         if restore_full:
@@ -709,58 +1672,310 @@ class RAGService:
             drop_full = os.getenv("DROP_FULL_CHUNKS", "1") in ("1", "true", "True")
             if drop_full:
                 try:
-                    # Load full chunk texts from persisted file
-                    index_dir = Path(self._user_dir(user_id)) / active
-                    chunks_path = index_dir / "chunks.jsonl"
-                    if chunks_path.exists():
-                        full_map: Dict[int, str] = {}
-                        with chunks_path.open("r", encoding="utf-8") as f:
-                            for line in f:
-                                try:
-                                    obj = json.loads(line)
-                                    cid = obj.get("chunk_id")
-                                    if isinstance(cid, int):
-                                        full_map[cid] = obj.get("text", "")
-                                except Exception:
-                                    continue
-                        for ch in top:
-                            cid = ch.get("chunk_id")
-                            if isinstance(cid, int) and cid in full_map:
-                                ch["text"] = full_map[cid]
+                    # O(k) lookup of full texts by global row in the memory-mapped chunk store;
+                    # chunks tagged with another "index" (cross-index queries) use that index's store
+                    stores: Dict[str, Optional[ChunkStore]] = {}
+                    restored = []
+                    for ch in top:
+                        name = ch.get("index", active)
+                        if name not in stores:
+                            entry = idx if name == active else indices.get(name)
+                            stores[name] = self._chunk_store(user_id, name, entry) if entry else None
+                        store = stores[name]
+                        row = ch.get("row")
+                        if texts_by_row is not None and "index" not in ch and row in texts_by_row:
+                            ch = {**ch, "text": texts_by_row[row]}
+                        elif store is not None and isinstance(row, int) and 0 <= row < len(store):
+                            ch = {**ch, "text": store.get(row)}
+                        restored.append(ch)
+                    top = restored
                 except Exception:
                     pass
+        return top
 
-        # Optional LLM re-rank to improve relevance ordering
-        try:
-            if os.getenv("USE_LLM_RERANK", "1") in ("1", "true", "True"):
-                top = self._llm_rerank_chunks(question, top, take=min(k * 2, max(3, len(top))))
-        except Exception:
-            pass
+    def _compose_answer(
+        self,
+        question: str,
+        k: int,
+        ctx: Dict[str, Any],
+        top: List[Dict[str, Any]],
+        retrieval_info: Optional[Dict[str, Any]] = None,
+        texts_by_row: Optional[Dict[int, str]] = None,
+    ) -> Dict[str, Any]:
+        """Restore full texts, optionally LLM-rerank, synthesize and format the /ask response.
 
-        # LLM synthesis with citations if Groq API available, else extractive
-        use_llm = os.getenv("USE_LLM_ANSWER", "1") in ("1", "true", "True")
-        if use_llm and os.getenv("GROQ_API_KEY"):
-            answer_text, labeled_sources = self._llm_answer_with_citations(question, top, take=k)
+        texts_by_row carries full texts already restored for a batch of questions.
+        """
+        top = self._restore_texts(ctx, top, texts_by_row)
+        reranker = self._reranker_name()
+        use_llm = os.getenv("USE_LLM_ANSWER", "1") in ("1", "true", "True") and bool(os.getenv("GROQ_API_KEY"))
+        llm_info: Optional[Dict[str, Any]] = None
+        if reranker == "llm" and use_llm and top and os.getenv("LLM_PIPELINE", "sequential").lower() == "speculative":
+            # Speculative: synthesize from the retrieval order while the LLM rerank is in flight;
+            # keep that answer if the rerank picks the same top-k chunks, else synthesize again
+            client = self._llm_client()
+            cancel = threading.Event()
+            rerank_f = client.submit(self._rerank_chunks, question, top, min(k * 2, max(3, len(top))))
+            answer_f = client.submit(self._llm_answer_with_citations, question, top, k, cancel)
+            try:
+                reranked = rerank_f.result()
+            except Exception:
+                reranked = top
+            hit = self._chunk_keys(reranked[:k]) == self._chunk_keys(top[:k])
+            llm_info = {"pipeline": "speculative", "speculation": "hit" if hit else "miss"}
+            if not hit:
+                # a miss pays for the speculative call as far as it got: nothing when it had not
+                # started, the tokens streamed so far when it is aborted, all of it when already done
+                done = answer_f.done()
+                cancel.set()
+                llm_info["discarded_answer"] = "completed" if done else ("not_started" if answer_f.cancel() else "aborted")
+            top = reranked
+            answer_text, labeled_sources = answer_f.result() if hit else self._llm_answer_with_citations(question, top, take=k)
         else:
-            answer_text = self._synthesize_answer(question, top)
-            labeled_sources = None
+            # Optional rerank stage (RERANKER) to improve relevance ordering
+            if reranker != "none":
+                top = self._rerank_chunks(question, top, take=min(k * 2, max(3, len(top))))
 
-        sources = []
-        if labeled_sources is not None:
-            sources = labeled_sources
+            # LLM synthesis with citations if Groq API available, else extractive
+            if use_llm:
+                answer_text, labeled_sources = self._llm_answer_with_citations(question, top, take=k)
+            else:
+                answer_text = self._synthesize_answer(question, top)
+                labeled_sources = None
+
+        sources = labeled_sources if labeled_sources is not None else self._plain_sources(top, k)
+        out: Dict[str, Any] = {"answer": answer_text, "sources": sources}
+        if retrieval_info is not None:
+            out["retrieval"] = retrieval_info
+        if llm_info is not None:
+            out["llm"] = llm_info
+        return out
+
+    @staticmethod
+    def _plain_sources(top: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "source": ch.get("source"),
+                "chunk_id": ch.get("chunk_id"),
+                "row": ch.get("row"),
+                "preview": ch.get("text", "")[:120],
+                **({"index": ch["index"]} if "index" in ch else {}),
+            }
+            for ch in top[:k]
+        ]
+
+    @staticmethod
+    def _chunk_keys(chunks: List[Dict[str, Any]]) -> set:
+        return {(ch.get("index"), ch.get("source"), ch.get("chunk_id"), ch.get("row")) for ch in chunks}
+
+
+    def answer(
+        self, question: str, k: int = 5, user_id: str = "default", scope: Optional[Union[str, List[str]]] = None
+    ) -> Dict[str, Any]:
+        """Answer using embedding similarity with memory-safe scanning, MMR, and extractive synthesis.
+        Falls back to keyword matching when embeddings are unavailable.
+
+        scope selects the indices searched: None/"active" (default), "all", or
+        index name(s); several indices are searched concurrently and merged.
+        """
+        names, error = self._resolve_scope(user_id, scope)
+        if error is not None:
+            return error
+        cache_key = self._answer_cache_key(user_id, question, k, names if scope not in (None, "active") else None)
+        if cache_key is not None:
+            hit = self._answer_cache_store().get(cache_key)
+            if hit is not None:
+                return {**hit, "cached": True}
+        if names and len(names) > 1:
+            # each index is opened inside the fan-out; merged chunks carry their "index"
+            ctx = {"user_id": user_id, "active": None, "idx": None}
+            top, retrieval_info = self._retrieve_fanout(question, k, user_id, names)
+        else:
+            ctx, error = self._open_index(user_id, names[0] if names else None)
+            if ctx is None:
+                return error
+            top, retrieval_info, _scored = self._retrieve(question, k, ctx)
+        out = self._compose_answer(question, k, ctx, top, retrieval_info)
+        if cache_key is not None and not out.get("error"):
+            self._answer_cache_store().put(cache_key, out)
+        return {**out, "cached": False}
+
+    def answer_stream(
+        self, question: str, k: int = 5, user_id: str = "default", scope: Optional[Union[str, List[str]]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """answer() as a sequence of events for streaming: {"event": name, "data": payload}.
+
+        "sources" is sent as soon as retrieval is done, then "token" events carry
+        the answer text as it is produced (LLM deltas, or extractive sentences
+        without GROQ_API_KEY or when the LLM stream fails before its first token),
+        then "done" with the full answer. Failures before retrieval yield one
+        "error" event. Local rerankers run as usual; the LLM rerank is a full round
+        trip before the first byte, so it only runs here with STREAM_LLM_RERANK=1.
+        """
+        t0 = time.perf_counter()
+        names, error = self._resolve_scope(user_id, scope)
+        if error is not None:
+            yield {"event": "error", "data": error}
+            return
+        reranker = self._reranker_name()
+        llm_rerank = os.getenv("STREAM_LLM_RERANK", "0") in ("1", "true", "True")
+        cache_key = self._answer_cache_key(
+            user_id, question, k, names if scope not in (None, "active") else None,
+            variant="stream-no-llm-rerank" if reranker == "llm" and not llm_rerank else None,
+        )
+        if cache_key is not None:
+            hit = self._answer_cache_store().get(cache_key)
+            if hit is not None:
+                yield {"event": "sources", "data": {"sources": hit.get("sources", []), "retrieval": hit.get("retrieval")}}
+                yield {"event": "token", "data": {"text": hit.get("answer", "")}}
+                yield {"event": "done", "data": {"answer": hit.get("answer", ""), "cached": True}}
+                return
+        if names and len(names) > 1:
+            ctx = {"user_id": user_id, "active": None, "idx": None}
+            top, retrieval_info = self._retrieve_fanout(question, k, user_id, names)
+        else:
+            ctx, error = self._open_index(user_id, names[0] if names else None)
+            if ctx is None:
+                yield {"event": "error", "data": error}
+                return
+            top, retrieval_info, _scored = self._retrieve(question, k, ctx)
+        top = self._restore_texts(ctx, top)
+        if reranker != "none" and (reranker != "llm" or llm_rerank):
+            top = self._rerank_chunks(question, top, take=min(k * 2, max(3, len(top))))
+
+        use_llm = os.getenv("USE_LLM_ANSWER", "1") in ("1", "true", "True") and bool(os.getenv("GROQ_API_KEY"))
+        if use_llm:
+            messages, sources, chosen = self._citation_messages(question, top, k)
         else:
-            sources = [
-                {
-                    "source": ch.get("source"),
-                    "chunk_id": ch.get("chunk_id"),
-                    "preview": ch.get("text", "")[:120],
-                }
-                for ch in top[:k]
-            ]
-        return {"answer": answer_text, "sources": sources}
+            sources, chosen = self._plain_sources(top, k), top
+        yield {
+            "event": "sources",
+            "data": {"sources": sources, "retrieval": retrieval_info, "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2)},
+        }
+        parts: List[str] = []
+        truncated = False
+        if use_llm:
+            try:
+                for delta in self._groq_chat_stream(messages, max_tokens=int(os.getenv("ANSWER_MAX_TOKENS", "800"))):
+                    parts.append(delta)
+                    yield {"event": "token", "data": {"text": delta}}
+            except Exception:
+                truncated = bool(parts)  # keep what was streamed; fall back below only if nothing was
+        if not parts:
+            for piece in self._iter_synthesized_answer(question, chosen):
+                parts.append(piece)
+                yield {"event": "token", "data": {"text": piece}}
+        out: Dict[str, Any] = {"answer": "".join(parts), "sources": sources}
+        if retrieval_info is not None:
+            out["retrieval"] = retrieval_info
+        if cache_key is not None and not truncated:
+            self._answer_cache_store().put(cache_key, out)
+        done: Dict[str, Any] = {"answer": out["answer"], "cached": False, "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2)}
+        if truncated:
+            done["truncated"] = True
+        yield {"event": "done", "data": done}
+
+    def answer_many(self, questions: List[str], k: int = 5, user_id: str = "default") -> List[Dict[str, Any]]:
+        """Answer several questions against the user's active index in one pass.
+
+        The index is opened once, all questions are embedded in one encoder call,
+        the dense scan scores every question per block with a single
+        (block x questions) matmul, and full texts are restored once for the union
+        of retrieved rows. Synthesis still runs per question.
+        """
+        questions = list(questions)
+        if not questions:
+            return []
+        # Serve repeated questions from the answer cache; only the rest go through retrieval
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        keys = [self._answer_cache_key(user_id, q, k) for q in questions]
+        cache = self._answer_cache_store()
+        for i, key in enumerate(keys):
+            hit = cache.get(key) if key is not None else None
+            if hit is not None:
+                results[i] = {**hit, "cached": True}
+        todo = [i for i, r in enumerate(results) if r is None]
+        if todo:
+            ctx, error = self._open_index(user_id)
+            if ctx is None:
+                return [r if r is not None else dict(error) for r in results]
+            fresh = self._answer_batch([questions[i] for i in todo], k, ctx)
+            for i, out in zip(todo, fresh):
+                if keys[i] is not None and not out.get("error"):
+                    cache.put(keys[i], out)
+                results[i] = {**out, "cached": False}
+        return cast(List[Dict[str, Any]], results)
+
+    def _answer_batch(self, questions: List[str], k: int, ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Uncached body of answer_many for an already opened index."""
+        user_id = ctx["user_id"]
+        low_mem = os.getenv("LOW_MEMORY_MODE", "1") in ("1", "true", "True")
+        retrieval_mode = os.getenv("RETRIEVAL_MODE", "auto").lower()
+        dense_ok = (
+            not self.use_mongo_vector
+            and ctx["dense_rows"] is not None
+            and len(ctx["chunks"]) == ctx["dense_rows"]
+        )
+        qvecs: Optional[np.ndarray] = None
+        hits: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * len(questions)
+        if dense_ok or (self.use_mongo_vector and not low_mem):
+            try:
+                qvecs = self._query_vectors(questions)
+            except Exception:
+                qvecs = None
+        if dense_ok and qvecs is not None:
+            # same candidate budget as the per-question path uses
+            budget_env, default = (
+                ("HYBRID_DENSE_CANDIDATES", max(20, k*5)) if retrieval_mode == "hybrid"
+                else ("TOP_N_CANDIDATES", max(10, k*5))
+            )
+            try:
+                top_n = max(1, int(os.getenv(budget_env, str(default))))
+            except Exception:
+                top_n = default
+            try:
+                block = int(os.getenv("RETRIEVAL_BLOCK", "2048"))
+            except Exception:
+                block = 2048
+            n = top_n if retrieval_mode == "hybrid" else max(k, top_n)
+            emb, qmat, ann = ctx["emb"], ctx["qmat"], ctx["ann"]
+            try:
+                if ann is not None:
+                    hits = list(ann.search_many(qvecs, n))
+                elif qmat is not None:
+                    hits = [self._dense_candidates(emb, qmat, qv, n) for qv in qvecs]
+                else:
+                    hits = list(top_n_dot_many(emb, qvecs, n, block))
+            except Exception:
+                hits = [None] * len(questions)
+        retrieved = [
+            self._retrieve(q, k, ctx, query_vec=qvecs[i] if qvecs is not None else None, dense_hits=hits[i])
+            for i, q in enumerate(questions)
+        ]
+        # Restore full texts once for the union of retrieved rows
+        texts_by_row: Optional[Dict[int, str]] = None
+        if os.getenv("RESTORE_FULL_ON_ANSWER", "1") in ("1", "true", "True") and not ctx["idx"].get("mongo"):
+            try:
+                store = self._chunk_store(user_id, ctx["active"], ctx["idx"])
+                if store is not None:
+                    rows = sorted({
+                        ch["row"] for top, _info, _scored in retrieved for ch in top
+                        if isinstance(ch.get("row"), int) and 0 <= ch["row"] < len(store)
+                    })
+                    texts_by_row = dict(zip(rows, store.get_many(rows)))
+            except Exception:
+                texts_by_row = None
+        return [
+            self._compose_answer(q, k, ctx, top, info, texts_by_row)
+            for q, (top, info, _scored) in zip(questions, retrieved)
+        ]
 
     # ---- Simple extractive synthesis to improve readability without LLM ----
     def _synthesize_answer(self, question: str, top_chunks: List[Dict[str, Any]]) -> str:
+        return "".join(self._iter_synthesized_answer(question, top_chunks))
+
+    def _iter_synthesized_answer(self, question: str, top_chunks: List[Dict[str, Any]]) -> Iterator[str]:
+        """Extractive answer one sentence at a time; the pieces join to exactly _synthesize_answer's text."""
         try:
             max_chars = int(os.getenv("ANSWER_MAX_CHARS", "1200"))
         except Exception:
@@ -783,42 +1998,156 @@ class RAGService:
         if not sentences:
             # fallback: join first lines of chunks
             raw = "\n\n".join(ch.get("text", "")[:300] for ch in top_chunks)
-            return raw[:max_chars]
+            yield raw[:max_chars]
+            return
         sentences.sort(key=lambda x: x[0], reverse=True)
-        out_lines: List[str] = []
         used: set[str] = set()
+        emitted = 0
+        line_total = 0
         for _score, s in sentences:
             if s in used:
                 continue
             used.add(s)
-            out_lines.append(s if s.endswith('.') else s + '.')
-            if sum(len(x) + 1 for x in out_lines) >= max_chars:
+            line = s if s.endswith('.') else s + '.'
+            piece = ((" \n" if emitted else "") + line)[: max(0, max_chars - emitted)]
+            if piece:
+                yield piece
+                emitted += len(piece)
+            line_total += len(line) + 1
+            if line_total >= max_chars or emitted >= max_chars:
                 break
-        return " \n".join(out_lines)[:max_chars]
 
     # ---- LLM helpers (Groq OpenAI-compatible endpoint) ----
+    def _llm_client(self) -> LLMClient:
+        """Shared pooled chat client; rebuilt when GROQ_CHAT_ENDPOINT or GROQ_API_KEY change."""
+        endpoint = os.getenv("GROQ_CHAT_ENDPOINT", "https://api.groq.com/openai/v1/chat/completions")
+        api_key = os.getenv("GROQ_API_KEY", "")
+        client = self._llm
+        if client is None or client.endpoint != endpoint or client.api_key != api_key:
+            with self._slots_lock:
+                client = self._llm
+                if client is None or client.endpoint != endpoint or client.api_key != api_key:
+                    if client is not None:
+                        client.close()
+                    client = self._llm = LLMClient(endpoint, api_key)
+        return client
+
+    def llm_stats(self) -> Dict[str, Any]:
+        client = self._llm
+        out: Dict[str, Any] = {"enabled": bool(os.getenv("GROQ_API_KEY")), **(client.stats() if client is not None else {})}
+        cache = self._completion_cache_store()
+        out["cache"] = {"enabled": False} if cache is None else {"enabled": True, **cache.stats()}
+        return out
+
+    def _completion_cache_store(self) -> Optional[CompletionCache]:
+        """On-disk cache of temperature-0 completions under DATA_DIR/cache (LLM_CACHE=0 disables)."""
+        if os.getenv("LLM_CACHE", "1") in ("0", "false", "False"):
+            return None
+        if self._completion_cache is None:
+            with self._slots_lock:
+                if self._completion_cache is None:
+                    try:
+                        max_mb = float(os.getenv("LLM_CACHE_MAX_MB", "64"))
+                        ttl_s = float(os.getenv("LLM_CACHE_TTL_S", "604800"))
+                    except Exception:
+                        max_mb, ttl_s = 64.0, 604800.0
+                    try:
+                        self._completion_cache = CompletionCache(
+                            self._data_dir() / "cache" / "completions.sqlite", int(max_mb * 1024 * 1024), ttl_s
+                        )
+                    except Exception:
+                        return None
+        return self._completion_cache
+
+    def _completion_cache_key(
+        self, messages: List[Dict[str, str]], model: str, temperature: float, max_tokens: int
+    ) -> Optional[str]:
+        """Key for a cacheable (temperature 0) call, else None."""
+        if temperature != 0 or self._completion_cache_store() is None:
+            return None
+        return CompletionCache.key(self._llm_client().endpoint, model, temperature, max_tokens, messages)
+
     def _groq_chat(self, messages: List[Dict[str, str]], model: Optional[str] = None, temperature: float = 0.0, max_tokens: int = 800) -> str:
-        import requests
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
+        if not os.getenv("GROQ_API_KEY"):
             return ""
-        endpoint = os.getenv("GROQ_CHAT_ENDPOINT", "https://api.groq.com/openai/v1/chat/completions")
         mdl = model or os.getenv("GROQ_CHAT_MODEL", os.getenv("GROQ_MODEL_ANSWER", "llama-3.1-8b-instant"))
-        payload = {
-            "model": mdl,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-        }
-        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
         try:
-            r = requests.post(endpoint, headers=headers, json=payload, timeout=60)
-            r.raise_for_status()
-            data = r.json()
-            return data.get("choices", [{}])[0].get("message", {}).get("content", "") or ""
+            key = self._completion_cache_key(messages, mdl, temperature, max_tokens)
+            if key is not None:
+                hit = self._completion_cache.get(key)  # type: ignore[union-attr]
+                if hit is not None:
+                    return hit
+            out = self._llm_client().chat(messages, mdl, temperature=temperature, max_tokens=max_tokens)
+            if key is not None and out:
+                self._completion_cache.put(key, out)  # type: ignore[union-attr]
+            return out
         except Exception:
             return ""
 
+    def _groq_chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.0,
+        max_tokens: int = 800,
+        cancel: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
+        """Tokens of a streamed completion; raises on failure or once cancel is set (callers decide the fallback).
+
+        A cached temperature-0 completion comes back as a single token; a fresh one
+        is stored only once the stream has finished.
+        """
+        if not os.getenv("GROQ_API_KEY"):
+            return iter(())
+        mdl = model or os.getenv("GROQ_CHAT_MODEL", os.getenv("GROQ_MODEL_ANSWER", "llama-3.1-8b-instant"))
+        try:
+            key = self._completion_cache_key(messages, mdl, temperature, max_tokens)
+            hit = self._completion_cache.get(key) if key is not None else None  # type: ignore[union-attr]
+        except Exception:
+            key, hit = None, None
+        if hit is not None:
+            return iter((hit,))
+        stream = self._llm_client().chat_stream(messages, mdl, temperature=temperature, max_tokens=max_tokens, cancel=cancel)
+        return stream if key is None else self._cache_stream(stream, key)
+
+    def _cache_stream(self, stream: Iterator[str], key: str) -> Iterator[str]:
+        parts: List[str] = []
+        for delta in stream:
+            parts.append(delta)
+            yield delta
+        if parts:
+            try:
+                self._completion_cache.put(key, "".join(parts))  # type: ignore[union-attr]
+            except Exception:
+                pass
+
+    # ---- Rerank stage (see rerankers.py) ----
+    def _reranker_name(self) -> str:
+        """RERANKER when set; otherwise "llm" or "none" following the older USE_LLM_RERANK switch."""
+        name = os.getenv("RERANKER", "").strip().lower()
+        if name:
+            return name
+        return "llm" if os.getenv("USE_LLM_RERANK", "1") in ("1", "true", "True") else "none"
+
+    def _reranker(self) -> Any:
+        name = self._reranker_name()
+        inst = self._reranker_inst
+        if inst is None or inst[0] != name:
+            with self._slots_lock:
+                inst = self._reranker_inst
+                if inst is None or inst[0] != name:
+                    inst = self._reranker_inst = (
+                        name, make_reranker(name, cache_dir=self._hf_cache_dir(), llm_rerank=self._llm_rerank_chunks)
+                    )
+        return inst[1]
+
+    def _rerank_chunks(self, question: str, chunks: List[Dict[str, Any]], take: int) -> List[Dict[str, Any]]:
+        """Reorder chunks with the configured reranker; any failure keeps the retrieval order."""
+        try:
+            return self._reranker().rerank(question, chunks, take)
+        except Exception:
+            return chunks[:take]
+
     def _llm_rerank_chunks(self, question: str, chunks: List[Dict[str, Any]], take: int) -> List[Dict[str, Any]]:
         # Build a concise list of candidates with labels
         items = []
@@ -867,49 +2196,71 @@ class RAGService:
                 break
         return dedup or chunks[:take]
 
-    def _llm_answer_with_citations(self, question: str, chunks: List[Dict[str, Any]], take: int = 5) -> Tuple[str, List[Dict[str, Any]]]:
-        # Label top K and construct context
+    def _llm_answer_with_citations(
+        self, question: str, chunks: List[Dict[str, Any]], take: int = 5, cancel: Optional[threading.Event] = None
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Cited LLM answer over the top chunks (extractive when the call fails).
+
+        With cancel the completion is streamed so setting it closes the request and
+        frees its LLM slot; a cancelled call returns an empty answer.
+        """
+        messages, sources, chosen = self._citation_messages(question, chunks, take)
+        max_tokens = int(os.getenv("ANSWER_MAX_TOKENS", "800"))
+        if cancel is None:
+            answer = self._groq_chat(messages, temperature=0.0, max_tokens=max_tokens)
+        else:
+            try:
+                answer = "".join(self._groq_chat_stream(messages, temperature=0.0, max_tokens=max_tokens, cancel=cancel))
+            except Exception:
+                answer = ""
+            if cancel.is_set():
+                return "", sources
+        # Fallback to extractive if Groq failed
+        if not answer:
+            answer = self._synthesize_answer(question, chosen)
+        return answer, sources
+
+    def _citation_messages(
+        self, question: str, chunks: List[Dict[str, Any]], take: int = 5
+    ) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Chat messages asking for a cited answer over the top chunks: (messages, labeled sources, chosen chunks).
+
+        The context is assembled by context_packer: neighbouring chunks of one source
+        are merged without their overlap (CONTEXT_MERGE=0 disables) and packed to
+        ANSWER_MAX_CONTEXT_TOKENS; chunk i keeps its label [Ci] either way.
+        """
         chosen = chunks[:take]
-        labeled = []
-        sources: List[Dict[str, Any]] = []
-        # Limit total context size
         try:
-            max_ctx = int(os.getenv("ANSWER_MAX_CONTEXT_CHARS", "9000"))
+            max_ctx_chars = int(os.getenv("ANSWER_MAX_CONTEXT_CHARS", "9000"))
         except Exception:
-            max_ctx = 9000
-        used = 0
-        parts: List[str] = []
-        for i, ch in enumerate(chosen, start=1):
-            label = f"[C{i}]"
-            txt = ch.get("text", "")
-            if not isinstance(txt, str):
-                txt = str(txt)
-            snippet = txt[:1500]
-            block = f"{label} {snippet}"
-            if used + len(block) > max_ctx and parts:
-                break
-            parts.append(block)
-            used += len(block)
+            max_ctx_chars = 9000
+        try:
+            max_tokens = int(os.getenv("ANSWER_MAX_CONTEXT_TOKENS", str(max(1, max_ctx_chars // 4))))
+        except Exception:
+            max_tokens = 2250
+        merge = os.getenv("CONTEXT_MERGE", "1") not in ("0", "false", "False")
+        context, included, _stats = pack_context(chosen, max_tokens, max_chunk_chars=1500, merge=merge)
+        sources: List[Dict[str, Any]] = []
+        for i in included:
+            ch = chosen[i]
             sources.append({
-                "label": label,
+                "label": f"[C{i + 1}]",
                 "source": ch.get("source"),
                 "chunk_id": ch.get("chunk_id"),
-                "preview": snippet[:160],
+                "row": ch.get("row"),
+                "preview": str(ch.get("text", "") or "")[:160],
+                **({"index": ch["index"]} if "index" in ch else {}),
             })
-        context = "\n\n".join(parts)
         sys_msg = (
             "You are a precise, factual assistant. Use ONLY the provided context to answer. "
             "Cite sources inline with their labels like [C1]. If the answer isn't in the context, say you don't know."
         )
         user_msg = f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer with citations:"
-        answer = self._groq_chat([
+        messages = [
             {"role": "system", "content": sys_msg},
             {"role": "user", "content": user_msg},
-        ], temperature=0.0, max_tokens=int(os.getenv("ANSWER_MAX_TOKENS", "800")))
-        # Fallback to extractive if Groq failed
-        if not answer:
-            answer = self._synthesize_answer(question, chosen)
-        return answer, sources
+        ]
+        return messages, sources, chosen
 
 
 # singleton as in original project style
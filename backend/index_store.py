@@ -0,0 +1,234 @@
+"""On-disk storage primitives for IOMP indices.
+
+Small, dependency-light writers used by the streaming build pipeline so that
+embeddings and chunks can be persisted incrementally instead of being held in
+memory until the whole upload is processed, plus the memory-mapped chunk store
+used to restore chunk texts by row at query time.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+_NPY_MAGIC = b"\x93NUMPY"
+# Reserved header size for freshly created files. Large enough for any 2-D shape
+# we will realistically write, so the header can be patched in place on close.
+_NPY_HEADER_LEN = 128
+
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int, ...], total_len: int) -> Optional[bytes]:
+    """Build a v1.0 .npy header padded to exactly total_len bytes (None if it does not fit)."""
+    body = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+        np.lib.format.dtype_to_descr(dtype),
+        tuple(int(x) for x in shape),
+    )
+    pad = total_len - (len(_NPY_MAGIC) + 4) - len(body) - 1
+    if pad < 0 or total_len - (len(_NPY_MAGIC) + 4) > 0xFFFF:
+        return None
+    header = (body + " " * pad + "\n").encode("latin1")
+    return _NPY_MAGIC + b"\x01\x00" + len(header).to_bytes(2, "little") + header
+
+
+def read_npy_layout(path: Union[str, Path]) -> Tuple[Tuple[int, ...], np.dtype, int]:
+    """Return (shape, dtype, data_offset) of an existing .npy file without loading it."""
+    with open(path, "rb") as f:
+        major, _minor = np.lib.format.read_magic(f)
+        if major == 1:
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        if fortran:
+            raise ValueError(f"{path}: fortran-ordered arrays cannot be appended")
+        return tuple(shape), np.dtype(dtype), f.tell()
+
+
+class NpyAppender:
+    """Append rows to a 2-D .npy matrix on disk without holding it in memory.
+
+    Rows are written straight to the file as they arrive; the header is patched
+    with the final shape on close(). Opening an existing file continues after its
+    last row, so the same writer serves fresh builds and incremental appends.
+    The result is a regular .npy file readable with np.load(..., mmap_mode="r").
+    """
+
+    def __init__(self, path: Union[str, Path], dtype: Union[str, np.dtype], dim: int, append: bool = False) -> None:
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.dim = int(dim)
+        self.rows = 0
+        if append and self.path.exists():
+            shape, on_disk, offset = read_npy_layout(self.path)
+            if len(shape) != 2 or shape[1] != self.dim or on_disk != self.dtype:
+                raise ValueError(
+                    f"{self.path}: cannot append {self.dtype}[:, {self.dim}] rows to {on_disk}{list(shape)}"
+                )
+            self.rows = int(shape[0])
+            self._data_offset = offset
+            self._f = open(self.path, "r+b")
+            end = offset + self.rows * self._row_bytes
+            self._f.truncate(end)  # drop any partial row left by an interrupted write
+            self._f.seek(end)
+        else:
+            self._data_offset = _NPY_HEADER_LEN
+            self._f = open(self.path, "wb")
+            self._f.write(_npy_header(self.dtype, (0, self.dim), _NPY_HEADER_LEN) or b"")
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def append(self, block: np.ndarray) -> int:
+        """Write a (n, dim) block; returns the global row index of its first row."""
+        arr = np.ascontiguousarray(block, dtype=self.dtype)
+        if arr.ndim != 2 or arr.shape[1] != self.dim:
+            raise ValueError(f"expected (n, {self.dim}) block, got {arr.shape}")
+        first = self.rows
+        self._f.write(arr.tobytes())
+        self.rows += int(arr.shape[0])
+        return first
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        header = _npy_header(self.dtype, (self.rows, self.dim), self._data_offset)
+        if header is not None:
+            self._f.seek(0)
+            self._f.write(header)
+            self._f.close()
+            return
+        # Existing header too small for the new shape: stream into a larger one.
+        self._f.close()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(self.path, "rb") as src, open(tmp, "wb") as dst:
+            total = _NPY_HEADER_LEN
+            while (hdr := _npy_header(self.dtype, (self.rows, self.dim), total)) is None:
+                total += 64
+            dst.write(hdr)
+            src.seek(self._data_offset)
+            while True:
+                buf = src.read(1 << 20)
+                if not buf:
+                    break
+                dst.write(buf)
+        os.replace(tmp, self.path)
+
+    def __enter__(self) -> "NpyAppender":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+
+CHUNK_BLOB = "chunks.bin"
+CHUNK_OFFSETS = "chunks.off.npy"
+
+
+class ChunkStoreWriter:
+    """Append chunk texts to a contiguous UTF-8 blob plus an (n, 2) [start, end) offsets matrix.
+
+    Row numbers are global and stable: row i of the store is the i-th chunk ever
+    written to the index, matching the line order of chunks.jsonl.
+    """
+
+    def __init__(self, idx_dir: Union[str, Path], append: bool = False) -> None:
+        idx_dir = Path(idx_dir)
+        off_path = idx_dir / CHUNK_OFFSETS
+        append = append and off_path.exists()
+        self._offsets = NpyAppender(off_path, np.int64, 2, append=append)
+        self._pos = 0
+        if append and self._offsets.rows:
+            shape, dtype, data_offset = read_npy_layout(off_path)
+            with open(off_path, "rb") as f:
+                f.seek(data_offset + (shape[0] - 1) * 2 * dtype.itemsize)
+                self._pos = int(np.frombuffer(f.read(2 * dtype.itemsize), dtype=dtype)[1])
+        self._blob = open(idx_dir / CHUNK_BLOB, "r+b" if append and (idx_dir / CHUNK_BLOB).exists() else "wb")
+        self._blob.truncate(self._pos)
+        self._blob.seek(self._pos)
+
+    @property
+    def rows(self) -> int:
+        return self._offsets.rows
+
+    def add(self, texts: List[str]) -> int:
+        """Append texts; returns the row number of the first one."""
+        spans = np.empty((len(texts), 2), dtype=np.int64)
+        for i, t in enumerate(texts):
+            data = t.encode("utf-8", "surrogatepass")
+            self._blob.write(data)
+            spans[i, 0] = self._pos
+            self._pos += len(data)
+            spans[i, 1] = self._pos
+        return self._offsets.append(spans)
+
+    def close(self) -> None:
+        if not self._blob.closed:
+            self._blob.close()
+        self._offsets.close()
+
+    def __enter__(self) -> "ChunkStoreWriter":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+
+class ChunkStore:
+    """Read-only, memory-mapped view of a chunk store: O(1) text lookup by global row."""
+
+    def __init__(self, idx_dir: Union[str, Path]) -> None:
+        idx_dir = Path(idx_dir)
+        shape, _dtype, _off = read_npy_layout(idx_dir / CHUNK_OFFSETS)
+        if shape[0]:
+            self._offsets = np.load(idx_dir / CHUNK_OFFSETS, mmap_mode="r")
+        else:
+            self._offsets = np.zeros((0, 2), dtype=np.int64)
+        blob = idx_dir / CHUNK_BLOB
+        self._blob = np.memmap(blob, dtype=np.uint8, mode="r") if blob.stat().st_size else np.zeros(0, dtype=np.uint8)
+
+    @staticmethod
+    def exists(idx_dir: Union[str, Path]) -> bool:
+        idx_dir = Path(idx_dir)
+        return (idx_dir / CHUNK_OFFSETS).exists() and (idx_dir / CHUNK_BLOB).exists()
+
+    @classmethod
+    def build_from_jsonl(cls, idx_dir: Union[str, Path]) -> "ChunkStore":
+        """One-off conversion for indices persisted before the store existed (line i -> row i).
+
+        Written into a scratch directory and moved into place (offsets last), so a
+        reader never sees a half-written store. Callers serialise conversions per index.
+        """
+        idx_dir = Path(idx_dir)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=".chunkstore-", dir=idx_dir))
+        try:
+            with ChunkStoreWriter(tmp_dir) as w, open(idx_dir / "chunks.jsonl", "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        text = json.loads(line).get("text", "")
+                    except Exception:
+                        text = ""  # keep row alignment with chunks.jsonl
+                    w.add([text if isinstance(text, str) else str(text)])
+            for name in (CHUNK_BLOB, CHUNK_OFFSETS):
+                os.replace(tmp_dir / name, idx_dir / name)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return cls(idx_dir)
+
+    def __len__(self) -> int:
+        return int(self._offsets.shape[0])
+
+    def get(self, row: int) -> str:
+        start, end = (int(x) for x in self._offsets[row])
+        return self._blob[start:end].tobytes().decode("utf-8", "surrogatepass")
+
+    def get_many(self, rows: Sequence[int]) -> List[str]:
+        return [self.get(int(r)) for r in rows]
+
+    def close(self) -> None:
+        # drop mmap references so the files can be deleted (Windows holds open maps)
+        self._offsets = np.zeros((0, 2), dtype=np.int64)
+        self._blob = np.zeros(0, dtype=np.uint8)
@@ -0,0 +1,97 @@
+"""Background job runner for long-running IOMP work (index builds from /upload).
+
+Jobs run on a small, bounded thread pool so large uploads cannot monopolise the
+server's request threads; callers poll for status and progress by job id.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import threading
+import time
+import uuid
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when the job queue is at capacity; the caller should retry later."""
+
+
+class JobManager:
+    def __init__(self, max_workers: int = 1, max_pending: int = 16, keep_finished: int = 200) -> None:
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.keep_finished = max(1, int(keep_finished))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="iomp-job")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pending(self) -> int:
+        return sum(1 for j in self._jobs.values() if j["status"] in ("queued", "running"))
+
+    def submit(self, fn: Callable[[Dict[str, Any]], Any], **info: Any) -> str:
+        """Queue fn(progress) and return its job id.
+
+        fn receives a mutable progress dict it may update while running; its return
+        value becomes the job result.
+        """
+        job_id = uuid.uuid4().hex
+        job: Dict[str, Any] = {
+            "job_id": job_id,
+            "status": "queued",
+            "created_ts": time.time(),
+            "started_ts": None,
+            "finished_ts": None,
+            "progress": {},
+            "result": None,
+            "error": None,
+            **info,
+        }
+        with self._lock:
+            if self._pending() >= self.max_pending:
+                raise JobQueueFull(f"{self.max_pending} jobs already queued or running")
+            self._jobs[job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        return job_id
+
+    def _run(self, job: Dict[str, Any], fn: Callable[[Dict[str, Any]], Any]) -> None:
+        job["status"] = "running"
+        job["started_ts"] = time.time()
+        try:
+            job["result"] = fn(job["progress"])
+            job["status"] = "succeeded"
+        except Exception as e:
+            job["error"] = f"{e.__class__.__name__}: {e}"
+            job["status"] = "failed"
+        finally:
+            job["finished_ts"] = time.time()
+
+    def _prune(self) -> None:
+        finished = [k for k, j in self._jobs.items() if j["status"] in ("succeeded", "failed")]
+        for k in finished[: max(0, len(finished) - self.keep_finished)]:
+            self._jobs.pop(k, None)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return self._snapshot(job) if job is not None else None
+
+    def list(self, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [self._snapshot(j) for j in jobs if user_id is None or j.get("user_id") == user_id]
+
+    @staticmethod
+    def _snapshot(job: Dict[str, Any]) -> Dict[str, Any]:
+        out = dict(job)
+        progress = dict(job["progress"])
+        out["progress"] = progress
+        started = job.get("started_ts")
+        if started:
+            elapsed = max(1e-6, (job.get("finished_ts") or time.time()) - started)
+            out["elapsed_s"] = round(elapsed, 3)
+            out["throughput"] = {
+                "files_per_s": round(progress.get("documents", 0) / elapsed, 3),
+                "chunks_per_s": round(progress.get("chunks_embedded", 0) / elapsed, 3),
+                "bytes_per_s": round(progress.get("bytes_persisted", 0) / elapsed, 1),
+            }
+        return out
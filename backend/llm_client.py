@@ -0,0 +1,228 @@
+"""Pooled client for OpenAI-compatible chat completions (Groq by default).
+
+One LLMClient is shared by all requests of a RAGService:
+
+- a requests.Session with a keep-alive connection pool (LLM_POOL_SIZE), so
+  repeated calls skip TCP/TLS setup;
+- a semaphore bounding in-flight calls (LLM_MAX_CONCURRENCY) across threads;
+- retries with exponential backoff and full jitter on connection errors,
+  timeouts, 429 and 5xx (LLM_MAX_RETRIES, LLM_BACKOFF_S, LLM_BACKOFF_MAX_S),
+  honouring Retry-After;
+- a per-call deadline (LLM_DEADLINE_S) covering queueing, all attempts and
+  backoff; each attempt's timeout is capped by what is left of it;
+- chat_stream() yields tokens of a streamed ("stream": true) completion and
+  can be cancelled with a threading.Event: the wait for a slot or the stream
+  stops at the next token and the connection is closed, freeing the slot;
+- submit() runs a call (or any function making calls) on a small executor so
+  callers can overlap requests.
+
+The endpoint is GROQ_CHAT_ENDPOINT, so tests can point it at a local mock server.
+"""
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_ENDPOINT = "https://api.groq.com/openai/v1/chat/completions"
+_RETRY_STATUS = (408, 409, 425, 429, 500, 502, 503, 504)
+
+T = TypeVar("T")
+
+
+class LLMError(RuntimeError):
+    """A chat call failed after its retries or ran out of its deadline."""
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+class LLMClient:
+    def __init__(self, endpoint: Optional[str] = None, api_key: Optional[str] = None) -> None:
+        self.endpoint = endpoint or os.getenv("GROQ_CHAT_ENDPOINT", DEFAULT_ENDPOINT)
+        self.api_key = api_key if api_key is not None else os.getenv("GROQ_API_KEY", "")
+        self.max_concurrency = max(1, _env_int("LLM_MAX_CONCURRENCY", 8))
+        self.max_retries = max(0, _env_int("LLM_MAX_RETRIES", 2))
+        self.backoff = max(0.0, _env_float("LLM_BACKOFF_S", 0.5))
+        self.backoff_max = max(self.backoff, _env_float("LLM_BACKOFF_MAX_S", 8.0))
+        self.timeout = max(0.1, _env_float("LLM_TIMEOUT_S", 60.0))
+        self.deadline = max(0.1, _env_float("LLM_DEADLINE_S", 90.0))
+        pool = max(1, _env_int("LLM_POOL_SIZE", self.max_concurrency))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"})
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.cancelled = 0
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.0,
+        max_tokens: int = 800,
+        deadline_s: Optional[float] = None,
+    ) -> str:
+        """Content of the first choice; raises LLMError when every attempt failed or the deadline passed."""
+        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        end = self._acquire(deadline_s)
+        try:
+            r = self._request(payload, end)
+            try:
+                data = r.json()
+            except Exception as e:
+                self._failed()
+                raise LLMError(f"invalid JSON response: {e}") from e
+            return data.get("choices", [{}])[0].get("message", {}).get("content", "") or ""
+        finally:
+            self._slots.release()
+
+    def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.0,
+        max_tokens: int = 800,
+        deadline_s: Optional[float] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
+        """Yield content deltas of a streamed completion ("stream": true, server-sent events).
+
+        Retries only happen before the response starts; the deadline also bounds
+        the stream itself. The slot is held until the generator is exhausted or closed,
+        or until cancel is set (LLMError("cancelled") at the next line received).
+        """
+        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, "stream": True}
+        end = self._acquire(deadline_s, cancel)
+        try:
+            with self._request(payload, end, stream=True) as r:
+                r.encoding = r.encoding or "utf-8"
+                for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+                    if cancel is not None and cancel.is_set():
+                        self._cancelled()
+                        raise LLMError("cancelled")
+                    if time.monotonic() > end:
+                        self._failed()
+                        raise LLMError("deadline exceeded while streaming")
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    except Exception:
+                        continue
+                    if delta:
+                        yield delta
+        finally:
+            self._slots.release()
+
+    def _acquire(self, deadline_s: Optional[float], cancel: Optional[threading.Event] = None) -> float:
+        """Count the call and take a concurrency slot; returns the call's absolute deadline."""
+        end = time.monotonic() + (deadline_s if deadline_s is not None else self.deadline)
+        with self._lock:
+            self.calls += 1
+        while True:
+            if cancel is not None and cancel.is_set():
+                self._cancelled()
+                raise LLMError("cancelled")
+            remaining = max(0.0, end - time.monotonic())
+            if self._slots.acquire(timeout=remaining if cancel is None else min(remaining, 0.05)):
+                return end
+            if remaining <= 0.05 or cancel is None:
+                self._failed()
+                raise LLMError("deadline exceeded waiting for a free LLM slot")
+
+    def _request(self, payload: Dict[str, Any], end: float, stream: bool = False) -> requests.Response:
+        """POST with retries and backoff until a non-retryable answer or the deadline; returns a 2xx response."""
+        attempt = 0
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                self._failed()
+                raise LLMError("deadline exceeded")
+            retry_after: Optional[float] = None
+            try:
+                r = self.session.post(self.endpoint, json=payload, timeout=min(self.timeout, remaining), stream=stream)
+                if r.status_code not in _RETRY_STATUS:
+                    r.raise_for_status()
+                    return r
+                r.close()
+                error: Exception = LLMError(f"HTTP {r.status_code}")
+                try:
+                    retry_after = float(r.headers.get("Retry-After", ""))
+                except ValueError:
+                    retry_after = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except Exception as e:  # 4xx other than the retryable ones: not worth retrying
+                self._failed()
+                raise LLMError(str(e)) from e
+            if attempt >= self.max_retries:
+                self._failed()
+                raise LLMError(f"giving up after {attempt + 1} attempts: {error}") from error
+            delay = random.uniform(0.0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.backoff_max))
+            if delay >= end - time.monotonic():
+                self._failed()
+                raise LLMError(f"deadline exceeded before retry: {error}") from error
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def submit(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> "Future[T]":
+        """Run fn(*args, **kwargs) on the client's executor, e.g. submit(client.chat, messages, model)."""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="iomp-llm")
+        return self._pool.submit(fn, *args, **kwargs)
+
+    def _failed(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def _cancelled(self) -> None:
+        with self._lock:
+            self.cancelled += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "max_concurrency": self.max_concurrency,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+        }
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        self.session.close()
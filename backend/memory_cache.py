@@ -0,0 +1,80 @@
+"""Small thread-safe in-process LRU cache with entry and byte bounds."""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import threading
+
+
+class LRUCache:
+    def __init__(self, max_items: int = 1024, max_bytes: int = 0, sizeof: Optional[Callable[[Any], int]] = None) -> None:
+        """max_items / max_bytes <= 0 disable that bound; sizeof(value) is required for max_bytes."""
+        self.max_items = int(max_items)
+        self.max_bytes = int(max_bytes) if sizeof is not None else 0
+        self._sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = int(self._sizeof(value)) if self._sizeof is not None else 0
+        if self.max_bytes > 0 and size > self.max_bytes:
+            return  # never evict everything for one oversized entry
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._sizes.pop(key, 0)
+                del self._data[key]
+            self._data[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while self._data and (
+                (self.max_items > 0 and len(self._data) > self.max_items)
+                or (self.max_bytes > 0 and self._bytes > self.max_bytes)
+            ):
+                old, _v = self._data.popitem(last=False)
+                self._bytes -= self._sizes.pop(old, 0)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            self._bytes -= self._sizes.pop(key, 0)
+            return self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_items": self.max_items,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
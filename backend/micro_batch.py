@@ -0,0 +1,111 @@
+"""Dynamic micro-batching of concurrent encode calls.
+
+Callers hand their texts to MicroBatcher.encode() and block until their rows
+are ready. Whenever the encoder is idle, the caller becomes the leader and
+encodes everything queued so far in one call; requests that arrive while a
+batch is running queue up and go out together in the next one. A lone caller
+therefore never waits. Only after a batch with several requests (i.e. under
+concurrent load) does the leader hold the next batch open for up to
+max_wait_ms, or until max_batch texts are queued.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import threading
+import time
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("texts", "result", "error", "done")
+
+    def __init__(self, texts: List[str]) -> None:
+        self.texts = texts
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+
+
+class MicroBatcher:
+    def __init__(self, fn: Callable[[List[str]], np.ndarray], max_batch: int = 32, max_wait_ms: float = 2.0) -> None:
+        """fn(texts) -> (len(texts), dim) array; max_batch bounds texts per call (a larger single request still goes whole)."""
+        self.fn = fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._cond = threading.Condition()
+        self._pending: List[_Request] = []
+        self._busy = False
+        self._last_requests = 0
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.max_seen = 0
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        req = _Request(list(texts))
+        with self._cond:
+            self._pending.append(req)
+            self._cond.notify_all()
+            while not req.done:
+                if self._busy:
+                    self._cond.wait()
+                    continue
+                self._busy = True
+                batch = self._take_batch()
+                self._cond.release()
+                try:
+                    self._run(batch)
+                finally:
+                    self._cond.acquire()
+                    self._busy = False
+                    self._last_requests = len(batch)
+                    self._cond.notify_all()
+        if req.error is not None:
+            raise req.error
+        return req.result if req.result is not None else np.empty((0, 0), dtype=np.float32)
+
+    def _take_batch(self) -> List[_Request]:
+        """Pop the next batch (FIFO) from the queue; called with the lock held."""
+        if self.max_wait > 0 and self._last_requests > 1:
+            deadline = time.monotonic() + self.max_wait
+            while sum(len(r.texts) for r in self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        batch: List[_Request] = []
+        n = 0
+        while self._pending and (not batch or n + len(self._pending[0].texts) <= self.max_batch):
+            req = self._pending.pop(0)
+            batch.append(req)
+            n += len(req.texts)
+        return batch
+
+    def _run(self, batch: List[_Request]) -> None:
+        texts = [t for r in batch for t in r.texts]
+        try:
+            out = self.fn(texts) if texts else None
+            pos = 0
+            for r in batch:
+                r.result = out[pos:pos + len(r.texts)] if out is not None else None
+                pos += len(r.texts)
+        except BaseException as e:  # every waiter gets the error, not just the leader
+            for r in batch:
+                r.error = e
+        for r in batch:
+            r.done = True
+        self.batches += 1
+        self.requests += len(batch)
+        self.texts += len(texts)
+        self.max_seen = max(self.max_seen, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000.0, 3),
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts,
+            "avg_requests_per_batch": round(self.requests / self.batches, 3) if self.batches else 0.0,
+            "max_requests_per_batch": self.max_seen,
+        }
@@ -0,0 +1,106 @@
+"""Quantized embedding formats for IOMP indices.
+
+Two optional formats, chosen at build time with EMB_QUANT, sit next to emb.npy:
+
+- "int8":   per-dimension symmetric scalar quantization (emb.i8.npy, 2x smaller than
+            float16); the per-dimension scales live in meta.json["quant"]["scale"].
+- "binary": one sign bit per dimension, packed (emb.b1.npy, 16x smaller); scored
+            by Hamming distance.
+
+At query time QuantizedMatrix.search() scans the compact matrix to pick a
+candidate set, which the caller re-scores exactly against emb.npy. When the
+full-precision matrix was not kept (EMB_QUANT_KEEP_FULL=0) the re-score runs on
+dequantized rows and is only approximate; for "binary" those are bare sign
+vectors, so the final ranking can differ noticeably from full precision.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Tuple, Union
+
+import numpy as np
+
+from .index_store import NpyAppender, read_npy_layout
+from .scoring import stream_top_n
+
+QUANT_TYPES = ("int8", "binary")
+QUANT_FILES = {"int8": "emb.i8.npy", "binary": "emb.b1.npy"}
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _int8_scale(src: np.ndarray, block: int) -> np.ndarray:
+    absmax = np.zeros(src.shape[1], dtype=np.float32)
+    for i in range(0, src.shape[0], block):
+        np.maximum(absmax, np.abs(np.asarray(src[i:i + block], dtype=np.float32)).max(axis=0), out=absmax)
+    return np.where(absmax > 0, absmax / 127.0, 1.0).astype(np.float32)
+
+
+def quantize_rows(
+    src: np.ndarray,
+    idx_dir: Union[str, Path],
+    kind: str,
+    quant_meta: Union[Dict[str, Any], None] = None,
+    append: bool = False,
+    block: int = 4096,
+) -> Dict[str, Any]:
+    """Quantize src (an (n, dim) array or memmap) into the index's quantized matrix.
+
+    Works block by block so memory stays O(block). With append=True the rows are
+    added after the existing quantized rows and the stored int8 scales are reused
+    (values outside the original range are clipped). Returns the meta.json["quant"] entry.
+    """
+    if kind not in QUANT_TYPES:
+        raise ValueError(f"unknown quantization type: {kind!r} (expected one of {QUANT_TYPES})")
+    dim = int(src.shape[1])
+    path = Path(idx_dir) / QUANT_FILES[kind]
+    out: Dict[str, Any] = {"type": kind, "file": QUANT_FILES[kind], "dim": dim}
+    if kind == "int8":
+        if append and quant_meta and quant_meta.get("scale"):
+            scale = np.asarray(quant_meta["scale"], dtype=np.float32)
+        else:
+            scale = _int8_scale(src, block)
+        out["scale"] = [float(x) for x in scale]
+        with NpyAppender(path, np.int8, dim, append=append) as w:
+            for i in range(0, src.shape[0], block):
+                blk = np.asarray(src[i:i + block], dtype=np.float32) / scale
+                w.append(np.clip(np.rint(blk), -127, 127).astype(np.int8))
+    else:
+        with NpyAppender(path, np.uint8, (dim + 7) // 8, append=append) as w:
+            for i in range(0, src.shape[0], block):
+                w.append(np.packbits(np.asarray(src[i:i + block]) > 0, axis=1))
+    out["rows"] = int(read_npy_layout(path)[0][0])
+    return out
+
+
+class QuantizedMatrix:
+    """Memory-mapped quantized embeddings with an approximate top-n scan."""
+
+    def __init__(self, idx_dir: Union[str, Path], quant_meta: Dict[str, Any]) -> None:
+        self.kind = quant_meta["type"]
+        self.dim = int(quant_meta["dim"])
+        self.mat = np.load(Path(idx_dir) / quant_meta["file"], mmap_mode="r")
+        self.scale = np.asarray(quant_meta.get("scale") or np.ones(self.dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return int(self.mat.shape[0])
+
+    def _block_scores(self, blk: np.ndarray, qv: np.ndarray) -> np.ndarray:
+        if self.kind == "int8":
+            return blk.astype(np.float32) @ (qv * self.scale)
+        # higher is better: dim - 2 * hamming approximates dim * cosine for sign vectors
+        qbits = np.packbits(qv > 0)
+        ham = _POPCOUNT[np.bitwise_xor(blk, qbits)].sum(axis=1, dtype=np.int32)
+        return (self.dim - 2 * ham).astype(np.float32)
+
+    def search(self, qv: np.ndarray, n: int, block: int = 2048) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-n rows for a query vector; returns (rows, approx_scores), best first."""
+        qv = np.asarray(qv, dtype=np.float32)
+        return stream_top_n(len(self), lambda i, stop: self._block_scores(np.asarray(self.mat[i:stop]), qv), n, block)
+
+    def dequantize(self, rows: np.ndarray) -> np.ndarray:
+        """Approximate float32 vectors for the given rows."""
+        blk = np.asarray(self.mat[np.asarray(rows, dtype=np.int64)])
+        if self.kind == "int8":
+            return blk.astype(np.float32) * self.scale
+        signs = np.unpackbits(blk, axis=1)[:, : self.dim].astype(np.float32) * 2.0 - 1.0
+        return signs / np.sqrt(self.dim)
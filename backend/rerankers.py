@@ -0,0 +1,224 @@
+"""Pluggable rerank stage for retrieved chunks, selected with RERANKER.
+
+- "llm":           ask the chat model for a label order (RAGService._llm_rerank_chunks);
+                   one network round trip per query.
+- "cross-encoder": sentence-transformers CrossEncoder (RERANK_MODEL, default
+                   cross-encoder/ms-marco-MiniLM-L-6-v2).
+- "fastembed":     fastembed TextCrossEncoder on onnxruntime (RERANK_MODEL, default
+                   Xenova/ms-marco-MiniLM-L-6-v2); no torch.
+- "onnx":          any cross-encoder ONNX export in RERANK_MODEL_DIR (tokenizer.json +
+                   model.onnx, or model_quantized.onnx with RERANK_QUANTIZED=1); fully offline.
+- "none":          keep the retrieval order.
+
+The local rerankers score (question, chunk) pairs on CPU in batches of
+RERANK_BATCH_SIZE. Only the first RERANK_MAX_CANDIDATES chunks are scored; the
+rest keep their retrieval order behind them, which bounds the latency.
+Ordering is deterministic (ties keep the retrieval order).
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import os
+import threading
+
+import numpy as np
+
+Chunk = Dict[str, Any]
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+class NoReranker:
+    name = "none"
+
+    def rerank(self, question: str, chunks: List[Chunk], take: int) -> List[Chunk]:
+        return chunks[:take]
+
+
+class LLMReranker:
+    """Delegates to the service's LLM rerank (a callable (question, chunks, take) -> chunks)."""
+
+    name = "llm"
+
+    def __init__(self, fn: Callable[[str, List[Chunk], int], List[Chunk]]) -> None:
+        self.fn = fn
+
+    def rerank(self, question: str, chunks: List[Chunk], take: int) -> List[Chunk]:
+        return self.fn(question, chunks, take)
+
+
+class PairScoringReranker:
+    """Base for local rerankers: subclasses implement score(question, passages) -> one float per passage."""
+
+    name = "pairs"
+
+    def __init__(self) -> None:
+        self.batch_size = max(1, _env_int("RERANK_BATCH_SIZE", 32))
+        self.max_candidates = max(1, _env_int("RERANK_MAX_CANDIDATES", 20))
+        self.max_chars = max(64, _env_int("RERANK_MAX_CHARS", 2000))
+        self.threads = _env_int("RERANK_THREADS", 0)
+        self._lock = threading.Lock()
+
+    def score(self, question: str, passages: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def rerank(self, question: str, chunks: List[Chunk], take: int) -> List[Chunk]:
+        cands = chunks[: self.max_candidates]
+        if len(cands) < 2:
+            return chunks[:take]
+        passages = [str(ch.get("text", "") or "")[: self.max_chars] for ch in cands]
+        scores = np.concatenate([
+            np.asarray(self.score(question, passages[i:i + self.batch_size]), dtype=np.float32).reshape(-1)
+            for i in range(0, len(passages), self.batch_size)
+        ])
+        order = np.argsort(-scores, kind="stable")
+        return ([cands[int(i)] for i in order] + chunks[self.max_candidates:])[:take]
+
+
+class CrossEncoderReranker(PairScoringReranker):
+    name = "cross-encoder"
+
+    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+        super().__init__()
+        self.model_name = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self._model: Any = None
+
+    def score(self, question: str, passages: List[str]) -> np.ndarray:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder  # type: ignore
+
+                    self._model = CrossEncoder(self.model_name, max_length=_env_int("RERANK_MAX_LENGTH", 512))
+        return np.asarray(self._model.predict([(question, p) for p in passages], batch_size=self.batch_size))
+
+
+class FastEmbedReranker(PairScoringReranker):
+    name = "fastembed"
+
+    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+        super().__init__()
+        self.model_name = os.getenv("RERANK_MODEL", "Xenova/ms-marco-MiniLM-L-6-v2")
+        self.model_dir = os.getenv("RERANK_MODEL_DIR") or None
+        self.cache_dir = str(cache_dir) if cache_dir is not None else None
+        self._model: Any = None
+
+    def score(self, question: str, passages: List[str]) -> np.ndarray:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from fastembed.rerank.cross_encoder import TextCrossEncoder  # type: ignore
+
+                    kwargs: Dict[str, Any] = {}
+                    if self.model_dir:
+                        kwargs["specific_model_path"] = self.model_dir
+                    if self.model_dir or os.getenv("HF_HUB_OFFLINE", "0") in ("1", "true", "True"):
+                        kwargs["local_files_only"] = True
+                    self._model = TextCrossEncoder(
+                        self.model_name, cache_dir=self.cache_dir, threads=self.threads or None, **kwargs
+                    )
+        return np.fromiter(self._model.rerank(question, passages, batch_size=self.batch_size), dtype=np.float32)
+
+
+class OnnxReranker(PairScoringReranker):
+    """Cross-encoder ONNX export run directly on onnxruntime; the last logit is the relevance score."""
+
+    name = "onnx"
+    _QUANTIZED_FILES = ("model_quantized.onnx", "model_int8.onnx", "model_qint8_avx512_vnni.onnx")
+
+    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+        super().__init__()
+        model_dir = os.getenv("RERANK_MODEL_DIR")
+        if not model_dir:
+            raise ValueError("RERANKER=onnx needs RERANK_MODEL_DIR (tokenizer.json + *.onnx)")
+        self.model_dir = Path(model_dir)
+        self.quantized = os.getenv("RERANK_QUANTIZED", "0") in ("1", "true", "True")
+        self.max_length = max(16, _env_int("RERANK_MAX_LENGTH", 512))
+        self._session: Any = None
+        self._tokenizer: Any = None
+        self._inputs: List[str] = []
+
+    def _find(self, names: Sequence[str]) -> Optional[Path]:
+        for base in (self.model_dir, self.model_dir / "onnx"):
+            for name in names:
+                if (base / name).is_file():
+                    return base / name
+        return None
+
+    def _load(self) -> Any:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import onnxruntime as ort  # type: ignore
+                    from tokenizers import Tokenizer  # type: ignore
+
+                    tok_path = self._find(("tokenizer.json",))
+                    model_path = (self._find(self._QUANTIZED_FILES) if self.quantized else None) or self._find(("model.onnx",))
+                    if tok_path is None or model_path is None:
+                        raise FileNotFoundError(f"need tokenizer.json and model.onnx in {self.model_dir}")
+                    tokenizer = Tokenizer.from_file(str(tok_path))
+                    tokenizer.enable_truncation(max_length=self.max_length)
+                    tokenizer.enable_padding(pad_id=tokenizer.token_to_id("[PAD]") or 0)
+                    opts = ort.SessionOptions()
+                    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    if self.threads > 0:
+                        opts.intra_op_num_threads = self.threads
+                    opts.inter_op_num_threads = 1
+                    session = ort.InferenceSession(str(model_path), sess_options=opts, providers=["CPUExecutionProvider"])
+                    self._inputs = [i.name for i in session.get_inputs()]
+                    self._tokenizer = tokenizer
+                    self._session = session
+        return self._session
+
+    def score(self, question: str, passages: List[str]) -> np.ndarray:
+        session = self._load()
+        enc = self._tokenizer.encode_batch([(question, p) for p in passages])
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in enc], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in enc], dtype=np.int64),
+            "token_type_ids": np.asarray([e.type_ids for e in enc], dtype=np.int64),
+        }
+        logits = np.asarray(session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0], dtype=np.float32)
+        return logits.reshape(len(passages), -1)[:, -1]
+
+
+_RERANKERS: Dict[str, Callable[[Optional[Path]], Any]] = {}
+
+
+def register_reranker(factory: Callable[[Optional[Path]], Any], *names: str) -> None:
+    """Register a reranker factory (called with the model cache dir) under one or more names."""
+    for name in names:
+        _RERANKERS[name.lower()] = factory
+
+
+def available_rerankers() -> List[str]:
+    return sorted(set(_RERANKERS) | {"llm", "none"})
+
+
+register_reranker(CrossEncoderReranker, "cross-encoder", "cross_encoder", "crossencoder")
+register_reranker(FastEmbedReranker, "fastembed", "fast")
+register_reranker(OnnxReranker, "onnx")
+
+
+def make_reranker(
+    name: str,
+    cache_dir: Optional[Path] = None,
+    llm_rerank: Optional[Callable[[str, List[Chunk], int], List[Chunk]]] = None,
+) -> Any:
+    """Build the reranker registered under name; "llm" needs llm_rerank."""
+    name = name.lower()
+    if name in ("none", "off", "0"):
+        return NoReranker()
+    if name == "llm":
+        if llm_rerank is None:
+            raise ValueError("RERANKER=llm needs the service's LLM rerank function")
+        return LLMReranker(llm_rerank)
+    factory = _RERANKERS.get(name)
+    if factory is None:
+        raise ValueError(f"unknown RERANKER: {name!r} (expected one of {available_rerankers()})")
+    return factory(cache_dir)
@@ -0,0 +1,162 @@
+"""Streaming dense scoring for IOMP retrieval.
+
+Scores a (possibly memory-mapped) embedding matrix against a query vector one
+RETRIEVAL_BLOCK of rows at a time. Each block is converted to float32 so the
+dot product runs as a BLAS matrix-vector product (float16 has no BLAS fast
+path on CPU), and only a running top-n is kept, so memory stays O(block + n)
+regardless of corpus size.
+"""
+from __future__ import annotations
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+
+
+def merge_top_n(
+    rows: np.ndarray, scores: np.ndarray, new_rows: np.ndarray, new_scores: np.ndarray, n: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fold a block of (rows, scores) into a running top-n (unordered)."""
+    all_s = np.concatenate([scores, new_scores])
+    all_r = np.concatenate([rows, new_rows])
+    if all_s.shape[0] > n:
+        keep = np.argpartition(-all_s, n - 1)[:n]
+        all_s, all_r = all_s[keep], all_r[keep]
+    return all_r, all_s
+
+
+def stream_top_n(
+    n_rows: int, score_block: Callable[[int, int], np.ndarray], n: int, block: int = 2048
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-n over rows [0, n_rows) where score_block(start, stop) scores one block.
+
+    Returns (rows, scores) best first; ties keep row order.
+    """
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    if n <= 0:
+        return best_rows, best_scores
+    block = max(1, int(block))
+    for i in range(0, n_rows, block):
+        stop = min(n_rows, i + block)
+        s = np.asarray(score_block(i, stop), dtype=np.float32)
+        best_rows, best_scores = merge_top_n(best_rows, best_scores, np.arange(i, stop, dtype=np.int64), s, n)
+    order = np.lexsort((best_rows, -best_scores))
+    return best_rows[order], best_scores[order]
+
+
+def top_n_dot(mat: np.ndarray, qv: np.ndarray, n: int, block: int = 2048) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-n rows of mat by dot product with qv: (rows, scores) best first."""
+    q32 = np.ascontiguousarray(qv, dtype=np.float32)
+
+    def score(i: int, stop: int) -> np.ndarray:
+        return np.asarray(mat[i:stop], dtype=np.float32) @ q32
+
+    return stream_top_n(int(mat.shape[0]), score, n, block)
+
+
+def top_n_dot_many(
+    mat: np.ndarray, queries: np.ndarray, n: int, block: int = 2048
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Top-n rows of mat for each query row: one (block x queries) matmul per block.
+
+    Returns one (rows, scores) pair per query, best first. Memory is
+    O(block * queries + n * queries).
+    """
+    q32 = np.ascontiguousarray(queries, dtype=np.float32)
+    m = q32.shape[0]
+    best_rows = np.empty((m, 0), dtype=np.int64)
+    best_scores = np.empty((m, 0), dtype=np.float32)
+    if n > 0:
+        block = max(1, int(block))
+        for i in range(0, int(mat.shape[0]), block):
+            s = q32 @ np.asarray(mat[i:i + block], dtype=np.float32).T
+            rows = np.broadcast_to(np.arange(i, i + s.shape[1], dtype=np.int64), s.shape)
+            all_s = np.concatenate([best_scores, s], axis=1)
+            all_r = np.concatenate([best_rows, rows], axis=1)
+            if all_s.shape[1] > n:
+                keep = np.argpartition(-all_s, n - 1, axis=1)[:, :n]
+                all_s = np.take_along_axis(all_s, keep, axis=1)
+                all_r = np.take_along_axis(all_r, keep, axis=1)
+            best_scores, best_rows = all_s, all_r
+    out: List[Tuple[np.ndarray, np.ndarray]] = []
+    for r, s in zip(best_rows, best_scores):
+        order = np.lexsort((r, -s))
+        out.append((r[order], s[order]))
+    return out
+
+
+def gather_rows(mat: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Selected rows as one contiguous float32 matrix, read in file order for memmap locality."""
+    rows = np.asarray(rows, dtype=np.int64)
+    out = np.empty((rows.shape[0], mat.shape[1]), dtype=np.float32)
+    if rows.size:
+        order = np.argsort(rows, kind="stable")
+        out[order] = np.asarray(mat[rows[order]], dtype=np.float32)
+    return out
+
+
+def score_rows(mat: np.ndarray, rows: np.ndarray, qv: np.ndarray) -> np.ndarray:
+    """Exact float32 dot-product scores for selected rows."""
+    return gather_rows(mat, rows) @ np.asarray(qv, dtype=np.float32)
+
+
+def mmr_select(cand_vecs: np.ndarray, rel: np.ndarray, k: int, lam: float = 0.5) -> np.ndarray:
+    """Maximal marginal relevance: positions (into cand_vecs) of k diverse, relevant candidates.
+
+    Greedily picks argmax(lam * rel - (1 - lam) * max_sim_to_selected). The
+    candidate-candidate similarities come from a single matmul and the running
+    max similarity is updated with one vector op per pick, so the cost is
+    O(m^2 * dim) BLAS work plus O(k * m) instead of a Python loop over pairs.
+    """
+    m = int(cand_vecs.shape[0])
+    k = min(int(k), m)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    vecs = np.ascontiguousarray(cand_vecs, dtype=np.float32)
+    sim = vecs @ vecs.T
+    base = lam * np.asarray(rel, dtype=np.float32)
+    max_sim = np.zeros(m, dtype=np.float32)  # diversity term is 0 until something is selected
+    taken = np.zeros(m, dtype=bool)
+    picks = np.empty(k, dtype=np.int64)
+    for t in range(k):
+        mmr = base - (1.0 - lam) * max_sim
+        mmr[taken] = -np.inf
+        j = int(np.argmax(mmr))
+        picks[t] = j
+        taken[j] = True
+        max_sim = sim[j] if t == 0 else np.maximum(max_sim, sim[j])
+    return picks
+
+
+def fuse_rankings(
+    ranked: Sequence[Tuple[np.ndarray, np.ndarray]],
+    weights: Sequence[float],
+    method: str = "rrf",
+    rrf_k: int = 60,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge several (rows, scores) rankings (each best first) into one: (rows, fused_scores), best first.
+
+    "rrf" sums weight / (rrf_k + rank) over the lists a row appears in and ignores
+    raw scores, so BM25 and cosine scales need no calibration. "weighted" sums
+    weight * min-max normalised score per list.
+    """
+    row_parts: List[np.ndarray] = []
+    score_parts: List[np.ndarray] = []
+    for (rows, scores), w in zip(ranked, weights):
+        rows = np.asarray(rows, dtype=np.int64)
+        if not rows.size or w <= 0:
+            continue
+        if method == "weighted":
+            s = np.asarray(scores, dtype=np.float32)
+            span = float(s.max() - s.min())
+            contrib = (s - s.min()) / span if span > 0 else np.ones_like(s)
+        else:
+            contrib = 1.0 / (rrf_k + np.arange(1, rows.shape[0] + 1, dtype=np.float32))
+        row_parts.append(rows)
+        score_parts.append(float(w) * contrib)
+    if not row_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    uniq, inv = np.unique(np.concatenate(row_parts), return_inverse=True)
+    fused = np.bincount(inv.ravel(), weights=np.concatenate(score_parts), minlength=uniq.shape[0]).astype(np.float32)
+    order = np.lexsort((uniq, -fused))
+    return uniq[order], fused[order]
@@ -7,6 +7,7 @@ import { Button } from './ui/Button'
 export default function UploadPanel() {
   const [files, setFiles] = useState<File[]>([])
   const [status, setStatus] = useState('')
+  const [failed, setFailed] = useState(false)
   const [health, setHealth] = useState<string>('')
   const [cfg, setCfg] = useState<string>('')
   const { theme } = useTheme()
@@ -16,10 +17,15 @@ export default function UploadPanel() {
       return
     }
     setStatus('Uploading and building...')
+    setFailed(false)
     try {
-      const res: any = await api.upload(files)
+      const res: any = await api.uploadAndWait(files, (job) => {
+        const p = job.progress || {}
+        setStatus(`Building... ${p.documents ?? 0} docs, ${p.chunks_embedded ?? 0} chunks embedded`)
+      })
       setStatus(`Built: ${res.documents} docs, ${res.chunks} chunks (index ${res.index_name})`)
     } catch (e: any) {
+      setFailed(true)
       setStatus('Error: ' + (e?.detail || e?.error || 'failed'))
     }
   }
@@ -81,7 +87,7 @@ export default function UploadPanel() {
           <Button variant="secondary" onClick={onConfig}>Check Config</Button>
         </div>
       </div>
-      <p className={`text-sm mt-2 ${theme==='light' ? 'text-slate-600' : 'text-white/70'}`}>{status}</p>
+      <p className={`text-sm mt-2 ${failed ? 'text-red-500' : theme==='light' ? 'text-slate-600' : 'text-white/70'}`}>{status}</p>
       {(health || cfg) && (
         <div className="mt-2 space-y-1">
           {health && <p className={`text-xs ${theme==='light' ? 'text-slate-600' : 'text-white/70'}`}>Health: {health}</p>}
@@ -63,6 +63,42 @@ export const api = {
     fd.append('user_id', getUserId())
     files.forEach(f => fd.append('files', f))
     return req(`/upload`, { method: 'POST', body: fd })
+  },
+  job: (jobId: string) => req(`/jobs/${encodeURIComponent(jobId)}`),
+  // Uploads are built as background jobs: poll until the job finishes and return its result.
+  // Gives up when the job is unknown (server restarted), after repeated poll failures, or after maxWaitMs.
+  uploadAndWait: async (
+    files: File[],
+    onProgress?: (job: any) => void,
+    { maxWaitMs = 30 * 60 * 1000, maxPollErrors = 5 }: { maxWaitMs?: number; maxPollErrors?: number } = {},
+  ) => {
+    const res: any = await api.upload(files)
+    if (res?.status !== 'queued') return res
+    const deadline = Date.now() + maxWaitMs
+    let errors = 0
+    for (;;) {
+      if (Date.now() > deadline) {
+        throw { detail: `Build job ${res.job_id} did not finish within ${Math.round(maxWaitMs / 60000)} min; check GET /jobs/${res.job_id} later` }
+      }
+      await new Promise(r => setTimeout(r, 1000))
+      let resp: Response
+      try {
+        resp = await fetch(`${API_BASE}/jobs/${encodeURIComponent(res.job_id)}`)
+      } catch {
+        if (++errors >= maxPollErrors) throw { detail: 'Lost contact with the server while building' }
+        continue
+      }
+      if (resp.status === 404) throw { detail: 'Build job was lost (the server may have restarted); upload again' }
+      const job: any = await resp.json().catch(() => null)
+      if (!resp.ok || !job) {
+        if (++errors >= maxPollErrors) throw { detail: job?.detail || `Polling the build job failed (HTTP ${resp.status})` }
+        continue
+      }
+      errors = 0
+      if (job.status === 'succeeded') return job.result
+      if (job.status === 'failed') throw { detail: job.error }
+      onProgress?.(job)
+    }
   }
 }
 
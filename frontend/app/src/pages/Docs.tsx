@@ -200,7 +200,8 @@ export default function Docs() {
             <p>Base: <code>VITE_API_BASE</code> (dev fallback: <code>http://localhost:8000</code>)</p>
             <ul className="list-disc pl-5 mt-2">
                 <li><code>GET /health</code>, <code>GET /config</code>, <code>GET /status</code></li>
-                <li><code>POST /upload</code> — form‑data: <code>files[]</code>, <code>user_id</code></li>
+                <li><code>POST /upload</code> — form‑data: <code>files[]</code>, <code>user_id</code>; returns a <code>job_id</code></li>
+                <li><code>GET /jobs/{'{job_id}'}</code> — build status, progress and result</li>
                 <li><code>POST /ask</code> — JSON: <code>{`{ question, k, user_id }`}</code></li>
             </ul>
             <h3 className="text-lg font-semibold mt-4">Curl examples</h3>